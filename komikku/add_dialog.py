@@ -14,11 +14,12 @@ from gi.repository.GdkPixbuf import PixbufAnimation
 from gi.repository import Pango
 
 from komikku.activity_indicator import ActivityIndicator
-from komikku.models import create_db_connection
+from komikku.models import get_db_connection
 from komikku.models import Manga
 from komikku.models import Settings
 from komikku.servers import get_buffer_mime_type
 from komikku.servers import get_server_main_id_by_id
+from komikku.servers import get_server_class
 from komikku.servers import get_servers_list
 from komikku.servers import LANGUAGES
 from komikku.utils import html_escape
@@ -324,7 +325,7 @@ class AddDialog:
         self.dialog.close()
 
     def on_server_clicked(self, listbox, row):
-        self.server = getattr(row.server_data['module'], row.server_data['class_name'])()
+        self.server = get_server_class(row.server_data)()
         self.show_page('search')
 
     def open(self, action, param):
@@ -539,12 +540,10 @@ class AddDialog:
             self.custom_title_manga_page_label.set_text(self.manga_data['name'])
 
             # Check if selected manga is already in library
-            db_conn = create_db_connection()
-            row = db_conn.execute(
+            row = get_db_connection().execute(
                 'SELECT * FROM mangas WHERE slug = ? AND server_id = ?',
                 (self.manga_data['slug'], self.manga_data['server_id'])
             ).fetchone()
-            db_conn.close()
 
             if row:
                 self.manga = Manga.get(row['id'], self.server)
@@ -16,6 +16,7 @@ gi.require_version('Notify', '0.7')
 from gi.repository import Gdk
 from gi.repository import Gio
 from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Handy
 from gi.repository import Notify
@@ -27,6 +28,7 @@ from komikku.activity_indicator import ActivityIndicator
 from komikku.downloader import Downloader
 from komikku.library import Library
 from komikku.models import backup_db
+from komikku.models import close_db_connections
 from komikku.models import Settings
 from komikku.preferences_window import PreferencesWindow
 from komikku.reader import Reader
@@ -100,6 +102,11 @@ class Application(Gtk.Application):
 @Gtk.Template.from_resource('/info/febvre/Komikku/ui/application_window.ui')
 class ApplicationWindow(Handy.ApplicationWindow):
     __gtype_name__ = 'ApplicationWindow'
+    __gsignals__ = {
+        # Emitted once after chapters read status has been changed in bulk:
+        # mangas IDs, chapters IDs (None if all chapters of mangas have changed) and read status
+        'chapters-read-status-changed': (GObject.SIGNAL_RUN_FIRST, None, (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT, bool, )),
+    }
 
     hidpi_scale = 1
     mobile_width = False
@@ -364,7 +371,9 @@ class ApplicationWindow(Handy.ApplicationWindow):
     def on_application_quit(self, window, event):
         def before_quit():
             self.save_window_size()
+            self.reader.progress_journal.flush()
             backup_db()
+            close_db_connections()
 
         if self.downloader.running or self.updater.running:
             def confirm_callback():
@@ -432,6 +441,9 @@ class ApplicationWindow(Handy.ApplicationWindow):
         elif self.page == 'reader':
             self.set_unfullscreen()
 
+            # Write pending reading progress
+            self.reader.progress_journal.flush()
+
             # Refresh to update all previously chapters consulted (last page read may have changed)
             # and update info like disk usage
             self.card.refresh(self.reader.chapters_consulted)
@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
-from copy import deepcopy
 from gettext import gettext as _
 from gettext import ngettext as n_
 import time
@@ -14,9 +13,9 @@ from gi.repository import Gtk
 from gi.repository.GdkPixbuf import Pixbuf
 from gi.repository.GdkPixbuf import PixbufAnimation
 
-from komikku.models import create_db_connection
+from komikku.models import Chapter
 from komikku.models import Download
-from komikku.models import update_rows
+from komikku.models import get_db_connection
 from komikku.servers import get_file_mime_type
 from komikku.utils import folder_size
 from komikku.utils import html_escape
@@ -118,9 +117,7 @@ class Card:
             self.window.updater.start()
 
             # Finally, update and show library
-            db_conn = create_db_connection()
-            nb_mangas = db_conn.execute('SELECT count(*) FROM mangas').fetchone()[0]
-            db_conn.close()
+            nb_mangas = get_db_connection().execute('SELECT count(*) FROM mangas').fetchone()[0]
 
             if nb_mangas == 0:
                 # Library is now empty
@@ -246,6 +243,7 @@ class ChaptersList:
 
         self.window.connect('key-press-event', self.on_key_press)
         self.window.downloader.connect('download-changed', self.update_chapter_row)
+        self.window.connect('chapters-read-status-changed', self.on_chapters_read_status_changed)
 
         def _filter(child):
             """
@@ -440,6 +438,30 @@ class ChaptersList:
             self.search_mode = False
             self.window.reader.init(self.card.manga, row.chapter)
 
+    def on_chapters_read_status_changed(self, _window, mangas_ids, chapters_ids, read):
+        if self.card.manga is None or self.card.manga.id not in mangas_ids:
+            return
+
+        def update_chapters_rows():
+            # Values stored by bulk update, retrieved at once
+            last_pages_read_indexes = Chapter.get_last_pages_read_indexes(self.card.manga.id)
+
+            for row in self.listbox.get_children():
+                chapter = row.chapter
+                if chapters_ids is not None and chapter.id not in chapters_ids:
+                    continue
+
+                chapter.set_read_status(read, last_pages_read_indexes.get(chapter.id))
+
+                self.populate_chapter_row(row)
+                yield True
+
+        def run_generator(func):
+            gen = func()
+            GLib.idle_add(lambda: next(gen, False), priority=GLib.PRIORITY_DEFAULT_IDLE)
+
+        run_generator(update_chapters_rows)
+
     def on_gesture_long_press_activated(self, gesture, x, y):
         if self.card.selection_mode:
             # Enter in 'Range' selection mode
@@ -681,7 +703,7 @@ class ChaptersList:
                 label = Gtk.Label(xalign=0.5, yalign=1)
                 label.set_valign(Gtk.Align.CENTER)
                 label.get_style_context().add_class('card-chapter-sublabel')
-                if chapter.pages is not None and chapter.last_page_read_index is not None:
+                if chapter.last_page_read_index is not None and chapter.pages is not None:
                     label.set_text(f'{chapter.last_page_read_index + 1}/{len(chapter.pages)}')
                 hbox.pack_start(label, False, True, 0)
 
@@ -773,81 +795,31 @@ class ChaptersList:
         popover.popup()
 
     def toggle_selected_chapters_read_status(self, action, param, read):
-        chapters_ids = []
-        chapters_data = []
+        chapters_ids = [row.chapter.id for row in self.listbox.get_selected_rows()]
 
         self.window.activity_indicator.start()
 
-        # First, update DB
-        for row in self.listbox.get_selected_rows():
-            chapter = row.chapter
-
-            if chapter.pages:
-                pages = deepcopy(chapter.pages)
-                for page in pages:
-                    page['read'] = read
-            else:
-                pages = None
-
-            chapters_ids.append(chapter.id)
-            chapters_data.append(dict(
-                last_page_read_index=None,
-                pages=pages,
-                read=read,
-                recent=False,
-            ))
-
-        db_conn = create_db_connection()
-
-        with db_conn:
-            res = update_rows(db_conn, 'chapters', chapters_ids, chapters_data)
+        if read:
+            res = Chapter.mark_read(chapters_ids)
+        else:
+            res = Chapter.mark_unread(chapters_ids)
 
-        db_conn.close()
+        self.window.activity_indicator.stop()
+        self.card.leave_selection_mode()
 
         if res:
-            # Then, if DB update succeeded, update chapters rows
-            def update_chapters_rows():
-                for row in self.listbox.get_selected_rows():
-                    chapter = row.chapter
-
-                    if chapter.pages:
-                        for chapter_page in chapter.pages:
-                            chapter_page['read'] = read
-
-                    chapter.last_page_read_index = None
-                    chapter.read = read
-                    chapter.recent = False
-
-                    self.populate_chapter_row(row)
-                    yield True
-
-                self.card.leave_selection_mode()
-                self.window.activity_indicator.stop()
-
-            def run_generator(func):
-                gen = func()
-                GLib.idle_add(lambda: next(gen, False), priority=GLib.PRIORITY_DEFAULT_IDLE)
-
-            run_generator(update_chapters_rows)
-        else:
-            self.window.activity_indicator.stop()
-            self.card.leave_selection_mode()
+            self.window.emit('chapters-read-status-changed', [self.card.manga.id], set(chapters_ids), bool(read))
 
     def toggle_chapter_read_status(self, action, param, read):
         chapter = self.action_row.chapter
 
-        if chapter.pages:
-            for chapter_page in chapter.pages:
-                chapter_page['read'] = read
-
         data = dict(
             last_page_read_index=None,
-            pages=chapter.pages,
             read=read,
             recent=False,
         )
 
-        if chapter.update(data):
+        if chapter.update(data) and chapter.update_pages(dict(read=read)):
             self.populate_chapter_row(self.action_row)
 
     def update_chapter_row(self, downloader=None, download=None, chapter=None):
@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 from gettext import gettext as _
 from gettext import ngettext as n_
@@ -16,14 +18,13 @@ from gi.repository import Gtk
 from gi.repository import Notify
 
 from komikku.models import Chapter
-from komikku.models import create_db_connection
+from komikku.models import db_writer
 from komikku.models import Download
+from komikku.models import get_db_connection
 from komikku.models import insert_rows
 from komikku.models import Settings
 from komikku.utils import log_error_traceback
 
-DOWNLOAD_DELAY = 1  # in seconds
-
 
 class Downloader(GObject.GObject):
     """ Chapters downloader """
@@ -66,10 +67,8 @@ class Downloader(GObject.GObject):
         if not chapters_ids:
             return
 
-        db_conn = create_db_connection()
-        with db_conn:
+        with db_writer() as db_conn:
             insert_rows(db_conn, 'downloads', rows_data)
-        db_conn.close()
 
         if emit_signal:
             for chapter_id in chapters_ids:
@@ -101,87 +100,125 @@ class Downloader(GObject.GObject):
 
     def start(self):
         def run(exclude_errors=False):
-            db_conn = create_db_connection()
+            db_conn = get_db_connection()
+            sql = """SELECT d.id, m.server_id FROM downloads d
+                JOIN chapters c ON c.id = d.chapter_id JOIN mangas m ON m.id = c.manga_id"""
             if exclude_errors:
-                rows = db_conn.execute('SELECT * FROM downloads WHERE status != "error" ORDER BY date ASC').fetchall()
+                rows = db_conn.execute(sql + ' WHERE d.status != "error" ORDER BY d.date ASC').fetchall()
             else:
-                rows = db_conn.execute('SELECT * FROM downloads ORDER BY date ASC').fetchall()
-            db_conn.close()
+                rows = db_conn.execute(sql + ' ORDER BY d.date ASC').fetchall()
 
-            interrupted = False
+            # Group downloads by server: servers are processed in parallel, each one according to its own limits
+            downloads_ids = {}
             for row in rows:
+                downloads_ids.setdefault(row['server_id'], []).append(row['id'])
+
+            threads = []
+            for server_downloads_ids in downloads_ids.values():
+                thread = threading.Thread(target=run_server, args=(server_downloads_ids, ))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+            for thread in threads:
+                thread.join()
+
+            if not rows or self.stop_flag:
+                self.running = False
+                GLib.idle_add(self.emit, 'ended')
+            else:
+                # Continue, new downloads may have been added in the meantime
+                run(exclude_errors=True)
+
+        def run_server(downloads_ids):
+            for download_id in downloads_ids:
                 if self.stop_flag:
                     break
 
-                download = Download.get(row['id'])
+                download = Download.get(download_id)
                 if download is None:
                     # Download has been removed in the meantime
                     continue
 
-                chapter = download.chapter
+                download_chapter(download)
 
-                download.update(dict(status='downloading'))
-                GLib.idle_add(notify_download_started, download)
+        def download_chapter(download):
+            chapter = download.chapter
+            server = chapter.manga.server
 
-                try:
-                    if chapter.update_full() and len(chapter.pages) > 0:
-                        error_counter = 0
-                        success_counter = 0
-                        for index, _page in enumerate(chapter.pages):
-                            if self.stop_flag:
-                                interrupted = True
-                                break
+            download.update(dict(status='downloading'))
+            GLib.idle_add(notify_download_started, download)
 
-                            if chapter.get_page_path(index) is None:
-                                path = chapter.get_page(index)
-                                if path is not None:
-                                    success_counter += 1
-                                    download.update(dict(percent=(index + 1) * 100 / len(chapter.pages)))
-                                else:
-                                    error_counter += 1
-                                    download.update(dict(errors=error_counter))
+            aborted = False
 
-                                GLib.idle_add(notify_download_progress, download, success_counter, error_counter)
+            def download_page(index):
+                if self.stop_flag or aborted:
+                    return None
 
-                                if index < len(chapter.pages) - 1 and not self.stop_flag:
-                                    time.sleep(DOWNLOAD_DELAY)
-                            else:
-                                success_counter += 1
+                if chapter.get_page_path(index) is not None:
+                    return True
 
-                        if interrupted:
-                            download.update(dict(status='pending'))
-                        else:
-                            if error_counter == 0:
-                                # All pages were successfully downloaded
-                                chapter.update(dict(downloaded=1))
-                                download.delete()
-                                GLib.idle_add(notify_download_success, chapter)
+                # Pages requests are paced by server's rate limiter
+                return chapter.get_page(index) is not None
+
+            try:
+                if chapter.update_full() and len(chapter.pages) > 0:
+                    error_counter = 0
+                    success_counter = 0
+                    interrupted = False
+
+                    with ThreadPoolExecutor(max_workers=server.download_concurrency) as executor:
+                        futures = [executor.submit(download_page, index) for index in range(len(chapter.pages))]
+
+                        for future in as_completed(futures):
+                            try:
+                                success = future.result()
+                            except Exception:
+                                # Remaining pages must not be downloaded
+                                aborted = True
+                                raise
+
+                            if success is None:
+                                interrupted = True
+                            elif success:
+                                success_counter += 1
+                                download.update(dict(percent=success_counter * 100 / len(chapter.pages)))
                             else:
-                                # At least one page failed to be downloaded
-                                download.update(dict(status='error'))
-                                GLib.idle_add(notify_download_error, download)
+                                error_counter += 1
+                                download.update(dict(errors=error_counter))
+
+                            if success is not None:
+                                GLib.idle_add(notify_download_progress, download, success_counter, error_counter)
+
+                    if interrupted:
+                        download.update(dict(status='pending'))
                     else:
-                        # Possible causes:
-                        # - Empty chapter
-                        # - Outdated chapter info
-                        # - Server has undergone changes (API, HTML) and plugin code is outdated
-                        download.update(dict(status='error'))
-                        GLib.idle_add(notify_download_error, download)
-                except Exception as e:
+                        if error_counter == 0:
+                            # All pages were successfully downloaded
+                            chapter.update(dict(downloaded=1))
+                            if Settings.get_default().chapters_cbz_storage:
+                                chapter.pack()
+                            download.delete()
+                            GLib.idle_add(notify_download_success, chapter)
+                        else:
+                            # At least one page failed to be downloaded
+                            download.update(dict(status='error'))
+                            GLib.idle_add(notify_download_error, download)
+                else:
                     # Possible causes:
-                    # - No Internet connection
-                    # - Connexion timeout, read timeout
-                    # - Server down
+                    # - Empty chapter
+                    # - Outdated chapter info
+                    # - Server has undergone changes (API, HTML) and plugin code is outdated
                     download.update(dict(status='error'))
-                    user_error_message = log_error_traceback(e)
-                    GLib.idle_add(notify_download_error, download, user_error_message)
-
-            if not rows or self.stop_flag:
-                self.running = False
-                GLib.idle_add(self.emit, 'ended')
-            else:
-                # Continue, new downloads may have been added in the meantime
-                run(exclude_errors=True)
+                    GLib.idle_add(notify_download_error, download)
+            except Exception as e:
+                # Possible causes:
+                # - No Internet connection
+                # - Connexion timeout, read timeout
+                # - Server down
+                download.update(dict(status='error'))
+                user_error_message = log_error_traceback(e)
+                GLib.idle_add(notify_download_error, download, user_error_message)
 
         def notify_download_success(chapter):
             if notification is not None:
@@ -479,9 +516,7 @@ class DownloadManagerDialog(Gtk.Dialog):
             self.on_back_button_clicked()
 
     def populate(self):
-        db_conn = create_db_connection()
-        records = db_conn.execute('SELECT * FROM downloads ORDER BY date ASC').fetchall()
-        db_conn.close()
+        records = get_db_connection().execute('SELECT * FROM downloads ORDER BY date ASC').fetchall()
 
         if records:
             for record in records:
@@ -5,6 +5,7 @@ from urllib.parse import urlsplit
 from gi.repository import GLib
 
 from komikku.models import Manga
+from komikku.servers import get_server_class
 from komikku.servers import get_servers_list
 
 
@@ -47,7 +48,7 @@ def import_from_file(window, file_path):
         servers_list = get_servers_list()
         for item in servers_list:
             if item['id'] == server_id:
-                return getattr(item['module'], item['class_name'])()
+                return get_server_class(item)()
         return None
 
     if os.path.exists(file_path):
@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
-from copy import deepcopy
 from gettext import gettext as _
 from gettext import ngettext as n_
 import math
@@ -17,9 +16,8 @@ from gi.repository.GdkPixbuf import Pixbuf
 from gi.repository.GdkPixbuf import PixbufAnimation
 
 from komikku.downloader import DownloadManagerDialog
-from komikku.models import create_db_connection
+from komikku.models import get_db_connection
 from komikku.models import Manga
-from komikku.models import update_rows
 from komikku.importer import import_from_file
 from komikku.servers import get_file_mime_type
 from komikku.utils import scale_pixbuf_animation
@@ -63,6 +61,7 @@ class Library:
 
         self.window.connect('key-press-event', self.on_key_press)
         self.window.updater.connect('manga-updated', self.on_manga_updated)
+        self.window.connect('chapters-read-status-changed', self.on_chapters_read_status_changed)
 
         def _filter(thumbnail):
             manga = thumbnail.manga
@@ -127,6 +126,10 @@ class Library:
         update_action.connect('activate', self.update_all)
         self.window.application.add_action(update_action)
 
+        update_full_action = Gio.SimpleAction.new('library.update-full', None)
+        update_full_action.connect('activate', self.update_all, True)
+        self.window.application.add_action(update_full_action)
+
         download_manager_action = Gio.SimpleAction.new('library.download-manager', None)
         download_manager_action.connect('activate', self.open_download_manager)
         self.window.application.add_action(download_manager_action)
@@ -288,6 +291,15 @@ class Library:
 
         return Gdk.EVENT_PROPAGATE
 
+    def on_chapters_read_status_changed(self, _window, mangas_ids, _chapters_ids, _read):
+        for thumbnail in self.flowbox.get_children():
+            if thumbnail.manga.id in mangas_ids:
+                # Reload manga to drop its chapters
+                thumbnail.update(Manga.get(thumbnail.manga.id, thumbnail.manga.server))
+
+        # Counters (badges and filters) have changed
+        self.flowbox.invalidate_filter()
+
     def on_gesture_long_press_activated(self, _gesture, x, y):
         if self.selection_mode:
             # Enter in 'Range' selection mode
@@ -315,9 +327,7 @@ class Library:
 
     def on_manga_added(self, manga):
         """Called from 'Add dialog' when user clicks on [+] button"""
-        db_conn = create_db_connection()
-        nb_mangas = db_conn.execute('SELECT count(*) FROM mangas').fetchone()[0]
-        db_conn.close()
+        nb_mangas = get_db_connection().execute('SELECT count(*) FROM mangas').fetchone()[0]
 
         if nb_mangas == 1:
             # Library was previously empty
@@ -422,8 +432,7 @@ class Library:
         DownloadManagerDialog(self.window).open(action, param)
 
     def populate(self):
-        db_conn = create_db_connection()
-        mangas_rows = db_conn.execute('SELECT * FROM mangas ORDER BY last_read DESC').fetchall()
+        mangas_rows = get_db_connection().execute('SELECT * FROM mangas ORDER BY last_read DESC').fetchall()
 
         if len(mangas_rows) == 0:
             if self.window.overlay.is_ancestor(self.window.box):
@@ -449,8 +458,6 @@ class Library:
         for row in mangas_rows:
             self.add_manga(Manga.get(row['id']))
 
-        db_conn.close()
-
     def search(self, _search_entry):
         self.flowbox.invalidate_filter()
 
@@ -527,7 +534,7 @@ class Library:
             question_response = question_dialog.run()
             question_dialog.destroy()
             if question_response == Gtk.ResponseType.YES:
-                self.window.updater.update_library()
+                self.window.updater.update_library(force=True)
 
         dialog.destroy()
 
@@ -547,40 +554,23 @@ class Library:
             self.search_entry.grab_remove()
 
     def toggle_selected_read_status(self, _action, _param, read):
-        chapters_ids = []
-        chapters_data = []
+        mangas_ids = [thumbnail.manga.id for thumbnail in self.flowbox.get_selected_children()]
 
         self.window.activity_indicator.start()
 
-        for thumbnail in self.flowbox.get_selected_children():
-            for chapter in thumbnail.manga.chapters:
-                last_page_read_index = None
-                if chapter.pages:
-                    pages = deepcopy(chapter.pages)
-                    for page in pages:
-                        page['read'] = read
-                else:
-                    pages = None
-                    last_page_read_index = None if chapter.read == read == 0 else chapter.last_page_read_index
-
-                chapters_ids.append(chapter.id)
-                chapters_data.append(dict(
-                    pages=pages,
-                    read=read,
-                    recent=False,
-                    last_page_read_index=last_page_read_index,
-                ))
-
-        db_conn = create_db_connection()
-        with db_conn:
-            update_rows(db_conn, 'chapters', chapters_ids, chapters_data)
-        db_conn.close()
+        if read:
+            res = Manga.mark_all_read(mangas_ids)
+        else:
+            res = Manga.mark_all_unread(mangas_ids)
 
         self.window.activity_indicator.stop()
         self.leave_selection_mode()
 
-    def update_all(self, _action, _param):
-        self.window.updater.update_library()
+        if res:
+            self.window.emit('chapters-read-status-changed', mangas_ids, None, bool(read))
+
+    def update_all(self, _action, _param, force=False):
+        self.window.updater.update_library(force=force)
 
     def update_selected(self, _action, _param):
         self.window.updater.add([thumbnail.manga for thumbnail in self.flowbox.get_selected_children()])
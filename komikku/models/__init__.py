@@ -4,11 +4,17 @@
 
 from .database import backup_db
 from .database import Chapter
-from .database import create_db_connection
+from .database import close_db_connections
+from .database import db_writer
 from .database import Download
+from .database import get_db_connection
+from .database import get_mangas_stats
 from .database import init_db
 from .database import insert_rows
+from .database import invalidate_mangas_stats
 from .database import Manga
+from .database import pack_downloaded_chapters
+from .database import ProgressJournal
 from .database import update_rows
 
 from .settings import Settings
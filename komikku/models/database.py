@@ -2,28 +2,61 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from contextlib import contextmanager
 import datetime
 from functools import lru_cache
+from functools import partial
 from gettext import gettext as _
+import hashlib
 import importlib
 import json
 import logging
 import os
-from PIL import Image
 import sqlite3
 import shutil
+import threading
+import zipfile
 
 from komikku.models.settings import Settings
-from komikku.servers import convert_image
 from komikku.servers import get_server_class_name_by_id
 from komikku.servers import get_server_dir_name_by_id
+from komikku.servers import get_response_range_validator
 from komikku.servers import get_server_module_name_by_id
+from komikku.servers import ImagePipeline
+from komikku.servers import NotModified
 from komikku.servers import unscramble_image
+from komikku.utils import ARCHIVE_EXTENSION
+from komikku.utils import compute_borders_crop_bbox
+from komikku.utils import get_archive_member
 from komikku.utils import get_data_dir
+from komikku.utils import get_file_checksum
+from komikku.utils import get_file_signature
+from komikku.utils import open_file
 
 logger = logging.getLogger('komikku')
 
-VERSION = 6
+VERSION = 11
+
+# Long-lived connections: one per thread for reads, a single shared one for writes
+_db_local = threading.local()
+_db_generation = 0
+_db_readers = {}  # reader connections indexed by thread, to close connections of finished threads
+_db_readers_lock = threading.Lock()
+_db_writer = None
+_db_writer_lock = threading.RLock()
+
+# Page fields stored in their own columns of pages table, other fields provided by servers are stored in `data` column
+PAGES_COLUMNS = ('slug', 'image', 'read', 'bbox', 'mtime', 'size')
+
+# Min size (in bytes) of a partially downloaded page image worth resuming (see `Chapter.get_page`)
+PAGES_DOWNLOAD_RESUME_MIN_SIZE = 256 * 1024
+
+# Locks of pages downloads: a page is never downloaded by several threads simultaneously (reader and downloader)
+_pages_download_locks = [threading.Lock() for _i in range(64)]
+
+# Per-manga chapters counters (library badges and filters), computed all at once and cached
+_mangas_stats = None
+_mangas_stats_generation = 0
 
 
 def adapt_json(data):
@@ -44,7 +77,12 @@ def backup_db():
     db_path = get_db_path()
     if os.path.exists(db_path) and check_db():
         print('Save a DB backup')
-        shutil.copyfile(db_path, get_db_backup_path())
+        # In WAL mode, last commits may not be in DB file yet: a plain file copy is not enough
+        db_conn = create_db_connection()
+        backup_db_conn = sqlite3.connect(get_db_backup_path())
+        db_conn.backup(backup_db_conn)
+        backup_db_conn.close()
+        db_conn.close()
 
 
 def check_db():
@@ -62,8 +100,37 @@ def check_db():
     return False
 
 
-def create_db_connection():
-    con = sqlite3.connect(get_db_path(), detect_types=sqlite3.PARSE_DECLTYPES)
+def close_db_connections():
+    """Closes the writer connection, the connection of the current thread and connections of finished threads
+
+    Connections of other running threads are discarded: they're closed and re-created on next use.
+    """
+    global _db_generation
+    global _db_writer
+
+    with _db_writer_lock:
+        if _db_writer is not None:
+            _db_writer.close()
+            _db_writer = None
+
+    _db_local.connection = None
+    close_finished_threads_db_connections(include_current=True)
+
+    _db_generation += 1
+
+
+def close_finished_threads_db_connections(include_current=False):
+    """Closes reader connections of finished threads (and of current thread if `include_current` is True)"""
+    current_thread = threading.current_thread()
+
+    with _db_readers_lock:
+        for thread in list(_db_readers):
+            if not thread.is_alive() or (include_current and thread is current_thread):
+                _db_readers.pop(thread).close()
+
+
+def create_db_connection(check_same_thread=True):
+    con = sqlite3.connect(get_db_path(), detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=check_same_thread)
     if con is None:
         print("Error: Can not create the database connection.")
         return None
@@ -76,6 +143,33 @@ def create_db_connection():
     return con
 
 
+@contextmanager
+def db_writer():
+    """Serializes all writes through a single long-lived connection
+
+    Yields the writer connection inside a transaction which is committed on exit (rolled back on error).
+    Nested uses in the same thread share the outermost transaction.
+    """
+    global _db_writer
+
+    with _db_writer_lock:
+        if _db_writer is None:
+            _db_writer = create_db_connection(check_same_thread=False)
+            _db_writer.execute('PRAGMA synchronous = NORMAL')
+
+        db_conn = _db_writer
+        depth = getattr(_db_local, 'writer_depth', 0)
+        _db_local.writer_depth = depth + 1
+        try:
+            if depth > 0:
+                yield db_conn
+            else:
+                with db_conn:
+                    yield db_conn
+        finally:
+            _db_local.writer_depth = depth
+
+
 def execute_sql(conn, sql):
     try:
         c = conn.cursor()
@@ -86,6 +180,29 @@ def execute_sql(conn, sql):
         return False
 
 
+def get_db_connection():
+    """Returns the long-lived connection of the current thread
+
+    It must not be closed by callers. Writes must be done via `db_writer()`.
+    """
+    con = getattr(_db_local, 'connection', None)
+    if con is None or _db_local.generation != _db_generation:
+        if con is not None:
+            # Connection has been discarded by `close_db_connections()`
+            con.close()
+
+        # Connection is only used by current thread, but it's closed by another one once thread has finished
+        con = create_db_connection(check_same_thread=False)
+        _db_local.connection = con
+        _db_local.generation = _db_generation
+
+        with _db_readers_lock:
+            _db_readers[threading.current_thread()] = con
+        close_finished_threads_db_connections()
+
+    return con
+
+
 @lru_cache(maxsize=None)
 def get_db_path():
     return os.path.join(get_data_dir(), 'komikku.db')
@@ -96,12 +213,55 @@ def get_db_backup_path():
     return os.path.join(get_data_dir(), 'komikku_backup.db')
 
 
+def get_mangas_stats():
+    """Returns chapters counters of all mangas, indexed by manga ID
+
+    Counters are computed with a single query and kept in memory until `invalidate_mangas_stats()` is called.
+    """
+    global _mangas_stats
+
+    stats = _mangas_stats
+    if stats is not None:
+        return stats
+
+    generation = _mangas_stats_generation
+    rows = get_db_connection().execute(
+        """SELECT
+            manga_id,
+            sum(downloaded = 1) AS downloaded,
+            sum(recent = 1) AS recents,
+            sum(read = 0) AS unread,
+            sum(downloaded = 1 AND read = 0) AS to_read
+        FROM chapters GROUP BY manga_id"""
+    ).fetchall()
+
+    stats = {}
+    for row in rows:
+        stats[row['manga_id']] = dict(
+            downloaded=row['downloaded'],
+            recents=row['recents'],
+            unread=row['unread'],
+            to_read=row['to_read'],
+        )
+
+    # Don't keep stats if they were invalidated in the meantime (by another thread)
+    if generation == _mangas_stats_generation:
+        _mangas_stats = stats
+
+    return stats
+
+
 def init_db():
     db_path = get_db_path()
     db_backup_path = get_db_backup_path()
     if os.path.exists(db_path) and os.path.exists(db_backup_path) and not check_db():
         # Restore backup
         print('Restore DB from backup')
+        close_db_connections()
+        # A stale write-ahead log must not be replayed on top of restored DB
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
         shutil.copyfile(db_backup_path, db_path)
 
     sql_create_mangas_table = """CREATE TABLE IF NOT EXISTS mangas (
@@ -122,6 +282,8 @@ def init_db():
         sort_order text,
         last_read timestamp,
         last_update timestamp,
+        last_check timestamp, -- date of last successful update (with or without changes)
+        validators json, -- HTTP validators (ETag, Last-Modified, content hash) of last manga data response
         UNIQUE (slug, server_id)
     );"""
 
@@ -132,7 +294,6 @@ def init_db():
         url text, -- only used in case slug can't be used to forge the url
         title text NOT NULL,
         scanlators json,
-        pages json,
         scrambled integer,
         date date,
         rank integer NOT NULL,
@@ -143,6 +304,24 @@ def init_db():
         UNIQUE (slug, manga_id)
     );"""
 
+    sql_create_pages_table = """CREATE TABLE IF NOT EXISTS pages (
+        id integer PRIMARY KEY,
+        chapter_id integer REFERENCES chapters(id) ON DELETE CASCADE,
+        "index" integer NOT NULL,
+        slug text,
+        image text,
+        read integer NOT NULL DEFAULT 0,
+        bbox json, -- borders crop bbox
+        mtime integer, -- modification time (in nanoseconds) of image file when bbox was computed
+        size integer, -- size of image file when bbox was computed
+        data json, -- other page data provided by server
+        download_status text NOT NULL DEFAULT 'pending', -- download journal: pending, partial or complete
+        download_offset integer, -- size of image data downloaded
+        download_checksum text, -- SHA-1 of image data downloaded
+        download_validator text, -- ETag or Last-Modified of image response, required to resume a partial download
+        UNIQUE (chapter_id, "index")
+    );"""
+
     sql_create_downloads_table = """CREATE TABLE IF NOT EXISTS downloads (
         id integer PRIMARY KEY,
         chapter_id integer REFERENCES chapters(id) ON DELETE CASCADE,
@@ -155,12 +334,16 @@ def init_db():
 
     db_conn = create_db_connection()
     if db_conn is not None:
+        # Write-Ahead Logging: readers don't block writer and vice versa (persistent setting)
+        db_conn.execute('PRAGMA journal_mode = WAL')
+
         db_version = db_conn.execute('PRAGMA user_version').fetchone()[0]
 
         if db_version == 0:
             # First launch
             execute_sql(db_conn, sql_create_mangas_table)
             execute_sql(db_conn, sql_create_chapters_table)
+            execute_sql(db_conn, sql_create_pages_table)
             execute_sql(db_conn, sql_create_downloads_table)
 
             db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
@@ -192,11 +375,93 @@ def init_db():
             if execute_sql(db_conn, 'ALTER TABLE mangas RENAME COLUMN reading_direction TO reading_mode;'):
                 db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
 
+        if 0 < db_version <= 6:
+            # Version 0.24.0
+            if execute_sql(db_conn, 'ALTER TABLE mangas ADD COLUMN validators json;'):
+                db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
+
+        if 0 < db_version <= 7:
+            # Version 0.24.0
+            if execute_sql(db_conn, 'ALTER TABLE mangas ADD COLUMN last_check timestamp;'):
+                db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
+
+        if 0 < db_version <= 8:
+            # Version 0.24.0
+            # Chapters pages are moved from a JSON list (chapters.pages) to a table
+            # Column chapters.pages is emptied but kept (DROP COLUMN requires SQLite >= 3.35)
+            if execute_sql(db_conn, sql_create_pages_table):
+                with db_conn:
+                    for row in db_conn.execute('SELECT id, pages FROM chapters WHERE pages IS NOT NULL').fetchall():
+                        pages = row['pages']
+                        for page in pages:
+                            borders_crop = page.pop('borders_crop', None)
+                            if borders_crop:
+                                page.update(bbox=borders_crop['bbox'], mtime=borders_crop['mtime'], size=borders_crop['size'])
+                        insert_pages(db_conn, row['id'], pages)
+                    db_conn.execute('UPDATE chapters SET pages = NULL')
+                db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
+
+        if 0 < db_version <= 9:
+            # Version 0.24.0
+            # Pages download journal, pages of downloaded chapters are complete
+            columns = (
+                "download_status text NOT NULL DEFAULT 'pending'",
+                'download_offset integer',
+                'download_checksum text',
+                'download_validator text',
+            )
+            if db_version <= 8 or all(execute_sql(db_conn, 'ALTER TABLE pages ADD COLUMN {0};'.format(column)) for column in columns):
+                with db_conn:
+                    db_conn.execute(
+                        "UPDATE pages SET download_status = 'complete' WHERE chapter_id IN (SELECT id FROM chapters WHERE downloaded = 1)")
+                db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
+
+        if 0 < db_version <= 10:
+            # Version 0.24.0
+            # Pages borders crop bbox is validated with image file mtime too
+            if db_version <= 8 or execute_sql(db_conn, 'ALTER TABLE pages ADD COLUMN mtime integer;'):
+                db_conn.execute('PRAGMA user_version = {0}'.format(VERSION))
+
         print('DB version', db_conn.execute('PRAGMA user_version').fetchone()[0])
 
         db_conn.close()
 
 
+def invalidate_mangas_stats():
+    """Invalidates chapters counters cache: must be called each time chapters are added, deleted or change status"""
+    global _mangas_stats
+    global _mangas_stats_generation
+
+    _mangas_stats_generation += 1
+    _mangas_stats = None
+
+
+def insert_pages(db_conn, chapter_id, pages):
+    """Inserts pages of a chapter (list of dicts, as provided by servers) in pages table"""
+    seq = []
+    for index, page in enumerate(pages):
+        data = {key: value for key, value in page.items() if key not in PAGES_COLUMNS}
+        seq.append((
+            chapter_id,
+            index,
+            page.get('slug'),
+            page.get('image'),
+            int(bool(page.get('read'))),
+            page.get('bbox'),
+            page.get('mtime'),
+            page.get('size'),
+            data or None,
+        ))
+
+    try:
+        db_conn.executemany(
+            'INSERT INTO pages (chapter_id, "index", slug, image, read, bbox, mtime, size, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', seq)
+        return True
+    except Exception as e:
+        print('SQLite-error:', e, pages)
+        return False
+
+
 def insert_row(db_conn, table, data):
     try:
         cursor = db_conn.execute(
@@ -224,6 +489,74 @@ def insert_rows(db_conn, table, data):
         return False
 
 
+def pack_downloaded_chapters(callback=None):
+    """Packs pages images of downloaded chapters stored as loose files in CBZ archives
+
+    Migration tool for libraries downloaded before CBZ storage was enabled (see `Chapter.pack`).
+
+    :param callback: Optional function called after each chapter with number of chapters processed and total number
+    :return: Number of chapters packed
+    """
+    rows = get_db_connection().execute('SELECT * FROM chapters WHERE downloaded = 1 ORDER BY manga_id').fetchall()
+
+    mangas = {}
+    nb_packed = 0
+    for index, row in enumerate(rows):
+        manga = mangas.get(row['manga_id'])
+        if manga is None:
+            manga = mangas[row['manga_id']] = Manga.get(row['manga_id'])
+
+        chapter = Chapter(row, manga)
+        if os.path.isdir(chapter.path) and chapter.pack():
+            nb_packed += 1
+
+        if callback is not None:
+            callback(index + 1, len(rows))
+
+    return nb_packed
+
+
+def update_chapters_read_status(ids, read, by_manga=False, keep_last_page_read_index=False):
+    """Marks chapters (and their pages) as read or unread
+
+    Chapters are also marked as not recent and their last page read index is reset.
+    A few set-based statements are run in a single transaction.
+
+    :param list ids: chapters IDs or mangas IDs (all chapters of mangas)
+    :param bool read: read status
+    :param bool by_manga: whether IDs are mangas IDs
+    :param bool keep_last_page_read_index: whether last page read index of chapters without pages is kept
+                                           (except for unread chapters marked as unread)
+    :return: True on success False otherwise
+    """
+    column = 'manga_id' if by_manga else 'id'
+    seq = [(read, id) for id in ids]
+
+    if keep_last_page_read_index:
+        # Values of the row before update are used in SET expressions
+        last_page_read_index = """CASE
+            WHEN EXISTS (SELECT 1 FROM pages WHERE chapter_id = chapters.id) OR (read = 0 AND {0} = 0) THEN NULL
+            ELSE last_page_read_index
+        END""".format(int(read))
+    else:
+        last_page_read_index = 'NULL'
+
+    try:
+        with db_writer() as db_conn:
+            db_conn.executemany(
+                'UPDATE chapters SET read = ?, recent = 0, last_page_read_index = {0} WHERE {1} = ?'.format(last_page_read_index, column),
+                seq)
+            db_conn.executemany(
+                'UPDATE pages SET read = ? WHERE chapter_id IN (SELECT id FROM chapters WHERE {0} = ?)'.format(column), seq)
+    except Exception as e:
+        print('SQLite-error:', e, ids)
+        return False
+
+    invalidate_mangas_stats()
+
+    return True
+
+
 def update_row(db_conn, table, id, data):
     try:
         db_conn.execute(
@@ -268,9 +601,7 @@ class Manga:
 
     @classmethod
     def get(cls, id, server=None):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT * FROM mangas WHERE id = ?', (id,)).fetchone()
-        db_conn.close()
+        row = get_db_connection().execute('SELECT * FROM mangas WHERE id = ?', (id,)).fetchone()
 
         if row is None:
             return None
@@ -302,8 +633,7 @@ class Manga:
                     ))
                     break
 
-        db_conn = create_db_connection()
-        with db_conn:
+        with db_writer() as db_conn:
             id = insert_row(db_conn, 'mangas', data)
 
             if id is not None:
@@ -313,7 +643,7 @@ class Manga:
                     if chapter is not None:
                         rank += 1
 
-        db_conn.close()
+        invalidate_mangas_stats()
 
         manga = cls.get(id, server)
 
@@ -326,10 +656,32 @@ class Manga:
             return manga
         return None
 
+    @classmethod
+    def mark_all_read(cls, ids):
+        """Marks all chapters of several mangas as read
+
+        Last page read index of chapters without pages is kept.
+
+        :param list ids: mangas IDs
+        :return: True on success False otherwise
+        """
+        return update_chapters_read_status(ids, True, by_manga=True, keep_last_page_read_index=True)
+
+    @classmethod
+    def mark_all_unread(cls, ids):
+        """Marks all chapters of several mangas as unread
+
+        Last page read index of chapters without pages is kept, unless chapter was already unread.
+
+        :param list ids: mangas IDs
+        :return: True on success False otherwise
+        """
+        return update_chapters_read_status(ids, False, by_manga=True, keep_last_page_read_index=True)
+
     @property
     def chapters(self):
         if self._chapters is None:
-            db_conn = create_db_connection()
+            db_conn = get_db_connection()
             if self.sort_order == 'asc':
                 rows = db_conn.execute('SELECT * FROM chapters WHERE manga_id = ? ORDER BY rank ASC', (self.id,))
             else:
@@ -339,8 +691,6 @@ class Manga:
             for row in rows:
                 self._chapters.append(Chapter(row=row, manga=self))
 
-            db_conn.close()
-
         return self._chapters
 
     @property
@@ -365,36 +715,19 @@ class Manga:
 
     @property
     def nb_downloaded_chapters(self):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT count() AS downloaded FROM chapters WHERE manga_id = ? AND downloaded = 1', (self.id,)).fetchone()
-        db_conn.close()
-
-        return row['downloaded']
+        return self.stats['downloaded']
 
     @property
     def nb_to_read_chapters(self):
-        db_conn = create_db_connection()
-        row = db_conn.execute(
-            'SELECT count() AS to_read FROM chapters WHERE manga_id = ? AND downloaded = 1 and read = 0', (self.id,)).fetchone()
-        db_conn.close()
-
-        return row['to_read']
+        return self.stats['to_read']
 
     @property
     def nb_recent_chapters(self):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT count() AS recents FROM chapters WHERE manga_id = ? AND recent = 1', (self.id,)).fetchone()
-        db_conn.close()
-
-        return row['recents']
+        return self.stats['recents']
 
     @property
     def nb_unread_chapters(self):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT count() AS unread FROM chapters WHERE manga_id = ? AND read = 0', (self.id,)).fetchone()
-        db_conn.close()
-
-        return row['unread']
+        return self.stats['unread']
 
     @property
     def path(self):
@@ -408,6 +741,10 @@ class Manga:
 
         return self._server
 
+    @property
+    def stats(self):
+        return get_mangas_stats().get(self.id) or dict(downloaded=0, recents=0, unread=0, to_read=0)
+
     def _save_cover(self, url):
         if url is None:
             return
@@ -423,12 +760,10 @@ class Manga:
             fp.write(cover_data)
 
     def delete(self):
-        db_conn = create_db_connection()
-
-        with db_conn:
+        with db_writer() as db_conn:
             db_conn.execute('DELETE FROM mangas WHERE id = ?', (self.id, ))
 
-        db_conn.close()
+        invalidate_mangas_stats()
 
         if os.path.exists(self.path):
             shutil.rmtree(self.path)
@@ -440,14 +775,13 @@ class Manga:
         """
         assert direction in (-1, 1), 'Invalid direction value'
 
-        db_conn = create_db_connection()
+        db_conn = get_db_connection()
         if direction == 1:
             row = db_conn.execute(
                 'SELECT * FROM chapters WHERE manga_id = ? AND rank > ? ORDER BY rank ASC', (self.id, chapter.rank)).fetchone()
         else:
             row = db_conn.execute(
                 'SELECT * FROM chapters WHERE manga_id = ? AND rank < ? ORDER BY rank DESC', (self.id, chapter.rank)).fetchone()
-        db_conn.close()
 
         if not row:
             return None
@@ -467,12 +801,9 @@ class Manga:
         for key in data:
             setattr(self, key, data[key])
 
-        db_conn = create_db_connection()
-        with db_conn:
+        with db_writer() as db_conn:
             ret = update_row(db_conn, 'mangas', self.id, data)
 
-        db_conn.close()
-
         return ret
 
     def update_full(self):
@@ -484,84 +815,165 @@ class Manga:
         :return: True on success False otherwise, recent chapters IDs, number of deleted chapters
         :rtype: tuple
         """
-        gone_chapters_ranks = []
-        recent_chapters_ids = []
-        nb_deleted_chapters = 0
+        data = self.fetch_full_data()
+        if data is None:
+            return False, 0, 0
 
-        def get_free_rank(rank):
-            if rank not in gone_chapters_ranks:
-                return rank
+        return self.save_full_data(data)
 
-            return get_free_rank(rank + 1)
+    def fetch_full_data(self, force=False):
+        """
+        Fetches manga's data available on server (network requests only, no DB writes)
+
+        :param force: ignore validators of last update, data is always fetched
+        :return: data to pass to `save_full_data()` (empty if manga has not changed since last update) or None on failure
+        :rtype: dict
+        """
+        try:
+            data = self.server.get_manga_data_if_modified(dict(slug=self.slug, url=self.url), None if force else self.validators)
+        except NotModified:
+            return {}
 
-        data = self.server.get_manga_data(dict(slug=self.slug, url=self.url))
         if data is None:
-            return False, 0, 0
+            return None
 
-        db_conn = create_db_connection()
-        with db_conn:
-            # Update cover
-            cover = data.pop('cover')
-            if cover:
-                self._save_cover(cover)
+        # Update cover (outside of DB transaction: it's a network request)
+        cover = data.pop('cover')
+        if cover:
+            self._save_cover(cover)
+
+        return data
+
+    def save_full_data(self, data, post_commit_operations=None):
+        """
+        Saves manga's data fetched by `fetch_full_data()`
 
-            # Update chapters
-            chapters_data = data.pop('chapters')
+        When called inside a `db_writer()` block, changes are committed with the enclosing transaction.
+        In this case, filesystem changes must not be applied before commit: pass a list to collect them.
+
+        :param post_commit_operations: list to which filesystem operations (callables) are appended instead of being run
+        :return: True, recent chapters IDs, number of deleted chapters
+        :rtype: tuple
+        """
+        if not data:
+            # Manga has not changed since last update
+            self.last_check = datetime.datetime.now()
+            with db_writer() as db_conn:
+                update_row(db_conn, 'mangas', self.id, dict(last_check=self.last_check))
+
+            return True, [], 0
+
+        # Chapters available on server, indexed by slug (server order is preserved, duplicates are ignored)
+        chapters_data = {}
+        for chapter_data in data.pop('chapters'):
+            chapters_data.setdefault(chapter_data['slug'], chapter_data)
+
+        # Pages are sometimes provided with chapters (stored in pages table)
+        chapters_pages = {}
+        for slug, chapter_data in chapters_data.items():
+            if 'pages' in chapter_data:
+                chapter_data = chapters_data[slug] = chapter_data.copy()
+                pages = chapter_data.pop('pages')
+                if pages:
+                    chapters_pages[slug] = pages
+
+        # Filesystem changes, applied once changes are committed
+        operations = [] if post_commit_operations is None else post_commit_operations
+
+        with db_writer() as db_conn:
+            # Load existing chapters once
+            rows = {row['slug']: row for row in db_conn.execute('SELECT * FROM chapters WHERE manga_id = ?', (self.id,))}
 
             # First, delete chapters that no longer exist on server EXCEPT those marked as downloaded
             # In case of downloaded, we keep track of ranks because they must not be reused
-            chapters_slugs = [chapter_data['slug'] for chapter_data in chapters_data]
-            rows = db_conn.execute('SELECT * FROM chapters WHERE manga_id = ?', (self.id,))
-            for row in rows:
-                if row['slug'] not in chapters_slugs:
-                    gone_chapter = Chapter.get(row['id'], manga=self, db_conn=db_conn)
-                    # Interestingly, Manga Plus chapters remain accessible through the same slugs indefinitely.
-                    # So, there's no need to remove the chapter if the server is Manga Plus.
-                    if not gone_chapter.downloaded and not self.server.id == 'mangaplus':
-                        # Delete chapter
-                        gone_chapter.delete(db_conn)
-                        nb_deleted_chapters += 1
-
-                        logger.warning(
-                            '[UPDATE] {0} ({1}): Delete chapter {2} (no longer available)'.format(
-                                self.name, self.server_id, gone_chapter.title
-                            )
-                        )
-                    else:
-                        # Keep track of rank freed
-                        gone_chapters_ranks.append(gone_chapter.rank)
+            # Interestingly, Manga Plus chapters remain accessible through the same slugs indefinitely.
+            # So, there's no need to remove the chapter if the server is Manga Plus.
+            gone_chapters_ranks = set()
+            deleted_rows = []
+            for slug in rows.keys() - chapters_data.keys():
+                row = rows[slug]
+                if not row['downloaded'] and not self.server.id == 'mangaplus':
+                    deleted_rows.append(row)
+                else:
+                    # Keep track of rank freed
+                    gone_chapters_ranks.add(row['rank'])
+
+            if deleted_rows:
+                db_conn.executemany('DELETE FROM chapters WHERE id = ?', [(row['id'], ) for row in deleted_rows])
+
+                for row in deleted_rows:
+                    operations.append(partial(shutil.rmtree, os.path.join(self.path, row['slug']), ignore_errors=True))
+
+                    logger.warning(
+                        '[UPDATE] {0} ({1}): Delete chapter {2} (no longer available)'.format(self.name, self.server_id, row['title'])
+                    )
+            nb_deleted_chapters = len(deleted_rows)
 
-            # Then, add or update chapters
+            # Then, compute ranks and split chapters into new ones and existing ones which have changed
+            # Both are grouped by set of fields to be able to use executemany
+            new_chapters = {}
+            updated_chapters = {}
             rank = 0
-            for chapter_data in chapters_data:
-                row = db_conn.execute(
-                    'SELECT * FROM chapters WHERE manga_id = ? AND slug = ?', (self.id, chapter_data['slug'])
-                ).fetchone()
-
-                rank = get_free_rank(rank)
-                if row:
-                    # Update chapter rank
-                    chapter_data['rank'] = rank
-                    update_row(db_conn, 'chapters', row['id'], chapter_data)
+            for slug, chapter_data in chapters_data.items():
+                while rank in gone_chapters_ranks:
                     rank += 1
-                else:
-                    # Add new chapter
+
+                chapter_data['rank'] = rank
+                rank += 1
+
+                row = rows.get(slug)
+                if row is None:
+                    # New chapter
                     chapter_data.update(dict(
                         manga_id=self.id,
-                        rank=rank,
                         downloaded=0,
                         recent=1,
                         read=0,
                     ))
-                    id = insert_row(db_conn, 'chapters', chapter_data)
-                    if id is not None:
-                        recent_chapters_ids.append(id)
-                        rank += 1
+                    new_chapters.setdefault(tuple(chapter_data), []).append(chapter_data)
+                else:
+                    # Existing chapter: update changed fields only (rank included)
+                    changes = {key: value for key, value in chapter_data.items() if key not in row.keys() or row[key] != value}
+                    if changes:
+                        ids, changes_data = updated_chapters.setdefault(tuple(changes), ([], []))
+                        ids.append(row['id'])
+                        changes_data.append(changes)
+
+            for ids, changes_data in updated_chapters.values():
+                update_rows(db_conn, 'chapters', ids, changes_data)
+
+            for new_chapters_data in new_chapters.values():
+                if not insert_rows(db_conn, 'chapters', new_chapters_data):
+                    # Fallback to one by one insertion to add valid chapters at least
+                    for chapter_data in new_chapters_data:
+                        insert_row(db_conn, 'chapters', chapter_data)
+
+            # Retrieve IDs of new chapters (in server order)
+            recent_chapters_ids = []
+            if new_chapters:
+                ids = {}
+                for row in db_conn.execute('SELECT id, slug FROM chapters WHERE manga_id = ?', (self.id,)):
+                    if row['slug'] not in rows:
+                        ids[row['slug']] = row['id']
+
+                for slug, chapter_data in chapters_data.items():
+                    if slug in ids:
+                        recent_chapters_ids.append(ids[slug])
 
                         logger.info('[UPDATE] {0} ({1}): Add new chapter {2}'.format(self.name, self.server_id, chapter_data['title']))
 
+            if chapters_pages:
+                ids = {row['slug']: row['id'] for row in db_conn.execute('SELECT id, slug FROM chapters WHERE manga_id = ?', (self.id,))}
+                for slug, pages in chapters_pages.items():
+                    # Pages are replaced only if they have changed (read status is preserved otherwise)
+                    pages_rows = db_conn.execute('SELECT slug, image FROM pages WHERE chapter_id = ? ORDER BY "index"', (ids[slug], ))
+                    if [tuple(row) for row in pages_rows] != [(page.get('slug'), page.get('image')) for page in pages]:
+                        db_conn.execute('DELETE FROM pages WHERE chapter_id = ?', (ids[slug], ))
+                        insert_pages(db_conn, ids[slug], pages)
+
+            data['last_check'] = datetime.datetime.now()
             if len(recent_chapters_ids) > 0 or nb_deleted_chapters > 0:
-                data['last_update'] = datetime.datetime.now()
+                data['last_update'] = data['last_check']
 
             self._chapters = None
 
@@ -576,31 +988,38 @@ class Manga:
 
             if old_path != self.path:
                 # Manga name changes, manga folder must be renamed too
-                os.rename(old_path, self.path)
+                operations.append(partial(os.rename, old_path, self.path))
 
-        db_conn.close()
+        if post_commit_operations is None:
+            for operation in operations:
+                operation()
+
+        invalidate_mangas_stats()
 
         return True, recent_chapters_ids, nb_deleted_chapters
 
 
 class Chapter:
     _manga = None
+    _pages = None
+    _pages_loaded = False
 
     def __init__(self, row=None, manga=None):
         if row is not None:
             if manga:
                 self._manga = manga
             for key in row.keys():
+                if key == 'pages':
+                    # Obsolete column (pages are stored in pages table since DB version 9)
+                    continue
                 setattr(self, key, row[key])
 
     @classmethod
     def get(cls, id, manga=None, db_conn=None):
-        if db_conn is not None:
-            row = db_conn.execute('SELECT * FROM chapters WHERE id = ?', (id,)).fetchone()
-        else:
-            db_conn = create_db_connection()
-            row = db_conn.execute('SELECT * FROM chapters WHERE id = ?', (id,)).fetchone()
-            db_conn.close()
+        if db_conn is None:
+            db_conn = get_db_connection()
+
+        row = db_conn.execute('SELECT * FROM chapters WHERE id = ?', (id,)).fetchone()
 
         if row is None:
             return None
@@ -611,6 +1030,7 @@ class Chapter:
     def new(cls, data, rank, manga_id, db_conn=None):
         # Fill data with internal data
         data = data.copy()
+        pages = data.pop('pages', None)
         data.update(dict(
             manga_id=manga_id,
             rank=rank,
@@ -619,18 +1039,54 @@ class Chapter:
             read=0,
         ))
 
-        if db_conn is not None:
+        def insert(db_conn):
             id = insert_row(db_conn, 'chapters', data)
-        else:
-            db_conn = create_db_connection()
+            if id is not None and pages:
+                insert_pages(db_conn, id, pages)
+
+            return id
 
-            with db_conn:
-                id = insert_row(db_conn, 'chapters', data)
+        if db_conn is not None:
+            id = insert(db_conn)
+        else:
+            # Chapter is read back with the connection of current thread, once inserted
+            with db_writer() as writer_conn:
+                id = insert(writer_conn)
 
-            db_conn.close()
+        invalidate_mangas_stats()
 
         return cls.get(id, db_conn=db_conn) if id is not None else None
 
+    @classmethod
+    def get_last_pages_read_indexes(cls, manga_id):
+        """Returns last page read index of all chapters of a manga
+
+        :param int manga_id: manga ID
+        :return: last page read indexes indexed by chapters IDs
+        :rtype: dict
+        """
+        rows = get_db_connection().execute('SELECT id, last_page_read_index FROM chapters WHERE manga_id = ?', (manga_id, ))
+
+        return {row['id']: row['last_page_read_index'] for row in rows}
+
+    @classmethod
+    def mark_read(cls, ids):
+        """Marks several chapters as read
+
+        :param list ids: chapters IDs
+        :return: True on success False otherwise
+        """
+        return update_chapters_read_status(ids, True)
+
+    @classmethod
+    def mark_unread(cls, ids):
+        """Marks several chapters as unread
+
+        :param list ids: chapters IDs
+        :return: True on success False otherwise
+        """
+        return update_chapters_read_status(ids, False)
+
     @property
     def manga(self):
         if self._manga is None:
@@ -638,6 +1094,36 @@ class Chapter:
 
         return self._manga
 
+    @property
+    def archive_path(self):
+        """Path of CBZ archive in which pages images are stored once chapter is packed (see `pack`)"""
+        return self.path + ARCHIVE_EXTENSION
+
+    @property
+    def pages(self):
+        """Pages (list of dicts) or None if not known yet
+
+        Loaded from pages table on first access.
+        """
+        if not self._pages_loaded:
+            pages = []
+            for row in get_db_connection().execute('SELECT * FROM pages WHERE chapter_id = ? ORDER BY "index"', (self.id, )):
+                page = row['data'] or {}
+                for key in PAGES_COLUMNS:
+                    page[key] = row[key]
+                page['read'] = bool(page['read'])
+                pages.append(page)
+
+            self._pages = pages or None
+            self._pages_loaded = True
+
+        return self._pages
+
+    @pages.setter
+    def pages(self, pages):
+        self._pages = pages
+        self._pages_loaded = True
+
     @property
     def path(self):
         # BEWARE: self.slug may contain '/' characters
@@ -648,17 +1134,25 @@ class Chapter:
         if db_conn is not None:
             db_conn.execute('DELETE FROM chapters WHERE id = ?', (self.id, ))
         else:
-            db_conn = create_db_connection()
-
-            with db_conn:
+            with db_writer() as db_conn:
                 db_conn.execute('DELETE FROM chapters WHERE id = ?', (self.id, ))
 
-            db_conn.close()
+        invalidate_mangas_stats()
 
         if os.path.exists(self.path):
             shutil.rmtree(self.path)
+        if os.path.exists(self.archive_path):
+            os.unlink(self.archive_path)
 
     def get_page(self, page_index):
+        """Returns path of a page image, image is downloaded if needed
+
+        Downloads are journaled (see `get_page_journal`): a partially downloaded image is resumed
+        with a range request, as long as server supports it and image has not changed in the meantime.
+
+        :param page_index: Page index
+        :return: Path of image or None on failure
+        """
         if not self.pages or not self.pages[page_index]:
             return None
 
@@ -666,44 +1160,56 @@ class Chapter:
         if page_path:
             return page_path
 
-        data = self.manga.server.get_manga_chapter_page_image(self.manga.slug, self.manga.name, self.slug, self.pages[page_index])
-        if data is None:
-            return None
+        with _pages_download_locks[hash((self.id, page_index)) % len(_pages_download_locks)]:
+            # Page may have been downloaded by another thread in the meantime
+            page_path = self.get_page_path(page_index)
+            if page_path:
+                return page_path
 
-        if not os.path.exists(self.path):
-            os.makedirs(self.path, exist_ok=True)
+            return self._download_page(page_index)
 
-        image = data['buffer']
-        page_path = os.path.join(self.path, data['name'])
+    def get_page_borders_crop_bbox(self, page_index):
+        """Returns borders crop bbox of a page image
 
-        if data['mime_type'] == 'image/webp' or self.scrambled:
-            if data['mime_type'] == 'image/webp':
-                image = convert_image(image)
+        Bbox is computed once and stored in page row (with image file signature: mtime and size),
+        it's computed again only if image file has changed.
+
+        :param page_index: Page index
+        :return: A (left, upper, right, lower) bbox or None if image is blank or not available
+        """
+        page_path = self.get_page_path(page_index)
+        if page_path is None:
+            return None
 
-            if self.scrambled:
-                image = unscramble_image(image)
+        mtime, size = get_file_signature(page_path)
+        page = self.pages[page_index]
 
-        if isinstance(image, Image.Image):
-            image.save(page_path)
-        else:
-            with open(page_path, 'wb') as fp:
-                fp.write(image)
+        if (page.get('mtime'), page.get('size')) == (mtime, size):
+            return tuple(page['bbox']) if page['bbox'] is not None else None
 
-        updated_data = {}
-        if self.pages[page_index]['image'] is None:
-            self.pages[page_index]['image'] = data['name']
-            updated_data['pages'] = self.pages
+        bbox = compute_borders_crop_bbox(page_path)
 
-        downloaded = len(next(os.walk(self.path))[2]) == len(self.pages)
-        if downloaded != self.downloaded:
-            updated_data['downloaded'] = downloaded
+        self.update_page(page_index, dict(bbox=bbox, mtime=mtime, size=size))
 
-        if updated_data:
-            self.update(updated_data)
+        return bbox
 
-        return page_path
+    def get_page_journal(self, page_index):
+        """Returns download journal of a page
+
+        :param page_index: Page index
+        :return: A sqlite3.Row with `download_status` (pending, partial or complete), `download_offset`,
+                 `download_checksum` and `download_validator` columns
+        """
+        return get_db_connection().execute(
+            'SELECT download_status, download_offset, download_checksum, download_validator FROM pages WHERE chapter_id = ? AND "index" = ?',
+            (self.id, page_index)
+        ).fetchone()
 
     def get_page_path(self, page_index):
+        """Returns path of a page image or None if image is not downloaded
+
+        If chapter is packed, path points inside archive (ex: chapter.cbz/001.jpg), see `komikku.utils.open_file`.
+        """
         if self.pages and self.pages[page_index]['image'] is not None:
             # self.pages[page_index]['image'] can be an image name or an image url (path + eventually a query string)
 
@@ -713,14 +1219,162 @@ class Chapter:
             imagename = imagename.split('?')[0]
 
             path = os.path.join(self.path, imagename)
+            if os.path.exists(path):
+                return path
 
-            return path if os.path.exists(path) else None
+            if os.path.exists(self.archive_path):
+                path = os.path.join(self.archive_path, imagename)
+                try:
+                    get_file_signature(path)
+                except OSError:
+                    return None
+
+                return path
 
         return None
 
+    def _download_page(self, page_index):
+        server = self.manga.server
+        page = self.pages[page_index]
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        # Image is downloaded in a temporary file, renamed once complete
+        part_path = os.path.join(self.path, '.{0}.part'.format(page_index))
+
+        journal = self.get_page_journal(page_index)
+        offset = 0
+        if journal['download_status'] == 'partial' and journal['download_validator'] and \
+                journal['download_offset'] >= PAGES_DOWNLOAD_RESUME_MIN_SIZE and \
+                get_file_checksum(part_path, journal['download_offset']) == journal['download_checksum']:
+            offset = journal['download_offset']
+
+        if offset > 0:
+            data = server.get_manga_chapter_page_image_range(
+                self.manga.slug, self.manga.name, self.slug, page, offset, journal['download_validator'])
+        else:
+            data = server.get_manga_chapter_page_image(self.manga.slug, self.manga.name, self.slug, page)
+        if data is None:
+            return None
+
+        page_path = os.path.join(self.path, data['name'])
+
+        if 'response' in data:
+            # Streamed image: written to disk by chunks, progress is journaled if download can be resumed
+            validator = get_response_range_validator(data['response'])
+            size = checksum = None
+
+            def on_progress(progress_size, progress_checksum):
+                nonlocal size, checksum
+
+                size = progress_size
+                checksum = progress_checksum
+                if validator:
+                    self.update_page_journal(page_index, dict(
+                        download_status='partial',
+                        download_offset=size,
+                        download_checksum=checksum,
+                        download_validator=validator,
+                    ))
+
+            mime_type = server.save_image_response(data['response'], part_path, offset, on_progress)
+            if mime_type is None:
+                return None
+
+            source = part_path
+        else:
+            source = data['buffer']
+            mime_type = data['mime_type']
+            size = len(source)
+            checksum = hashlib.sha1(source).hexdigest()
+
+        pipeline = ImagePipeline()
+        if mime_type == 'image/webp':
+            # WebP images are converted to JPEG, unless page file name has another image extension (content must match it)
+            pipeline.add_stage(lambda image: image.convert('RGB'), format='jpeg')
+        if self.scrambled:
+            pipeline.add_stage(unscramble_image)
+
+        if pipeline.stages:
+            pipeline.submit(source, page_path).result()
+        else:
+            if 'response' not in data:
+                with open(part_path, 'wb') as fp:
+                    fp.write(source)
+            os.replace(part_path, page_path)
+
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+
+        if page['image'] is None:
+            self.update_page(page_index, dict(image=data['name']))
+        self.update_page_journal(page_index, dict(
+            download_status='complete',
+            download_offset=size,
+            download_checksum=checksum,
+            download_validator=None,
+        ))
+
+        if not self.downloaded:
+            nb_pending_pages = get_db_connection().execute(
+                "SELECT count() FROM pages WHERE chapter_id = ? AND download_status != 'complete'", (self.id, )).fetchone()[0]
+            if nb_pending_pages == 0:
+                self.update(dict(downloaded=1))
+
+        return page_path
+
+    def pack(self):
+        """Packs downloaded pages images in a CBZ archive (uncompressed ZIP file), in pages order
+
+        Archive is written atomically, then pages folder is removed.
+        Pages images already packed (chapter packed before, pages downloaded again) are kept.
+
+        :return: True on success False otherwise
+        """
+        if not self.pages:
+            return False
+
+        paths = [self.get_page_path(index) for index in range(len(self.pages))]
+        if None in paths:
+            # Chapter is not fully downloaded
+            return False
+
+        if all(get_archive_member(path)[0] is not None for path in paths):
+            # Already packed
+            return True
+
+        tmp_path = '{0}.{1}.part'.format(self.archive_path, threading.get_ident())
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+                names = set()
+                for path in paths:
+                    name = os.path.basename(path)
+                    if name in names:
+                        continue
+                    names.add(name)
+
+                    if get_archive_member(path)[0] is None:
+                        archive.write(path, name)
+                    else:
+                        with open_file(path) as fp:
+                            archive.writestr(name, fp.read())
+        except OSError as e:
+            logger.warning('Failed to pack chapter {0}: {1}'.format(self.archive_path, e))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+
+        os.replace(tmp_path, self.archive_path)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+        return True
+
     def reset(self):
         if os.path.exists(self.path):
             shutil.rmtree(self.path)
+        if os.path.exists(self.archive_path):
+            os.unlink(self.archive_path)
 
         self.update(dict(
             pages=None,
@@ -729,6 +1383,19 @@ class Chapter:
             last_page_read_index=None,
         ))
 
+    def set_read_status(self, read, last_page_read_index=None):
+        """Updates read status of chapter (and its pages) once stored by `update_chapters_read_status()`
+
+        No query is run: pages are updated only if they are already loaded.
+        """
+        if self._pages_loaded and self._pages:
+            for page in self._pages:
+                page['read'] = read
+
+        self.last_page_read_index = last_page_read_index
+        self.read = read
+        self.recent = False
+
     def update(self, data):
         """
         Updates specific fields
@@ -741,11 +1408,21 @@ class Chapter:
         for key in data:
             setattr(self, key, data[key])
 
-        db_conn = create_db_connection()
-        with db_conn:
-            ret = update_row(db_conn, 'chapters', self.id, data)
+        data = data.copy()
+        has_pages = 'pages' in data
+        pages = data.pop('pages', None)
 
-        db_conn.close()
+        with db_writer() as db_conn:
+            ret = update_row(db_conn, 'chapters', self.id, data) if data else True
+
+            if ret and has_pages:
+                # Pages are replaced
+                db_conn.execute('DELETE FROM pages WHERE chapter_id = ?', (self.id, ))
+                if pages:
+                    ret = insert_pages(db_conn, self.id, pages)
+
+        if ret and ('downloaded' in data or 'read' in data or 'recent' in data):
+            invalidate_mangas_stats()
 
         return ret
 
@@ -766,6 +1443,68 @@ class Chapter:
 
         return self.update(data)
 
+    def update_pages(self, data):
+        """
+        Updates specific fields of all pages
+
+        :param dict data: fields to update (slug, image, read, bbox, mtime or size)
+        :return: True on success False otherwise
+        """
+        if self.pages:
+            for page in self.pages:
+                page.update(data)
+
+        try:
+            with db_writer() as db_conn:
+                db_conn.execute(
+                    'UPDATE pages SET {0} WHERE chapter_id = ?'.format(', '.join(k + ' = ?' for k in data)),
+                    tuple(data.values()) + (self.id, )
+                )
+            return True
+        except Exception as e:
+            print('SQLite-error:', e, data)
+            return False
+
+    def update_page(self, index, data):
+        """
+        Updates specific fields of a page
+
+        :param int index: page index
+        :param dict data: fields to update (slug, image, read, bbox, mtime or size)
+        :return: True on success False otherwise
+        """
+        self.pages[index].update(data)
+
+        try:
+            with db_writer() as db_conn:
+                db_conn.execute(
+                    'UPDATE pages SET {0} WHERE chapter_id = ? AND "index" = ?'.format(', '.join(k + ' = ?' for k in data)),
+                    tuple(data.values()) + (self.id, index)
+                )
+            return True
+        except Exception as e:
+            print('SQLite-error:', e, data)
+            return False
+
+    def update_page_journal(self, index, data):
+        """
+        Updates download journal of a page (see `get_page_journal`)
+
+        :param int index: page index
+        :param dict data: fields to update (download_status, download_offset, download_checksum or download_validator)
+        :return: True on success False otherwise
+        """
+        try:
+            with db_writer() as db_conn:
+                db_conn.execute(
+                    'UPDATE pages SET {0} WHERE chapter_id = ? AND "index" = ?'.format(', '.join(k + ' = ?' for k in data)),
+                    tuple(data.values()) + (self.id, index)
+                )
+            return True
+        except Exception as e:
+            print('SQLite-error:', e, data)
+            return False
+
 
 class Download:
     _chapter = None
@@ -779,9 +1518,7 @@ class Download:
 
     @classmethod
     def get(cls, id):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT * FROM downloads WHERE id = ?', (id,)).fetchone()
-        db_conn.close()
+        row = get_db_connection().execute('SELECT * FROM downloads WHERE id = ?', (id,)).fetchone()
 
         if row is None:
             return None
@@ -794,9 +1531,7 @@ class Download:
 
     @classmethod
     def get_by_chapter_id(cls, chapter_id):
-        db_conn = create_db_connection()
-        row = db_conn.execute('SELECT * FROM downloads WHERE chapter_id = ?', (chapter_id,)).fetchone()
-        db_conn.close()
+        row = get_db_connection().execute('SELECT * FROM downloads WHERE chapter_id = ?', (chapter_id,)).fetchone()
 
         if row:
             d = cls()
@@ -810,12 +1545,11 @@ class Download:
 
     @classmethod
     def next(cls, exclude_errors=False):
-        db_conn = create_db_connection()
+        db_conn = get_db_connection()
         if exclude_errors:
             row = db_conn.execute('SELECT * FROM downloads WHERE status = "pending" ORDER BY date ASC').fetchone()
         else:
             row = db_conn.execute('SELECT * FROM downloads ORDER BY date ASC').fetchone()
-        db_conn.close()
 
         if row:
             c = cls()
@@ -835,13 +1569,9 @@ class Download:
         return self._chapter
 
     def delete(self):
-        db_conn = create_db_connection()
-
-        with db_conn:
+        with db_writer() as db_conn:
             db_conn.execute('DELETE FROM downloads WHERE id = ?', (self.id, ))
 
-        db_conn.close()
-
     def update(self, data):
         """
         Updates download
@@ -849,16 +1579,87 @@ class Download:
         :param data: percent of pages downloaded, errors or status
         :return: True on success False otherwise
         """
-
-        db_conn = create_db_connection()
         result = False
 
-        with db_conn:
+        with db_writer() as db_conn:
             if update_row(db_conn, 'downloads', self.id, data):
                 result = True
                 for key in data:
                     setattr(self, key, data[key])
 
-        db_conn.close()
-
         return result
+
+
+class ProgressJournal:
+    """Reading progress journal
+
+    Collects reading progress (pages read, last page read, last read time) in memory.
+    Progress is written in a single transaction when journal is flushed:
+    periodically, when chapter changes and when reader is left or application quits.
+    """
+
+    def __init__(self):
+        self.chapters = {}  # Chapter ID => (chapter, set of read pages indexes, last page read index)
+        self.lock = threading.Lock()
+        self.mangas = {}    # Manga ID => last read datetime
+
+    def add(self, chapter, page_index):
+        """Records a read page
+
+        Pending progress of another chapter is flushed first.
+
+        :param chapter: Chapter
+        :param page_index: Index of page read
+        """
+        if self.chapters and chapter.id not in self.chapters:
+            self.flush()
+
+        now = datetime.datetime.now()
+
+        with self.lock:
+            _chapter, pages_indexes, _last_page_read_index = self.chapters.get(chapter.id, (None, set(), None))
+            pages_indexes.add(page_index)
+            self.chapters[chapter.id] = (chapter, pages_indexes, page_index)
+            self.mangas[chapter.manga_id] = now
+
+        # Keep in memory objects up to date
+        chapter.manga.last_read = now
+        chapter.pages[page_index]['read'] = True
+        chapter.last_page_read_index = page_index
+        chapter.read = all(page.get('read') for page in chapter.pages)
+        chapter.recent = 0
+
+    def flush(self):
+        """Writes pending progress"""
+
+        with self.lock:
+            chapters = self.chapters
+            mangas = self.mangas
+            self.chapters = {}
+            self.mangas = {}
+
+        if not chapters and not mangas:
+            return
+
+        with db_writer() as db_conn:
+            for manga_id, last_read in mangas.items():
+                update_row(db_conn, 'mangas', manga_id, dict(last_read=last_read))
+
+            for chapter, pages_indexes, last_page_read_index in chapters.values():
+                # Several chapter objects may exist for the same chapter, merge read pages
+                for index in pages_indexes:
+                    chapter.pages[index]['read'] = True
+
+                db_conn.executemany(
+                    'UPDATE pages SET read = 1 WHERE chapter_id = ? AND "index" = ?',
+                    [(chapter.id, index) for index in pages_indexes]
+                )
+                nb_unread_pages = db_conn.execute('SELECT count() FROM pages WHERE chapter_id = ? AND read = 0', (chapter.id, )).fetchone()[0]
+
+                update_row(db_conn, 'chapters', chapter.id, dict(
+                    last_page_read_index=last_page_read_index,
+                    read=nb_unread_pages == 0,
+                    recent=0,
+                ))
+
+        invalidate_mangas_stats()
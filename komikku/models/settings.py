@@ -72,6 +72,14 @@ class Settings(Gio.Settings):
     def borders_crop(self, state):
         self.set_boolean('borders-crop', state)
 
+    @property
+    def chapters_cbz_storage(self):
+        return self.get_boolean('chapters-cbz-storage')
+
+    @chapters_cbz_storage.setter
+    def chapters_cbz_storage(self, state):
+        self.set_boolean('chapters-cbz-storage', state)
+
     @property
     def credentials_storage_plaintext_fallback(self):
         return self.get_boolean('credentials-storage-plaintext-fallback')
@@ -144,6 +152,14 @@ class Settings(Gio.Settings):
     def nsfw_content(self, state):
         self.set_boolean('nsfw-content', state)
 
+    @property
+    def prefetch_pages(self):
+        return self.get_int('prefetch-pages')
+
+    @prefetch_pages.setter
+    def prefetch_pages(self, value):
+        self.set_int('prefetch-pages', value)
+
     @property
     def reading_mode(self):
         """Return the reader's reading mode"""
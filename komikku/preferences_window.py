@@ -3,12 +3,17 @@
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
 from gettext import gettext as _
+from gettext import ngettext as n_
+import threading
 
 from gi.repository import Gio
+from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository import Handy
 
+from komikku.models import pack_downloaded_chapters
 from komikku.models import Settings
+from komikku.servers import get_server_class
 from komikku.servers import get_server_main_id_by_id
 from komikku.servers import get_servers_list
 from komikku.servers import LANGUAGES
@@ -28,6 +33,7 @@ class PreferencesWindow(Handy.PreferencesWindow):
 
     update_at_startup_switch = Gtk.Template.Child('update_at_startup_switch')
     new_chapters_auto_download_switch = Gtk.Template.Child('new_chapters_auto_download_switch')
+    chapters_cbz_storage_switch = Gtk.Template.Child('chapters_cbz_storage_switch')
     nsfw_content_switch = Gtk.Template.Child('nsfw_content_switch')
     servers_languages_actionrow = Gtk.Template.Child('servers_languages_actionrow')
     servers_languages_subpage = Gtk.Template.Child('servers_languages_subpage')
@@ -44,6 +50,7 @@ class PreferencesWindow(Handy.PreferencesWindow):
     background_color_row = Gtk.Template.Child('background_color_row')
     borders_crop_switch = Gtk.Template.Child('borders_crop_switch')
     fullscreen_switch = Gtk.Template.Child('fullscreen_switch')
+    prefetch_pages_spinbutton = Gtk.Template.Child('prefetch_pages_spinbutton')
 
     credentials_storage_plaintext_fallback_switch = Gtk.Template.Child('credentials_storage_plaintext_fallback_switch')
 
@@ -87,6 +94,10 @@ class PreferencesWindow(Handy.PreferencesWindow):
         self.new_chapters_auto_download_switch.set_active(self.settings.new_chapters_auto_download)
         self.new_chapters_auto_download_switch.connect('notify::active', self.on_new_chapters_auto_download_changed)
 
+        # CBZ storage of downloaded chapters
+        self.chapters_cbz_storage_switch.set_active(self.settings.chapters_cbz_storage)
+        self.chapters_cbz_storage_switch.connect('notify::active', self.on_chapters_cbz_storage_changed)
+
         # Servers languages
         PreferencesServersLanguagesSubpage(self)
 
@@ -144,6 +155,10 @@ class PreferencesWindow(Handy.PreferencesWindow):
         self.fullscreen_switch.set_active(self.settings.fullscreen)
         self.fullscreen_switch.connect('notify::active', self.on_fullscreen_changed)
 
+        # Pages prefetch
+        self.prefetch_pages_spinbutton.set_value(self.settings.prefetch_pages)
+        self.prefetch_pages_spinbutton.connect('value-changed', self.on_prefetch_pages_changed)
+
         #
         # Advanced
         #
@@ -163,6 +178,25 @@ class PreferencesWindow(Handy.PreferencesWindow):
     def on_borders_crop_changed(self, switch_button, gparam):
         self.settings.borders_crop = switch_button.get_active()
 
+    def on_chapters_cbz_storage_changed(self, switch_button, gparam):
+        self.settings.chapters_cbz_storage = switch_button.get_active()
+        if not self.settings.chapters_cbz_storage:
+            # Existing archives are kept, they remain readable
+            return
+
+        def run():
+            # Chapters already downloaded are packed too
+            nb_packed = pack_downloaded_chapters()
+            if nb_packed > 0:
+                GLib.idle_add(
+                    self.parent.show_notification,
+                    n_('{0} downloaded chapter stored in a CBZ archive', '{0} downloaded chapters stored in CBZ archives', nb_packed).format(nb_packed)
+                )
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
     def on_credentials_storage_plaintext_fallback_changed(self, switch_button, gparam):
         self.settings.credentials_storage_plaintext_fallback = switch_button.get_active()
 
@@ -195,6 +229,9 @@ class PreferencesWindow(Handy.PreferencesWindow):
         else:
             self.settings.nsfw_content = False
 
+    def on_prefetch_pages_changed(self, spin_button):
+        self.settings.prefetch_pages = spin_button.get_value_as_int()
+
     def on_reading_mode_changed(self, row, param):
         index = row.get_selected_index()
 
@@ -309,7 +346,9 @@ class PreferencesServersSettingsSubpage:
                 servers_data[main_id] = dict(
                     main_id=main_id,
                     name=server_data['name'],
-                    module=server_data['module'],
+                    module_name=server_data['module_name'],
+                    class_name=main_id.capitalize(),
+                    has_login=server_data['has_login'],
                     langs=[],
                 )
 
@@ -320,8 +359,7 @@ class PreferencesServersSettingsSubpage:
             if not server_data['langs']:
                 continue
 
-            server_class = getattr(server_data['module'], server_data['main_id'].capitalize())
-            has_login = getattr(server_class, 'has_login')
+            has_login = server_data['has_login']
 
             server_settings = settings.get(server_main_id)
             server_enabled = server_settings is None or server_settings['enabled'] is True
@@ -398,7 +436,7 @@ class PreferencesServersSettingsSubpage:
                     btn = Gtk.Button(_('Test'))
                     btn.connect(
                         'clicked', self.save_credential,
-                        server_main_id, server_class, username_entry, password_entry, plaintext_checkbutton
+                        server_main_id, server_data, username_entry, password_entry, plaintext_checkbutton
                     )
                     btn.set_always_show_image(True)
                     box.pack_start(btn, False, False, 0)
@@ -433,10 +471,10 @@ class PreferencesServersSettingsSubpage:
     def on_server_language_activated(self, switch_button, gparam, server_main_id, lang):
         self.settings.toggle_server_lang(server_main_id, lang, switch_button.get_active())
 
-    def save_credential(self, button, server_main_id, server_class, username_entry, password_entry, plaintext_checkbutton):
+    def save_credential(self, button, server_main_id, server_data, username_entry, password_entry, plaintext_checkbutton):
         username = username_entry.get_text()
         password = password_entry.get_text()
-        server = server_class(username=username, password=password)
+        server = get_server_class(server_data)(username=username, password=password)
 
         if server.logged_in:
             button.set_image(Gtk.Image.new_from_icon_name('object-select-symbolic', Gtk.IconSize.MENU))
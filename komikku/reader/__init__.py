@@ -4,19 +4,23 @@
 
 from gettext import gettext as _
 import os
-import shutil
 
 from gi.repository import Gdk
 from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import Gtk
 
+from komikku.models import ProgressJournal
 from komikku.models import Settings
 from komikku.reader.controls import Controls
 from komikku.reader.pager import Pager
 from komikku.reader.pager.webtoon import WebtoonPager
-from komikku.servers import get_file_mime_type
+from komikku.servers import get_buffer_mime_type
 from komikku.utils import is_flatpak
+from komikku.utils import open_file
+
+# Interval (in seconds) between writes of reading progress
+PROGRESS_FLUSH_INTERVAL = 5
 
 
 class Reader:
@@ -47,6 +51,10 @@ class Reader:
         # Controls
         self.controls = Controls(self)
 
+        # Reading progress
+        self.progress_journal = ProgressJournal()
+        GLib.timeout_add_seconds(PROGRESS_FLUSH_INTERVAL, self.on_progress_flush_timeout)
+
     @property
     def background_color(self):
         return self.manga.background_color or Settings.get_default().background_color
@@ -157,6 +165,11 @@ class Reader:
         self.set_action_borders_crop()
         self.pager.crop_pages_borders()
 
+    def on_progress_flush_timeout(self):
+        self.progress_journal.flush()
+
+        return GLib.SOURCE_CONTINUE
+
     def on_reading_mode_changed(self, action, variant):
         value = variant.get_string()
         if value == self.reading_mode:
@@ -195,7 +208,11 @@ class Reader:
         if page.status != 'rendered' or page.error is not None:
             return
 
-        extension = get_file_mime_type(page.path).split('/')[-1]
+        # Page image can be stored in chapter archive
+        with open_file(page.path) as fp:
+            data = fp.read()
+
+        extension = get_buffer_mime_type(data).split('/')[-1]
         filename = f'{self.manga.name}_{page.chapter.title}_{str(page.index + 1)}.{extension}'
 
         success = False
@@ -229,7 +246,8 @@ class Reader:
                 self.window.show_notification(_('Failed to save page: missing permission to access the XDG pictures directory'))
 
         if success:
-            shutil.copy(page.path, dest_path)
+            with open(dest_path, 'wb') as fp:
+                fp.write(data)
             self.window.show_notification(_('Page successfully saved to {0}').format(dest_path.replace(os.path.expanduser('~'), '~')))
 
     def set_action_background_color(self):
@@ -3,7 +3,6 @@
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
 from abc import abstractmethod
-import datetime
 from gettext import gettext as _
 
 from gi.repository import Gdk
@@ -12,7 +11,9 @@ from gi.repository import Gtk
 from gi.repository import Handy
 from gi.repository.GdkPixbuf import InterpType
 
+from komikku.models import Settings
 from komikku.reader.pager.page import Page
+from komikku.reader.pager.prefetcher import Prefetcher
 
 
 class BasePager:
@@ -59,7 +60,7 @@ class BasePager:
     def crop_pages_borders(self):
         for page in self.pages:
             if page.status == 'rendered' and page.error is None:
-                page.set_image()
+                page.rescale()
 
     def disable_keyboard_and_mouse_click_navigation(self):
         # Keyboard
@@ -134,6 +135,7 @@ class BasePager:
             self.set_interactive(False)
 
             image = page.image
+            page.load_imagebuf()
             pixbuf = page.imagebuf.get_pixbuf()
 
             # Record hadjustment and vadjustment values
@@ -243,28 +245,9 @@ class BasePager:
         if page.status != 'rendered' or page.error is not None:
             return GLib.SOURCE_REMOVE
 
-        chapter = page.chapter
-
-        # Update manga last read time
-        self.reader.manga.update(dict(last_read=datetime.datetime.now()))
-
-        # Mark page as read
-        chapter.pages[page.index]['read'] = True
-
-        # Check if chapter has been fully read
-        chapter_is_read = True
-        for chapter_page in reversed(chapter.pages):
-            if not chapter_page.get('read'):
-                chapter_is_read = False
-                break
-
-        # Update chapter
-        chapter.update(dict(
-            pages=chapter.pages,
-            last_page_read_index=page.index,
-            read=chapter_is_read,
-            recent=0,
-        ))
+        # Mark page as read, update manga last read time and chapter last page read
+        # Progress is recorded in reader's journal, written to database later
+        self.reader.progress_journal.add(page.chapter, page.index)
 
         return GLib.SOURCE_REMOVE
 
@@ -282,11 +265,14 @@ class Pager(Handy.Carousel, BasePager):
 
     current_chapter_id = None
     init_flag = False
+    reading_direction = 1  # 1 when reading forward, -1 when reading backward
 
     def __init__(self, reader):
         Handy.Carousel.__init__(self)
         BasePager.__init__(self, reader)
 
+        self.prefetcher = Prefetcher(reader.manga, Settings.get_default().prefetch_pages)
+
         self.set_animation_duration(500)
         self.set_allow_mouse_drag(False)
 
@@ -318,6 +304,12 @@ class Pager(Handy.Carousel, BasePager):
         new_page.connect('rendered', self.on_page_rendered)
         new_page.render()
 
+    def clear(self):
+        # Cancel prefetching in progress (user jumps to another page or leaves)
+        self.prefetcher.cancel()
+
+        BasePager.clear(self)
+
     def goto_page(self, index):
         if self.pages[0].index == index and self.pages[0].chapter == self.current_page.chapter:
             self.scroll_to_direction('left')
@@ -497,6 +489,12 @@ class Pager(Handy.Carousel, BasePager):
             if index != 1:
                 # Add next page depending of navigation direction
                 self.add_page('start' if index == 0 else 'end')
+
+                self.reading_direction = 1 if (index == 2) != (self.reader.reading_mode == 'right-to-left') else -1
+
+            # Download and decode next pages in reading direction
+            # The first one is skipped, it's already rendered by the newly added page
+            self.prefetcher.start(page.chapter, page.index, self.reading_direction, page.get_decoding_params())
         elif page.index == 0:
             self.window.show_notification(_('This chapter is inaccessible.'), 2)
 
@@ -2,7 +2,9 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from concurrent.futures import ThreadPoolExecutor
 from gettext import gettext as _
+import math
 import threading
 
 from gi.repository import Gdk
@@ -13,8 +15,128 @@ from gi.repository.GdkPixbuf import PixbufAnimation
 
 from komikku.activity_indicator import ActivityIndicator
 from komikku.utils import crop_pixbuf
+from komikku.utils import get_archive_member
 from komikku.utils import Imagebuf
 from komikku.utils import log_error_traceback
+from komikku.utils import pixbuf_cache
+from komikku.utils import TiledPixbuf
+
+# Number of threads used to decode and scale pages images
+PAGE_DECODE_WORKERS = 2
+
+# Images taller than this height (in device pixels) once scaled are rendered by bands (webtoon reading mode only)
+TILED_IMAGE_MIN_HEIGHT = 4096
+# Number of bands kept in memory above and below visible area of a tiled image
+TILED_IMAGE_BANDS_MARGIN = 2
+
+decode_executor = ThreadPoolExecutor(max_workers=PAGE_DECODE_WORKERS, thread_name_prefix='page-decode')
+
+
+def decode_page_image(path, width, height, reader_scaling, scaling, borders_crop, hidpi_scale, get_borders_crop_bbox=None, tiling=False):
+    """Decodes page image, crops its borders and scales it
+
+    Heavy part of page rendering, run in a worker thread: GTK widgets must not be used here.
+
+    :param path: Image file path (None if page image is missing)
+    :param width: Reader width
+    :param height: Reader height
+    :param reader_scaling: Reader scaling setting
+    :param scaling: Effective scaling (always 'width' in webtoon reading mode)
+    :param borders_crop: Whether image borders must be cropped
+    :param hidpi_scale: Window HiDPI scale factor
+    :param get_borders_crop_bbox: Optional function returning stored borders crop bbox (bbox is computed otherwise)
+    :param tiling: Whether very tall images can be rendered by bands (a TiledPixbuf is returned in place of a pixbuf)
+    :return: A tuple (imagebuf, pixbuf, surface, corrupt), imagebuf is None if pixbuf comes from cache or is tiled
+             (full size image is released, see `Page.load_imagebuf`), surface is None if image is animated or tiled
+    """
+    cache_key = pixbuf_cache.get_key(path, width, height, reader_scaling, scaling, borders_crop, hidpi_scale) if path else None
+
+    imagebuf = None
+    corrupt = False
+    pixbuf = pixbuf_cache.get(cache_key) if cache_key is not None else None
+    if pixbuf is None:
+        imagebuf, corrupt = load_page_imagebuf(path)
+
+        borders_crop_bbox = None
+        if borders_crop == 1 and not corrupt and get_borders_crop_bbox is not None:
+            borders_crop_bbox = get_borders_crop_bbox()
+
+        pixbuf = get_page_pixbuf(imagebuf, width, height, reader_scaling, scaling, borders_crop, hidpi_scale, borders_crop_bbox, tiling)
+
+        if isinstance(pixbuf, TiledPixbuf):
+            imagebuf = None
+        elif cache_key is not None and not corrupt and not imagebuf.animated:
+            pixbuf_cache.set(cache_key, pixbuf)
+
+    if not isinstance(pixbuf, (PixbufAnimation, TiledPixbuf)):
+        surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, hidpi_scale)
+    else:
+        surface = None
+
+    return imagebuf, pixbuf, surface, corrupt
+
+
+def get_page_pixbuf(imagebuf, width, height, reader_scaling, scaling, borders_crop, hidpi_scale, borders_crop_bbox=None, tiling=False):
+    """Returns image pixbuf, borders cropped and scaled according to reader size and settings
+
+    If tiling is allowed, a TiledPixbuf is returned for very tall images.
+    """
+
+    # Crop image borders
+    imagebuf = imagebuf.crop_borders(borders_crop_bbox) if borders_crop == 1 else imagebuf
+
+    if tiling and scaling == 'width' and not imagebuf.animated:
+        scaled_height = int(imagebuf.height / (imagebuf.width / width) * hidpi_scale)
+        if scaled_height > TILED_IMAGE_MIN_HEIGHT:
+            return TiledPixbuf(imagebuf.get_pixbuf(), int(width * hidpi_scale), scaled_height)
+
+    # Adjust image
+    if reader_scaling != 'original':
+        adapt_to_width_height = imagebuf.height / (imagebuf.width / width)
+        adapt_to_height_width = imagebuf.width / (imagebuf.height / height)
+
+        if not imagebuf.animated:
+            if scaling == 'width' or (scaling == 'screen' and adapt_to_width_height <= height):
+                # Adapt image to width
+                pixbuf = imagebuf.get_scaled_pixbuf(width, adapt_to_width_height, False, hidpi_scale)
+            elif scaling == 'height' or (scaling == 'screen' and adapt_to_height_width <= width):
+                # Adapt image to height
+                pixbuf = imagebuf.get_scaled_pixbuf(adapt_to_height_width, height, False, hidpi_scale)
+        else:
+            # NOTE: Special case of animated images (GIF)
+            # They cannot be cropped, which would prevent navigation by 2-finger swipe gesture
+            # Moreover, it's more comfortable to view them in their entirety (fit viewport)
+
+            if adapt_to_width_height <= height:
+                # Adapt image to width
+                pixbuf = imagebuf.get_scaled_pixbuf(width, adapt_to_width_height, False, hidpi_scale)
+            elif adapt_to_height_width <= width:
+                # Adapt image to height
+                pixbuf = imagebuf.get_scaled_pixbuf(adapt_to_height_width, height, False, hidpi_scale)
+    else:
+        pixbuf = imagebuf.get_pixbuf()
+
+    return pixbuf
+
+
+def load_page_imagebuf(path):
+    """Loads a page image file
+
+    A corrupt file is deleted (to be downloaded again on retry) and replaced by the 'missing file' image.
+    Images stored in chapters archives are never deleted.
+
+    :return: A tuple (imagebuf, corrupt)
+    """
+    if path is None:
+        return Imagebuf.new_from_resource('/info/febvre/Komikku/images/missing_file.png'), False
+
+    imagebuf = Imagebuf.new_from_file(path)
+    if imagebuf is None:
+        if get_archive_member(path)[0] is None:
+            GLib.unlink(path)
+        return Imagebuf.new_from_resource('/info/febvre/Komikku/images/missing_file.png'), True
+
+    return imagebuf, False
 
 
 class Page(Gtk.Overlay):
@@ -48,8 +170,11 @@ class Page(Gtk.Overlay):
         self.scrolledwindow.set_policy(policy_type, policy_type)
         self.viewport = Gtk.Viewport()
         self.image = Gtk.Image()
+        self.tiled_image = None  # Used in place of image to display very tall images
         self.imagebuf = None
+        self.pixbuf = None
         self.surface = None
+        self.decoding_id = 0
         self.viewport.add(self.image)
         self.scrolledwindow.add(self.viewport)
         self.add(self.scrolledwindow)
@@ -81,7 +206,7 @@ class Page(Gtk.Overlay):
 
     @property
     def animated(self):
-        return self.imagebuf.animated
+        return self.imagebuf.animated if self.imagebuf is not None else False
 
     @property
     def loaded(self):
@@ -93,9 +218,92 @@ class Page(Gtk.Overlay):
 
         self.status = 'cleaned'
         self.loadable = False
+        self.decoding_id += 1  # Discard decoding in progress
         self.imagebuf = None
+        self.pixbuf = None
         self.surface = None
         self.image.clear()
+        if self.tiled_image is not None:
+            self.tiled_image.clear()
+
+    def decode(self, retry=False):
+        """Decodes and scales image in a worker thread then displays it
+
+        Only the display of the ready surface happens in main loop.
+        Result of a previous decoding still in progress is discarded.
+
+        :param retry: Whether a retry of page rendering is in progress (forwarded to `rendered` signal)
+        """
+        def complete(decoding_id, params, imagebuf, pixbuf, surface, corrupt):
+            if decoding_id != self.decoding_id or self.status == 'cleaned' or self.get_parent() is None:
+                return False
+
+            if params != self.get_decoding_params():
+                # Reader has been resized or settings changed during decoding
+                self.decode(retry)
+                return False
+
+            if corrupt:
+                self.show_retry_button()
+                self.window.show_notification(_('Failed to load image'), 2)
+
+                self.error = 'corrupt_file'
+
+            self.imagebuf = imagebuf
+            self.pixbuf = pixbuf
+            self.surface = surface
+
+            if self.status == 'rendering':
+                self.status = 'render'
+                self.set_image()
+                self.status = 'rendered'
+                self.emit('rendered', retry)
+            else:
+                self.set_image()
+
+            return False
+
+        def run(decoding_id, path, params, chapter, index, tiling):
+            if decoding_id != self.decoding_id:
+                # Page has been cleaned or a new decoding has been requested
+                return
+
+            def get_borders_crop_bbox():
+                return chapter.get_page_borders_crop_bbox(index)
+
+            try:
+                result = decode_page_image(
+                    path, *params,
+                    get_borders_crop_bbox=get_borders_crop_bbox if path else None,
+                    tiling=tiling
+                )
+            except Exception as e:
+                log_error_traceback(e)
+                result = decode_page_image(None, *params)[:3] + (True, )
+
+            GLib.idle_add(complete, decoding_id, params, *result)
+
+        self.decoding_id += 1
+        decode_executor.submit(
+            run, self.decoding_id, self.path, self.get_decoding_params(), self.chapter, self.index, self.reader.reading_mode == 'webtoon')
+
+    def get_decoding_params(self):
+        return (
+            self.reader.size.width,
+            self.reader.size.height,
+            self.reader.scaling,
+            self.reader.scaling if self.reader.reading_mode != 'webtoon' else 'width',
+            self.reader.manga.borders_crop,
+            self.window.hidpi_scale,
+        )
+
+    def load_imagebuf(self):
+        """Loads full size image if not already done
+
+        Not kept when page pixbuf comes from cache, but required by zoom.
+        """
+        if self.imagebuf is None:
+            self.imagebuf, _corrupt = load_page_imagebuf(self.path)
 
     def on_button_retry_clicked(self, button):
         button.destroy()
@@ -163,10 +371,7 @@ class Page(Gtk.Overlay):
                 # Page has been removed from pager
                 return False
 
-            self.status = 'render'
-            self.set_image()
-            self.status = 'rendered'
-            self.emit('rendered', retry)
+            self.decode(retry)
 
             return False
 
@@ -242,6 +447,8 @@ class Page(Gtk.Overlay):
             return
 
         self.imagebuf = None
+        self.pixbuf = None
+        self.surface = None
         self.status = 'rendering'
         self.error = None
 
@@ -253,58 +460,24 @@ class Page(Gtk.Overlay):
 
     def rescale(self):
         if self.status == 'rendered':
-            self.set_image()
+            self.decode()
 
     def resize(self):
         self.set_size()
 
         if self.status == 'rendered':
-            self.set_image()
+            self.decode()
 
     def set_image(self, crop=None):
-        if self.imagebuf is None:
-            if self.path is None:
-                self.imagebuf = Imagebuf.new_from_resource('/info/febvre/Komikku/images/missing_file.png')
-            else:
-                self.imagebuf = Imagebuf.new_from_file(self.path)
-                if self.imagebuf is None:
-                    GLib.unlink(self.path)
-
-                    self.show_retry_button()
-                    self.window.show_notification(_('Failed to load image'), 2)
-
-                    self.error = 'corrupt_file'
-                    self.imagebuf = Imagebuf.new_from_resource('/info/febvre/Komikku/images/missing_file.png')
-
-        # Crop image borders
-        imagebuf = self.imagebuf.crop_borders() if self.reader.manga.borders_crop == 1 else self.imagebuf
-
-        # Adjust image
-        scaling = self.reader.scaling if self.reader.reading_mode != 'webtoon' else 'width'
-        if self.reader.scaling != 'original':
-            adapt_to_width_height = imagebuf.height / (imagebuf.width / self.reader.size.width)
-            adapt_to_height_width = imagebuf.width / (imagebuf.height / self.reader.size.height)
-
-            if not self.animated:
-                if scaling == 'width' or (scaling == 'screen' and adapt_to_width_height <= self.reader.size.height):
-                    # Adapt image to width
-                    pixbuf = imagebuf.get_scaled_pixbuf(self.reader.size.width, adapt_to_width_height, False, self.window.hidpi_scale)
-                elif scaling == 'height' or (scaling == 'screen' and adapt_to_height_width <= self.reader.size.width):
-                    # Adapt image to height
-                    pixbuf = imagebuf.get_scaled_pixbuf(adapt_to_height_width, self.reader.size.height, False, self.window.hidpi_scale)
-            else:
-                # NOTE: Special case of animated images (GIF)
-                # They cannot be cropped, which would prevent navigation by 2-finger swipe gesture
-                # Moreover, it's more comfortable to view them in their entirety (fit viewport)
-
-                if adapt_to_width_height <= self.reader.size.height:
-                    # Adapt image to width
-                    pixbuf = imagebuf.get_scaled_pixbuf(self.reader.size.width, adapt_to_width_height, False, self.window.hidpi_scale)
-                elif adapt_to_height_width <= self.reader.size.width:
-                    # Adapt image to height
-                    pixbuf = imagebuf.get_scaled_pixbuf(adapt_to_height_width, self.reader.size.height, False, self.window.hidpi_scale)
-        else:
-            pixbuf = imagebuf.get_pixbuf()
+        """Displays decoded image
+
+        :param crop: Optional side to crop to keep only the visible part of image
+        """
+        pixbuf = self.pixbuf
+        surface = self.surface
+        if pixbuf is None:
+            # Image is not decoded yet
+            return
 
         if crop is not None:
             # The 'crop' argument allows the image to be cropped to keep only its visible part
@@ -327,19 +500,40 @@ class Page(Gtk.Overlay):
                     0, pixbuf.get_height() - self.reader.size.height * self.window.hidpi_scale,
                     self.reader.size.width * self.window.hidpi_scale, self.reader.size.height * self.window.hidpi_scale
                 )
+            surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, self.window.hidpi_scale)
             self.cropped = True
         else:
             self.cropped = False
 
-        if isinstance(pixbuf, PixbufAnimation):
-            self.image.set_from_animation(pixbuf)
+        if isinstance(pixbuf, TiledPixbuf):
+            if self.tiled_image is None:
+                self.tiled_image = TiledImage()
+            self.set_image_widget(self.tiled_image)
+            self.tiled_image.set_tiled_pixbuf(pixbuf, self.window.hidpi_scale)
         else:
-            self.surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, self.window.hidpi_scale)
-            self.image.set_from_surface(self.surface)
+            self.set_image_widget(self.image)
+            if isinstance(pixbuf, PixbufAnimation):
+                self.image.set_from_animation(pixbuf)
+            else:
+                self.image.set_from_surface(surface)
 
         if self.reader.reading_mode == 'webtoon':
             self.set_size_request(pixbuf.get_width() / self.window.hidpi_scale, pixbuf.get_height() / self.window.hidpi_scale)
 
+    def set_image_widget(self, widget):
+        """Swaps widget used to display image (regular image or tiled image)"""
+
+        child = self.viewport.get_child()
+        if child == widget:
+            return
+
+        self.viewport.remove(child)
+        if child == self.tiled_image:
+            self.tiled_image.clear()
+
+        self.viewport.add(widget)
+        widget.show()
+
     def set_size(self):
         self.set_size_request(self.reader.size.width, self.reader.size.height)
 
@@ -355,3 +549,106 @@ class Page(Gtk.Overlay):
 
         self.add_overlay(button)
         button.show()
+
+
+class TiledImage(Gtk.DrawingArea):
+    """Displays a TiledPixbuf
+
+    Bands intersecting visible area and their neighbours are rendered in decoding workers, not in main loop.
+    They are kept in memory as long as they stay near visible area.
+    """
+
+    def __init__(self):
+        Gtk.DrawingArea.__init__(self)
+
+        self.bands = {}
+        self.hidpi_scale = 1
+        self.pending_bands = set()
+        self.tiled_pixbuf = None
+        self.visible_bands = (0, 0)
+
+        self.connect('draw', self.on_draw)
+
+    def clear(self):
+        self.bands.clear()
+        self.pending_bands.clear()
+        self.tiled_pixbuf = None
+
+    def is_band_near_visible_area(self, index):
+        first, last = self.visible_bands
+        return first - TILED_IMAGE_BANDS_MARGIN <= index <= last + TILED_IMAGE_BANDS_MARGIN
+
+    def on_draw(self, _widget, cr):
+        if self.tiled_pixbuf is None:
+            return False
+
+        band_height = self.tiled_pixbuf.band_height / self.hidpi_scale
+        _x1, y1, _x2, y2 = cr.clip_extents()
+        if y2 <= y1:
+            return False
+
+        first = max(0, int(y1 // band_height))
+        last = min(self.tiled_pixbuf.nb_bands - 1, int((y2 - 1) // band_height))
+        self.visible_bands = (first, last)
+
+        for index in range(first, last + 1):
+            surface = self.bands.get(index)
+            if surface is None:
+                # Drawn once rendered
+                continue
+
+            cr.set_source_surface(surface, 0, index * band_height)
+            cr.paint()
+
+        # Evict bands which scrolled away
+        for index in list(self.bands):
+            if not self.is_band_near_visible_area(index):
+                del self.bands[index]
+
+        # Render missing bands, visible ones first
+        indexes = list(range(first, last + 1))
+        indexes += range(max(0, first - TILED_IMAGE_BANDS_MARGIN), first)
+        indexes += range(last + 1, min(self.tiled_pixbuf.nb_bands, last + 1 + TILED_IMAGE_BANDS_MARGIN))
+        for index in indexes:
+            if index not in self.bands and index not in self.pending_bands:
+                self.render_band(index)
+
+        return False
+
+    def render_band(self, index):
+        """Renders a band (scaled pixbuf and its surface) in a worker thread"""
+
+        def complete(tiled_pixbuf, surface):
+            if tiled_pixbuf is not self.tiled_pixbuf:
+                # Image has changed or has been cleared
+                return False
+
+            self.pending_bands.discard(index)
+            if surface is not None and self.is_band_near_visible_area(index):
+                self.bands[index] = surface
+
+                band_height = tiled_pixbuf.band_height / self.hidpi_scale
+                self.queue_draw_area(0, index * band_height, self.get_allocated_width(), math.ceil(band_height))
+
+            return False
+
+        def run(tiled_pixbuf, hidpi_scale):
+            try:
+                surface = Gdk.cairo_surface_create_from_pixbuf(tiled_pixbuf.get_band(index), hidpi_scale)
+            except Exception as e:
+                log_error_traceback(e)
+                surface = None
+
+            GLib.idle_add(complete, tiled_pixbuf, surface)
+
+        self.pending_bands.add(index)
+        decode_executor.submit(run, self.tiled_pixbuf, self.hidpi_scale)
+
+    def set_tiled_pixbuf(self, tiled_pixbuf, hidpi_scale):
+        self.bands.clear()
+        self.pending_bands.clear()
+        self.hidpi_scale = hidpi_scale
+        self.tiled_pixbuf = tiled_pixbuf
+
+        self.set_size_request(tiled_pixbuf.get_width() / hidpi_scale, tiled_pixbuf.get_height() / hidpi_scale)
+        self.queue_draw()
@@ -0,0 +1,115 @@
+# Copyright (C) 2019-2020 Valéry Febvre
+# SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
+# Author: Valéry Febvre <vfebvre@easter-eggs.com>
+
+import threading
+
+from komikku.reader.pager.page import decode_page_image
+from komikku.utils import log_error_traceback
+from komikku.utils import PixbufCache
+
+# Memory budget (in bytes) of pages decoded in advance, must fit in pixbufs cache (see PIXBUF_CACHE_MAX_SIZE)
+PREFETCH_MAX_SIZE = 96 * 1024 * 1024
+
+
+class Prefetcher:
+    """Downloads and decodes pages in advance in reading direction
+
+    Runs in a background thread without creating any widget: downloaded images are stored on disk
+    and decoded (scaled) pixbufs in pixbufs cache, where pager pages find them.
+    Prefetching continues over chapters boundaries and is cancelled when a new one is started.
+    """
+
+    def __init__(self, manga, nb_pages, max_size=PREFETCH_MAX_SIZE):
+        self.manga = manga
+        self.max_size = max_size
+        self.nb_pages = nb_pages
+
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+
+    def get_next_page(self, chapter, index, direction):
+        """Returns chapter and index of page following a page in given direction
+
+        :return: A (chapter, index) tuple or (None, None) if there is no more pages
+        """
+        index += direction
+
+        while chapter is not None:
+            if not chapter.pages and not chapter.update_full():
+                return None, None
+
+            if 0 <= index < len(chapter.pages):
+                return chapter, index
+
+            # Page belongs to next (or previous) chapter
+            chapter = self.manga.get_next_chapter(chapter, direction)
+            if chapter is not None and not chapter.pages and not chapter.update_full():
+                return None, None
+
+            if chapter is not None:
+                index = 0 if direction == 1 else len(chapter.pages) - 1
+
+        return None, None
+
+    def start(self, chapter, index, direction, decoding_params, skip=1):
+        """Starts prefetching of pages following a page, cancels prefetching in progress
+
+        :param chapter: Chapter of reference page
+        :param index: Index of reference page
+        :param direction: Reading direction: 1 (next pages) or -1 (previous pages)
+        :param decoding_params: Decoding parameters of pages (see `Page.get_decoding_params`)
+        :param skip: Number of pages to skip (already handled by pager)
+        """
+        def is_cancelled():
+            return generation != self.generation
+
+        def run():
+            size = 0
+            page_chapter = chapter
+            page_index = index
+
+            for count in range(skip + self.nb_pages):
+                if is_cancelled():
+                    return
+
+                try:
+                    page_chapter, page_index = self.get_next_page(page_chapter, page_index, direction)
+                    if page_chapter is None:
+                        # First or last chapter reached
+                        return
+
+                    if count < skip:
+                        continue
+
+                    path = page_chapter.get_page(page_index)
+                    if path is None or is_cancelled() or size >= self.max_size:
+                        # Beyond memory budget, pages are only downloaded
+                        continue
+
+                    def get_borders_crop_bbox():
+                        return page_chapter.get_page_borders_crop_bbox(page_index)
+
+                    _imagebuf, pixbuf, _surface, corrupt = decode_page_image(
+                        path, *decoding_params, get_borders_crop_bbox=get_borders_crop_bbox)
+                    if not corrupt:
+                        size += PixbufCache.get_pixbuf_size(pixbuf)
+                except Exception as e:
+                    # Prefetching is opportunistic: page will be loaded normally when reached
+                    log_error_traceback(e)
+                    return
+
+        if self.nb_pages == 0:
+            return
+
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from bisect import bisect_right
 from gettext import gettext as _
 
 from gi.repository import Gdk
@@ -28,6 +29,12 @@ class WebtoonPager(Gtk.Box, BasePager):
     scroll_lock = False
     dont_ignore_scroll_adjustment = False
 
+    # Index of pages vertical offsets (prefix sums of pages heights)
+    # Rebuilt when pages are added or removed, updated incrementally when a page height changes
+    _pages_heights = None
+    _pages_offsets = None
+    _pages_positions = None
+
     def __init__(self, reader):
         Gtk.Box.__init__(self, visible=True)
         BasePager.__init__(self, reader)
@@ -43,15 +50,10 @@ class WebtoonPager(Gtk.Box, BasePager):
 
     @property
     def pages_offsets(self):
-        pages = self.pages
-
-        offsets = [0]
-        for index, page in enumerate(pages[:-1]):
-            prev = offsets[index]
-            _minimal, natural = page.get_preferred_size()
-            offsets.append(prev + natural.height)
+        if self._pages_offsets is None:
+            self.index_pages_offsets()
 
-        return offsets
+        return self._pages_offsets
 
     def add_page(self, position):
         pages = self.pages
@@ -75,8 +77,11 @@ class WebtoonPager(Gtk.Box, BasePager):
             self.add(new_page)
 
         new_page.status_changed_handler_id = new_page.connect('notify::status', self.on_page_status_changed)
+        new_page.connect('notify::height-request', self.on_page_height_changed)
         new_page.connect('rendered', self.on_page_rendered)
 
+        self.invalidate_pages_offsets()
+
     def adjust_scroll(self, value=None, emit_signal=True):
         if value is None:
             value = self.get_page_offset(self.current_page) + self.current_page_scroll_value
@@ -100,28 +105,18 @@ class WebtoonPager(Gtk.Box, BasePager):
 
         BasePager.clear(self)
 
-    def get_page_offset(self, page):
-        pages = self.pages
+        self.invalidate_pages_offsets()
 
-        offset = 0
-        for p in pages:
-            if page == p:
-                break
-            _minimal, natural = p.get_preferred_size()
-            offset += natural.height
+    def get_page_offset(self, page):
+        pages_offsets = self.pages_offsets
+        position = self._pages_positions.get(page)
 
-        return offset
+        return pages_offsets[position] if position is not None else sum(self._pages_heights)
 
     def get_position(self, scroll_value):
-        pages_offsets = self.pages_offsets
-        position = None
-
-        for i, page_offset in enumerate(reversed(pages_offsets)):
-            if scroll_value >= page_offset:
-                position = len(pages_offsets) - 1 - i
-                break
+        position = bisect_right(self.pages_offsets, scroll_value) - 1
 
-        return position
+        return position if position >= 0 else None
 
     def goto_page(self, index):
         self.init(self.current_page.chapter, index)
@@ -138,17 +133,40 @@ class WebtoonPager(Gtk.Box, BasePager):
         for i in range(-self.nb_preloaded_pages, self.nb_preloaded_pages + 1):
             page = Page(self, chapter, page_index + i)
             page.status_changed_handler_id = page.connect('notify::status', self.on_page_status_changed)
+            page.connect('notify::height-request', self.on_page_height_changed)
             page.connect('rendered', self.on_page_rendered)
             self.add(page)
             if i == 0:
                 self.current_page = page
                 page.render()
 
+        self.invalidate_pages_offsets()
+
         self.render_pages_timeout_id = GLib.timeout_add(500, self.render_pages)
         GLib.idle_add(self.update, self.current_page)
 
         self.set_interactive(True)
 
+    def index_pages_offsets(self):
+        pages = self.pages
+
+        self._pages_heights = []
+        self._pages_offsets = []
+        self._pages_positions = {}
+
+        offset = 0
+        for position, page in enumerate(pages):
+            _minimal, natural = page.get_preferred_size()
+            self._pages_heights.append(natural.height)
+            self._pages_offsets.append(offset)
+            self._pages_positions[page] = position
+            offset += natural.height
+
+    def invalidate_pages_offsets(self):
+        self._pages_heights = None
+        self._pages_offsets = None
+        self._pages_positions = None
+
     def on_key_press(self, _widget, event):
         if self.window.page != 'reader' or self.scroll_lock:
             return Gdk.EVENT_PROPAGATE
@@ -183,6 +201,26 @@ class WebtoonPager(Gtk.Box, BasePager):
 
         return Gdk.EVENT_PROPAGATE
 
+    def on_page_height_changed(self, page, _param):
+        if self._pages_offsets is None:
+            return
+
+        position = self._pages_positions.get(page)
+        if position is None:
+            # Page is not indexed yet
+            self.invalidate_pages_offsets()
+            return
+
+        _minimal, natural = page.get_preferred_size()
+        delta = natural.height - self._pages_heights[position]
+        if delta == 0:
+            return
+
+        # Shift offsets of following pages
+        self._pages_heights[position] = natural.height
+        for index in range(position + 1, len(self._pages_offsets)):
+            self._pages_offsets[index] += delta
+
     def on_page_status_changed(self, page, _param):
         if page.status == 'rendering':
             return
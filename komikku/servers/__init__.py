@@ -2,27 +2,41 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
-from bs4 import BeautifulSoup
-import dateparser
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+from email.utils import parsedate_to_datetime
 from functools import cached_property
 from functools import lru_cache
+import hashlib
 import importlib
 import inspect
 import io
+import json
 import magic
 from operator import itemgetter
 import os
 import pickle
 from PIL import Image
 import pkgutil
+import re
 import requests
 from requests.adapters import TimeoutSauce
 import struct
+import threading
+import time
 
 from komikku.utils import get_cache_dir
 from komikku.utils import KeyringHelper
 
+# Version of servers manifest format (see `get_servers_manifest()`), must be incremented when format changes
+SERVERS_MANIFEST_VERSION = 1
+
+# Max size (in bytes) of HTTP cache, least recently used responses are evicted beyond
+HTTP_CACHE_MAX_SIZE = 50 * 1024 * 1024
+
+# Number of threads used to process (decode, transform and encode) downloaded images
+IMAGE_PIPELINE_WORKERS = os.cpu_count() or 2
+
 # https://www.localeplanet.com/icu/
 LANGUAGES = dict(
     id='Bahasa Indonesia',
@@ -46,8 +60,24 @@ LANGUAGES = dict(
     zh_Hant='中文 (繁體)',
 )
 
+# Translation table to decode MRI data (see `convert_mri_data_to_webp_buffer()`): each byte is XORed with 101
+MRI_XOR_TABLE = bytes(101 ^ value for value in range(256))
+
+# Max delay (in seconds) to wait for a server that asked to slow down (HTTP 429/503)
+RATE_LIMIT_MAX_BACKOFF = 120
+# Number of times a request is retried after an HTTP 429 (or a HTTP 503 with a `Retry-After` header)
+RATE_LIMIT_MAX_RETRIES = 2
+
 REQUESTS_TIMEOUT = 5
 
+# Size (in bytes) of chunks in which streamed responses are written to disk (see `Server.save_image_response()`)
+STREAM_CHUNK_SIZE = 64 * 1024
+# Interval (in bytes) at which progress of streamed responses is journaled (see `Server.save_image_response()`)
+STREAM_JOURNAL_INTERVAL = 1024 * 1024
+
+# Size (in pixels) of columns and rows of scrambled images (see `unscramble_image()`)
+UNSCRAMBLE_BLOCK_SIZE = 100
+
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; WOW64) Gecko/20100101 Firefox/60'
 USER_AGENT_MOBILE = 'Mozilla/5.0 (Linux; U; Android 4.1.1; en-gb; Build/KLP) AppleWebKit/534.30 (KHTML, like Gecko) Version/4.0 Safari/534.30'
 
@@ -66,6 +96,254 @@ class CustomTimeout(TimeoutSauce):
 # Set requests timeout globally, instead of specifying ``timeout=..`` kwarg on each call
 requests.adapters.TimeoutSauce = CustomTimeout
 
+# Validators of conditional request in progress (in current thread), see `Server.get_manga_data_if_modified()`
+_conditional_request = threading.local()
+
+# Range (offset, validator) of page image request in progress (in current thread), see `Server.get_manga_chapter_page_image_range()`
+_range_request = threading.local()
+
+
+class NotModified(Exception):
+    """Raised by a conditional request when server response has not changed"""
+
+
+class HTTPCache:
+    """On-disk cache of HTTP responses
+
+    Responses are stored in cache dir, one file per response. File modification time is used to track last access:
+    once cache exceeds its max size, least recently used responses are evicted.
+    """
+
+    def __init__(self, max_size):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.size = None
+
+    @property
+    def dir(self):
+        dir = os.path.join(get_cache_dir(), 'http')
+        if not os.path.exists(dir):
+            os.makedirs(dir, exist_ok=True)
+
+        return dir
+
+    @staticmethod
+    def get_key(url, params=None):
+        prepared_request = requests.models.PreparedRequest()
+        prepared_request.prepare_url(url, params)
+
+        return hashlib.sha1(prepared_request.url.encode()).hexdigest()
+
+    def evict(self):
+        entries = sorted(os.scandir(self.dir), key=lambda entry: entry.stat().st_mtime)
+
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_size * 0.8:
+                break
+
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def get(self, key, ttl=None):
+        """Returns a cached response
+
+        :param key: key of response (see `get_key()`)
+        :param ttl: time to live of response (in seconds), no expiration if None
+        :return: requests.Response object or None if response is not cached or has expired
+        """
+        path = os.path.join(self.dir, key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            return None
+
+        if ttl is not None and time.time() - entry['date'] > ttl:
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        r = requests.Response()
+        r.url = entry['url']
+        r.status_code = entry['status_code']
+        r.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+        r.encoding = entry['encoding']
+        r._content = entry['content']
+
+        return r
+
+    def set(self, key, response):
+        entry = dict(
+            date=time.time(),
+            url=response.url,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            encoding=response.encoding,
+            content=response.content,
+        )
+
+        path = os.path.join(self.dir, key)
+        tmp_path = '{0}.{1}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.evict()
+            else:
+                self.size += os.path.getsize(path)
+                if self.size > self.max_size:
+                    self.evict()
+
+
+http_cache = HTTPCache(HTTP_CACHE_MAX_SIZE)
+
+
+class ImagePipeline:
+    """Image processing pipeline
+
+    Image is decoded once, transformed by stages in order, then encoded once.
+    A stage is a function which takes a PIL.Image.Image and returns a PIL.Image.Image.
+    Images are processed by a pool of workers shared by all pipelines.
+    Result is encoded in a temporary file, renamed once complete. Like `PIL.Image.Image.save()`, encoding format is
+    determined by output file extension, so that file content and name stay consistent.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS, thread_name_prefix='image-pipeline')
+
+    def __init__(self):
+        self.format = None
+        self.stages = []
+
+    def add_stage(self, stage, format=None):
+        """Appends a stage
+
+        :param stage: Function taking and returning a PIL.Image.Image
+        :param format: Optional encoding format required by stage (jpeg, png,...), used if output file extension is unknown
+                       (source format is kept otherwise)
+        """
+        self.stages.append(stage)
+        if format is not None:
+            self.format = format
+
+    def process(self, data, path):
+        """Decodes image data, runs stages and encodes result in a file
+
+        :param data: Image data (bytes object) or path of an image file (can be output file path)
+        :param path: Output file path
+        """
+        image = Image.open(io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data)
+        format = Image.registered_extensions().get(os.path.splitext(path)[1].lower()) or self.format or image.format
+
+        for stage in self.stages:
+            image = stage(image)
+
+        tmp_path = '{0}.{1}.part'.format(path, threading.get_ident())
+        try:
+            image.save(tmp_path, format)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        os.replace(tmp_path, path)
+
+    def submit(self, data, path):
+        """Schedules processing of an image data (see `process`) on workers pool
+
+        :return: A concurrent.futures.Future
+        """
+        return self.executor.submit(self.process, data, path)
+
+
+class RateLimiter:
+    """Token bucket shared by all requests sent to a server
+
+    Allows bursts of `burst` requests, then `rate` requests per second.
+    When server responds with a HTTP 429 or 503 status code, rate is halved and requests are suspended
+    during the delay specified by `Retry-After` header (or an exponential backoff). Rate is progressively
+    restored on successful responses.
+
+    :param clock: function returning current time in seconds (monotonic)
+    :param sleep: function used to wait
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+
+        self.backoff = 0
+        self.current_rate = rate
+        self.last_time = clock()
+        self.lock = threading.Lock()
+        self.tokens = burst
+
+    def acquire(self):
+        """Blocks until a request can be sent
+
+        :return: delay (in seconds) waited before request can be sent
+        """
+        with self.lock:
+            now = self.clock()
+            if now > self.last_time:
+                self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.current_rate)
+                self.last_time = now
+
+            # Reserve a token, possibly in advance: tokens debt is paid by waiting
+            self.tokens -= 1
+            delay = self.last_time - now + max(0, -self.tokens / self.current_rate)
+
+        if delay <= 0:
+            return 0
+
+        self.sleep(delay)
+
+        return delay
+
+    def release(self, response):
+        """Adapts rate according to response status code
+
+        :param response: requests.Response object
+        :return: delay (in seconds) after which request can be retried or None if it must not be retried
+        """
+        if response.status_code not in (429, 503):
+            if self.backoff or self.current_rate < self.rate:
+                with self.lock:
+                    self.backoff = 0
+                    self.current_rate = min(self.rate, self.current_rate + self.rate / 10)
+            return None
+
+        retry_after = get_response_retry_after(response)
+        with self.lock:
+            self.current_rate = max(self.rate / 16, self.current_rate / 2)
+            if retry_after is None:
+                self.backoff = min(max(self.backoff * 2, 1), RATE_LIMIT_MAX_BACKOFF)
+                delay = self.backoff
+            else:
+                delay = retry_after
+
+            # Suspend requests: no tokens are refilled before delay has elapsed
+            self.tokens = min(self.tokens, 0)
+            self.last_time = max(self.last_time, self.clock() + delay)
+
+        if response.status_code == 503 and retry_after is None:
+            # Server may be down or protected by a challenge (Cloudflare), retrying is pointless
+            return None
+
+        return delay
+
 
 class Server:
     id = NotImplemented
@@ -79,10 +357,36 @@ class Server:
     has_login = False
     headers = None
     session_expiration_cookies = []  # Session cookies for which validity (not expired) must be checked
+    # HTTP cache TTLs (in seconds) of GET requests, indexed by name of URL attributes (`cover` for covers)
+    # Cached responses are also used as fallback when network is unreachable
+    cache_ttls = dict(
+        cover=7 * 24 * 3600,
+        search_url=600,
+        api_search_url=600,
+        most_populars_url=3600,
+        api_most_populars_url=3600,
+        chapter_url=600,
+        api_chapter_url=600,
+    )
+    # Set to True if get_manga_data() relies on a single request: validators of its response (ETag, Last-Modified, content hash)
+    # are used to skip update of unchanged mangas
+    conditional_manga_data = False
+
+    # Requests rate limit, shared by all requests sent to the server (bursts of `rate_limit_burst` requests,
+    # then `rate_limit_rate` requests per second)
+    rate_limit_burst = 4
+    rate_limit_rate = 2
+
+    # Downloader and updater policies: max number of pages downloaded simultaneously and max number of mangas updated simultaneously
+    # Servers are processed in parallel, each one according to its own policy
+    download_concurrency = 1
+    update_concurrency = 1
 
     base_url = None
 
     __sessions = {}  # to cache all existing sessions
+    __rate_limiters = {}  # to share rate limiters between all instances of a server
+    __rate_limiters_lock = threading.Lock()
 
     def init(self, username=None, password=None):
         if username and password:
@@ -109,6 +413,27 @@ class Server:
     def login(username, password):
         return False
 
+    @cached_property
+    def cache_patterns(self):
+        """Regular expressions of URLs attributes for which HTTP cache is enabled, with their TTLs"""
+        patterns = []
+        for name, ttl in self.cache_ttls.items():
+            url = getattr(self, name, None)
+            if not isinstance(url, str):
+                continue
+
+            # URLs are format strings: placeholders match any path segment
+            patterns.append((re.compile(re.sub(r'\\\{[^}]*\\\}', '[^/]+', re.escape(url))), ttl))
+
+        return patterns
+
+    def get_cache_ttl(self, url):
+        for pattern, ttl in self.cache_patterns:
+            if pattern.fullmatch(url):
+                return ttl
+
+        return None
+
     @cached_property
     def logo_path(self):
         module_path = os.path.dirname(os.path.abspath(inspect.getfile(self.__class__)))
@@ -127,6 +452,17 @@ class Server:
     def session(self, value):
         Server.__sessions[self.id] = value
 
+    @property
+    def rate_limiter(self):
+        # All languages of a server share the same limiter
+        main_id = get_server_main_id_by_id(self.id)
+
+        with Server.__rate_limiters_lock:
+            if main_id not in Server.__rate_limiters:
+                Server.__rate_limiters[main_id] = RateLimiter(self.rate_limit_rate, self.rate_limit_burst)
+
+            return Server.__rate_limiters[main_id]
+
     @property
     def sessions_dir(self):
         dir = os.path.join(get_cache_dir(), 'sessions')
@@ -155,7 +491,7 @@ class Server:
         if url is None:
             return None
 
-        r = self.session_get(url, headers={'referer': self.base_url})
+        r = self.session_get(url, headers={'referer': self.base_url}, cache_ttl=self.cache_ttls.get('cover'))
         if r is None:
             return None
 
@@ -173,6 +509,49 @@ class Server:
 
         return buffer
 
+    def get_manga_chapter_page_image_range(self, manga_slug, manga_name, chapter_slug, page, offset, validator):
+        """Returns chapter page image like `get_manga_chapter_page_image()`, starting at a given offset
+
+        Used to resume an interrupted download. Only servers which stream pages images send a range request,
+        server may also ignore it: returned response must be checked (see `save_image_response()`).
+
+        :param offset: Offset (in bytes) of first byte requested
+        :param validator: Validator of interrupted response (see `get_response_range_validator()`),
+                          whole image is returned if it has changed in the meantime
+        """
+        _range_request.range = (offset, validator)
+        try:
+            return self.get_manga_chapter_page_image(manga_slug, manga_name, chapter_slug, page)
+        finally:
+            _range_request.range = None
+
+    def get_manga_data_if_modified(self, initial_data, validators=None):
+        """Returns manga data unless it has not changed since validators were collected
+
+        Only servers with `conditional_manga_data` enabled use validators, others always return manga data.
+
+        :param initial_data: initial data passed to `get_manga_data()`
+        :param validators: validators returned with previous manga data (`validators` key) or None
+        :return: manga data or None on failure
+        :raises NotModified: if server response has not changed
+        """
+        if not self.conditional_manga_data:
+            return self.get_manga_data(initial_data)
+
+        _conditional_request.validators = validators or {}
+        _conditional_request.response_validators = None
+        try:
+            data = self.get_manga_data(initial_data)
+        finally:
+            response_validators = _conditional_request.response_validators
+            _conditional_request.validators = None
+            _conditional_request.response_validators = None
+
+        if data is not None and response_validators:
+            data['validators'] = response_validators
+
+        return data
+
     def load_session(self):
         """ Load session from disk """
 
@@ -199,6 +578,80 @@ class Server:
 
         return True
 
+    def save_image_response(self, r, path, offset=0, journal=None):
+        """Writes an image streamed by a response in a file
+
+        Image is never fully loaded in memory: its mime type is sniffed from its first 128 bytes,
+        then it's written by chunks. Callers should write in a temporary file and rename it once complete.
+
+        Servers opt in to streaming by returning `response` (of a request sent with `stream=True`)
+        instead of `buffer` and `mime_type` in `get_manga_chapter_page_image()`.
+
+        Downloads can be resumed: if response is a partial content starting at `offset`
+        (see `get_manga_chapter_page_image_range()`), it's appended to the first `offset` bytes of file.
+        Otherwise file is rewritten.
+
+        :param r: requests.Response object of a request sent with `stream=True`
+        :param path: Output file path
+        :param offset: Size (in bytes) of data already downloaded in file
+        :param journal: Optional function called with size and checksum (SHA-1) of data written in file,
+                        every STREAM_JOURNAL_INTERVAL bytes and once complete
+        :return: Mime type of image or None if response is not an image
+        """
+        with r:
+            checksum = hashlib.sha1()
+            chunks = r.iter_content(STREAM_CHUNK_SIZE)
+
+            content_range = r.headers.get('Content-Range', '')
+            resumed = offset > 0 and r.status_code == 206 and content_range.startswith('bytes {0}-'.format(offset))
+            if resumed:
+                with open(path, 'rb') as fp:
+                    head = fp.read(128)
+                    fp.seek(0)
+                    size = 0
+                    while size < offset:
+                        data = fp.read(min(STREAM_CHUNK_SIZE, offset - size))
+                        if not data:
+                            break
+                        checksum.update(data)
+                        size += len(data)
+            else:
+                head = b''
+                for chunk in chunks:
+                    head += chunk
+                    if len(head) >= 128:
+                        break
+
+            mime_type = get_buffer_mime_type(head)
+            if not mime_type.startswith('image'):
+                return None
+
+            with open(path, 'r+b' if resumed else 'wb') as fp:
+                if resumed:
+                    fp.seek(offset)
+                    fp.truncate()
+                else:
+                    fp.write(head)
+                    checksum.update(head)
+                    offset = len(head)
+
+                journaled_offset = offset
+                for chunk in chunks:
+                    fp.write(chunk)
+                    checksum.update(chunk)
+                    offset += len(chunk)
+
+                    if journal is not None and offset - journaled_offset >= STREAM_JOURNAL_INTERVAL:
+                        # Data must be on disk before being journaled
+                        fp.flush()
+                        journal(offset, checksum.hexdigest())
+                        journaled_offset = offset
+
+        if journal is not None:
+            journal(offset, checksum.hexdigest())
+
+        return mime_type
+
     def save_session(self):
         """ Save session to disk """
 
@@ -207,23 +660,99 @@ class Server:
             pickle.dump(self.session, f)
 
     def session_get(self, *args, **kwargs):
-        try:
-            r = self.session.get(*args, **kwargs)
-        except Exception:
-            raise
-
-        return r
+        return self.session_request('get', *args, **kwargs)
 
     def session_post(self, *args, **kwargs):
-        try:
-            r = self.session.post(*args, **kwargs)
-        except Exception:
-            raise
+        return self.session_request('post', *args, **kwargs)
+
+    def session_request(self, method, *args, **kwargs):
+        """Sends a request using server's session, in respect of server's rate limit
+
+        GET requests to endpoints declared in `cache_ttls` (or with a `cache_ttl` kwarg) are cached.
+        """
+        rate_limiter = self.rate_limiter
+        cache_ttl = kwargs.pop('cache_ttl', None)
+
+        # Only the first request of a conditional manga data retrieval is conditional
+        validators = getattr(_conditional_request, 'validators', None)
+        if validators is not None:
+            _conditional_request.validators = None
+
+            if method == 'get' and (validators.get('etag') or validators.get('last_modified')):
+                headers = dict(kwargs.get('headers') or {})
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+                kwargs['headers'] = headers
+
+        # Only the first streamed request of a page image retrieval is a range request
+        range_ = getattr(_range_request, 'range', None)
+        if range_ is not None and method == 'get' and kwargs.get('stream'):
+            _range_request.range = None
+
+            headers = dict(kwargs.get('headers') or {})
+            headers['Range'] = 'bytes={0}-'.format(range_[0])
+            headers['If-Range'] = range_[1]
+            kwargs['headers'] = headers
+
+        cache_key = None
+        if method == 'get' and validators is None and not kwargs.get('stream'):
+            url = args[0] if args else kwargs['url']
+            explicit_cache_ttl = cache_ttl is not None
+            if not explicit_cache_ttl:
+                cache_ttl = self.get_cache_ttl(url)
+
+            if cache_ttl:
+                cache_key = http_cache.get_key(url, kwargs.get('params'))
+                r = http_cache.get(cache_key, cache_ttl)
+                if r is not None:
+                    return r
+
+        for retry in range(RATE_LIMIT_MAX_RETRIES + 1):
+            rate_limiter.acquire()
+
+            try:
+                r = getattr(self.session, method)(*args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # Offline read-through: an expired cached response is better than nothing
+                r = http_cache.get(cache_key) if cache_key else None
+                if r is None:
+                    raise
+                return r
+
+            delay = rate_limiter.release(r)
+            if delay is None or retry == RATE_LIMIT_MAX_RETRIES:
+                break
+
+        if cache_key and r.status_code == 200:
+            # Images are only cached on demand (covers), pages are already stored by downloader
+            if explicit_cache_ttl or not r.headers.get('Content-Type', '').startswith('image/'):
+                http_cache.set(cache_key, r)
+
+        if validators is not None:
+            if r.status_code == 304:
+                raise NotModified()
+
+            if r.status_code == 200:
+                content_hash = hashlib.sha1(r.content).hexdigest()
+                if content_hash == validators.get('hash'):
+                    # Server doesn't support conditional requests (or ignored them) but content is unchanged
+                    raise NotModified()
+
+                _conditional_request.response_validators = dict(
+                    etag=r.headers.get('ETag'),
+                    last_modified=r.headers.get('Last-Modified'),
+                    hash=content_hash,
+                )
 
         return r
 
 
 def convert_date_string(date, format=None):
+    # dateparser is slow to import: it's only imported when needed
+    import dateparser
+
     if format is not None:
         try:
             d = datetime.datetime.strptime(date, format)
@@ -237,37 +766,17 @@ def convert_date_string(date, format=None):
 
 # https://github.com/italomaia/mangarock.py/blob/master/mangarock/mri_to_webp.py
 def convert_mri_data_to_webp_buffer(data):
-    size_list = [0] * 4
-    size = len(data)
-    header_size = size + 7
-
-    # little endian byte representation
-    # zeros to the right don't change the value
-    for i, byte in enumerate(struct.pack('<I', header_size)):
-        size_list[i] = byte
-
-    buffer = [
-        82,  # R
-        73,  # I
-        70,  # F
-        70,  # F
-        size_list[0],
-        size_list[1],
-        size_list[2],
-        size_list[3],
-        87,  # W
-        69,  # E
-        66,  # B
-        80,  # P
-        86,  # V
-        80,  # P
-        56,  # 8
-    ]
-
-    for bit in data:
-        buffer.append(101 ^ bit)
-
-    return bytes(buffer)
+    """Converts MRI data (Manga Rock images) to a WebP buffer
+
+    MRI data is WebP data without its RIFF header (15 bytes) and XORed with 101.
+
+    :param data: MRI data (bytes object)
+    :return: WebP data (bytes object)
+    """
+    # RIFF header: 'RIFF', size of RIFF chunk (little endian), 'WEBPVP8'
+    header = b'RIFF' + struct.pack('<I', len(data) + 7) + b'WEBPVP8'
+
+    return header + data.translate(MRI_XOR_TABLE)
 
 
 def convert_image(image, format='jpeg', ret_type='image'):
@@ -312,6 +821,53 @@ def get_file_mime_type(path):
         return ''
 
 
+def get_module_file_path(module_info):
+    if module_info.ispkg:
+        return os.path.join(module_info.module_finder.path, module_info.name.split('.')[-1], '__init__.py')
+
+    return os.path.join(module_info.module_finder.path, module_info.name.split('.')[-1] + '.py')
+
+
+def get_response_range_validator(response):
+    """Returns validator of a response, which allows to resume its download with a range request (`If-Range` header)
+
+    :return: Strong ETag or Last-Modified date or None if response can't be resumed
+    """
+    if response.headers.get('Accept-Ranges', '').lower() == 'none' or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # Server doesn't support ranges or offsets of decoded content and offsets of transferred content differ
+        return None
+
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+
+    return response.headers.get('Last-Modified')
+
+
+def get_response_retry_after(response):
+    """Returns delay (in seconds) specified by `Retry-After` header of a response or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        delay = int(value)
+    except ValueError:
+        try:
+            delay = (parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        except Exception:
+            return None
+
+    return min(max(delay, 0), RATE_LIMIT_MAX_BACKOFF)
+
+
+def get_server_class(server_data):
+    """Returns class of a server listed by `get_servers_list()`, its module is imported on demand"""
+    module = importlib.import_module(server_data['module_name'])
+
+    return getattr(module, server_data['class_name'])
+
+
 def get_server_class_name_by_id(id):
     return id.split(':')[0].capitalize()
 
@@ -330,27 +886,58 @@ def get_server_module_name_by_id(id):
 
 @lru_cache(maxsize=None)
 def get_servers_list(include_disabled=False, order_by=('lang', 'name')):
+    servers = []
+    for server_data in get_servers_manifest():
+        if not include_disabled and server_data['status'] == 'disabled':
+            continue
+
+        servers.append(server_data)
+
+    return sorted(servers, key=itemgetter(*order_by))
+
+
+@lru_cache(maxsize=None)
+def get_servers_manifest():
+    """Returns servers manifest: data of all servers (disabled ones included)
+
+    Generating manifest requires to import all servers modules. So, manifest is cached on disk and only generated again
+    when a module changes.
+    """
     import komikku.servers
 
-    def iter_namespace(ns_pkg):
-        # Specifying the second argument (prefix) to iter_modules makes the
-        # returned name an absolute name instead of a relative one. This allows
-        # import_module to work without having to do additional modification to
-        # the name.
-        return pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + '.')
+    # Specifying the second argument (prefix) to iter_modules makes the
+    # returned name an absolute name instead of a relative one. This allows
+    # import_module to work without having to do additional modification to
+    # the name.
+    modules_infos = list(pkgutil.iter_modules(komikku.servers.__path__, komikku.servers.__name__ + '.'))
+
+    # Signature of servers modules: manifest must be generated again if a module is added, removed or modified
+    signature = [SERVERS_MANIFEST_VERSION]
+    for path in [__file__] + [get_module_file_path(module_info) for module_info in modules_infos]:
+        try:
+            stat = os.stat(path)
+            signature.append([path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            signature.append([path, None, None])
+
+    manifest_path = os.path.join(get_cache_dir(), 'servers_manifest.json')
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest['signature'] == signature:
+            return manifest['servers']
+    except Exception:
+        pass
 
     servers = []
-    for _finder, name, _ispkg in iter_namespace(komikku.servers):
-        module = importlib.import_module(name)
+    for module_info in modules_infos:
+        module = importlib.import_module(module_info.name)
         for _name, obj in dict(inspect.getmembers(module)).items():
             if not hasattr(obj, 'id') or not hasattr(obj, 'name') or not hasattr(obj, 'lang'):
                 continue
             if NotImplemented in (obj.id, obj.name, obj.lang):
                 continue
 
-            if not include_disabled and obj.status == 'disabled':
-                continue
-
             if inspect.isclass(obj) and obj.__module__.startswith('komikku.servers.'):
                 logo_path = os.path.join(os.path.dirname(os.path.abspath(module.__file__)), get_server_main_id_by_id(obj.id) + '.ico')
 
@@ -359,15 +946,27 @@ def get_servers_list(include_disabled=False, order_by=('lang', 'name')):
                     name=obj.name,
                     lang=obj.lang,
                     is_nsfw=obj.is_nsfw,
+                    status=obj.status,
+                    has_login=obj.has_login,
                     class_name=get_server_class_name_by_id(obj.id),
                     logo_path=logo_path if os.path.exists(logo_path) else None,
-                    module=module,
+                    module_name=module_info.name,
                 ))
 
-    return sorted(servers, key=itemgetter(*order_by))
+    try:
+        tmp_path = '{0}.{1}.tmp'.format(manifest_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(signature=signature, servers=servers), f)
+        os.replace(tmp_path, manifest_path)
+    except OSError:
+        pass
+
+    return servers
 
 
 def search_duckduckgo(site, term):
+    from bs4 import BeautifulSoup
+
     session = requests.Session()
     session.headers.update({'user-agent': USER_AGENT})
 
@@ -397,36 +996,34 @@ def search_duckduckgo(site, term):
 def unscramble_image(image):
     """Unscramble an image
 
+    Scrambled images are made of 100px wide columns swapped two by two, then of 100px high rows swapped two by two.
+    The inverse permutation (same swaps) is applied to blocks of image, directly in output image.
+
     :param image: PIL.Image.Image or bytes object
     """
     if not isinstance(image, Image.Image):
         image = Image.open(io.BytesIO(image))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    def get_moves(size):
+        # Moves of blocks along an axis: (source position, destination position, length)
+        # Blocks are swapped two by two, trailing block (incomplete pair) is left in place
+        moves = []
+        for position in range(0, size, 2 * UNSCRAMBLE_BLOCK_SIZE):
+            if position + 2 * UNSCRAMBLE_BLOCK_SIZE <= size:
+                moves.append((position, position + UNSCRAMBLE_BLOCK_SIZE, UNSCRAMBLE_BLOCK_SIZE))
+                moves.append((position + UNSCRAMBLE_BLOCK_SIZE, position, UNSCRAMBLE_BLOCK_SIZE))
+            else:
+                moves.append((position, position, size - position))
 
-    temp = Image.new('RGB', image.size)
-    output_image = Image.new('RGB', image.size)
-
-    for x in range(0, image.width, 200):
-        col1 = image.crop((x, 0, x + 100, image.height))
-
-        if x + 200 <= image.width:
-            col2 = image.crop((x + 100, 0, x + 200, image.height))
-            temp.paste(col1, (x + 100, 0))
-            temp.paste(col2, (x, 0))
-        else:
-            col2 = image.crop((x + 100, 0, image.width, image.height))
-            temp.paste(col1, (x, 0))
-            temp.paste(col2, (x + 100, 0))
+        return moves
 
-    for y in range(0, temp.height, 200):
-        row1 = temp.crop((0, y, temp.width, y + 100))
+    output_image = Image.new('RGB', image.size)
 
-        if y + 200 <= temp.height:
-            row2 = temp.crop((0, y + 100, temp.width, y + 200))
-            output_image.paste(row1, (0, y + 100))
-            output_image.paste(row2, (0, y))
-        else:
-            row2 = temp.crop((0, y + 100, temp.width, temp.height))
-            output_image.paste(row1, (0, y))
-            output_image.paste(row2, (0, y + 100))
+    rows_moves = get_moves(image.height)
+    for src_x, dst_x, width in get_moves(image.width):
+        for src_y, dst_y, height in rows_moves:
+            output_image.paste(image.crop((src_x, src_y, src_x + width, src_y + height)), (dst_x, dst_y))
 
     return output_image
@@ -18,6 +18,7 @@ class Dbmultiverse(Server):
     id = 'dbmultiverse'
     name = SERVER_NAME
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://www.dragonball-multiverse.com'
     manga_url = base_url + '/en/chapters.html'
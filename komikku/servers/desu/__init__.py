@@ -22,6 +22,7 @@ class Desu(Server):
     id = 'desu'
     name = SERVER_NAME
     lang = 'ru'
+    conditional_manga_data = True
 
     base_url = 'https://desu.me'
     api_manga_url = base_url + '/manga/api/{0}'
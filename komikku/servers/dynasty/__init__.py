@@ -22,6 +22,7 @@ class Dynasty(Server):
     lang = 'en'
     id = 'dynasty'
     name = 'Dynasty'
+    conditional_manga_data = True
 
     base_url = 'https://dynasty-scans.com'
     manga_url = base_url + '/{0}'
@@ -17,6 +17,8 @@ from komikku.servers import USER_AGENT
 
 
 class Genkan(Server):
+    conditional_manga_data = True
+
     def __init__(self):
         if self.session is None:
             self.session = cloudscraper.create_scraper()
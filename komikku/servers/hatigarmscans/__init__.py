@@ -25,6 +25,7 @@ class Hatigarmscans(Server):
     name = SERVER_NAME
     lang = 'en'
     status = 'disabled'
+    conditional_manga_data = True
 
     base_url = 'https://www.hatigarmscans.net'
     search_url = base_url + '/search'
@@ -19,6 +19,7 @@ class Japscan(Server):
     name = 'JapScan'
     lang = 'fr'
     long_strip_genres = ['Webtoon', ]
+    conditional_manga_data = True
 
     base_url = 'https://www.japscan.se'
     search_url = base_url + '/manga/'
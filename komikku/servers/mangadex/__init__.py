@@ -106,6 +106,7 @@ class Mangadex(Server):
     long_strip_genres = ['Long Strip', ]
     has_login = True
     session_expiration_cookies = ['mangadex_rememberme_token', ]
+    conditional_manga_data = True
 
     base_url = 'https://mangadex.org'
     action_url = base_url + '/ajax/actions.ajax.php?function={0}'
@@ -255,17 +256,14 @@ class Mangadex(Server):
         r = self.session_get(page['image'], headers={
             'Accept': 'image/webp,image/*;q=0.8,*/*;q=0.5',
             'Referer': self.page_url.format(chapter_slug, 1),
-        })
-        if r.status_code != 200:
-            return None
-
-        mime_type = get_buffer_mime_type(r.content)
-        if not mime_type.startswith('image'):
+        }, stream=True)
+        if r.status_code not in (200, 206):
+            # Streamed response is not read: it must be closed to release its connection
+            r.close()
             return None
 
         return dict(
-            buffer=r.content,
-            mime_type=mime_type,
+            response=r,
             name=page['image'].split('?')[0].split('/')[-1],
         )
 
@@ -28,6 +28,7 @@ class Mangaeden(Server):
     id = 'mangaeden'
     name = SERVER_NAME
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://www.mangaeden.com'
     search_url = base_url + '/en/en-directory/'
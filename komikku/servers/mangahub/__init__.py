@@ -44,6 +44,7 @@ class Mangahub(Server):
     name = SERVER_NAME
     lang = 'en'
     long_strip_genres = ['Webtoon', 'Webtoons', ]
+    conditional_manga_data = True
 
     base_url = 'https://mangahub.io'
     manga_url = base_url + '/manga/{0}'
@@ -69,7 +70,7 @@ class Mangahub(Server):
             'query': '{manga(x:m01,slug:"%s"){id,title,slug,status,image,author,artist,genres,description,updatedDate,chapters{slug,title,number,date}}}'
             % initial_data['slug']
         }
-        resp = self.session.post(self.api_url, json=query)
+        resp = self.session_post(self.api_url, json=query)
         if not resp.ok:
             return None
 
@@ -132,7 +133,7 @@ class Mangahub(Server):
                 convert_internal_chapter_slug_to_server_chapter_number(chapter_slug),
             )
         }
-        resp = self.session.post(self.api_url, json=query)
+        resp = self.session_post(self.api_url, json=query)
         if not resp.ok:
             return None
 
@@ -191,7 +192,7 @@ class Mangahub(Server):
         Returns most popular manga list
         """
         query = {'query': '{latestPopular(x:m01){title,slug}search(x:m01,mod:POPULAR,count:true,offset:0){rows{title,slug},count}}'}
-        resp = self.session.post(self.api_url, json=query)
+        resp = self.session_post(self.api_url, json=query)
         if not resp.ok:
             return None
 
@@ -203,7 +204,7 @@ class Mangahub(Server):
 
     def search(self, term):
         query = {'query': '{search(x:m01,q:"%s",limit:10){rows{title,slug}}}' % term}
-        resp = self.session.post(self.api_url, json=query)
+        resp = self.session_post(self.api_url, json=query)
         if not resp.ok:
             return None
 
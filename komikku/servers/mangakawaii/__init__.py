@@ -23,6 +23,7 @@ class Mangakawaii(Server):
     name = SERVER_NAME
     lang = 'fr'
     long_strip_genres = ['Webtoon', ]
+    conditional_manga_data = True
 
     base_url = 'https://www.mangakawaii.com'
     search_url = base_url + '/recherche-manga'
@@ -22,6 +22,7 @@ class Mangalib(Server):
     id = 'mangalib'
     name = 'MangaLib'
     lang = 'ru'
+    conditional_manga_data = True
 
     base_url = 'https://mangalib.me'
     search_url = base_url + '/manga-list?name={0}'
@@ -21,6 +21,7 @@ class Manganelo(Server):
     name = SERVER_NAME
     lang = 'en'
     long_strip_genres = ['Webtoons', ]
+    conditional_manga_data = True
 
     base_url = 'https://manganelo.com'
     search_url = base_url + '/getstorysearchjson'
@@ -39,6 +39,7 @@ class Mangaplus(Server):
     id = 'mangaplus'
     name = SERVER_NAME
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://mangaplus.shueisha.co.jp'
     api_url = 'https://jumpg-webapi.tokyo-cdn.com/api'
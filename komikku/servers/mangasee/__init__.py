@@ -29,6 +29,7 @@ class Mangasee(Server):
     id = 'mangasee'
     name = 'MangaSee'
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://mangasee123.com'
     search_url = base_url + '/search/'
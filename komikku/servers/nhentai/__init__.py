@@ -23,6 +23,7 @@ class Nhentai(Server):
     lang = 'en'
     lang_code = 'english'
     is_nsfw = True
+    conditional_manga_data = True
 
     base_url = 'https://nhentai.net'
     search_url = base_url + '/search'
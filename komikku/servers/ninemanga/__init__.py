@@ -28,6 +28,7 @@ class Ninemanga(Server):
     id = 'ninemanga'
     name = SERVER_NAME
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'http://www.ninemanga.com'
     search_url = base_url + '/search/ajax/'
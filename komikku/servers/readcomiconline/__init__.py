@@ -22,6 +22,7 @@ class Readcomiconline(Server):
     id = 'readcomiconline'
     name = 'Read Comic Online'
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://readcomiconline.to'
     most_populars_url = base_url + '/ComicList/MostPopular'
@@ -165,7 +166,7 @@ class Readcomiconline(Server):
         """
         results = []
 
-        r = self.session.get(self.most_populars_url)
+        r = self.session_get(self.most_populars_url)
         if r.status_code != 200:
             return None
 
@@ -195,7 +196,7 @@ class Readcomiconline(Server):
         results = []
         term = term.lower()
 
-        r = self.session.post(
+        r = self.session_post(
             self.search_url,
             data=dict(
                 type='Comic',
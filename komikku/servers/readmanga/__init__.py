@@ -17,6 +17,7 @@ class Readmanga(Server):
     id = 'readmanga'
     name = 'Read Manga'
     lang = 'ru'
+    conditional_manga_data = True
 
     base_url = 'https://readmanga.live'
     search_url = base_url + '/search/advanced'
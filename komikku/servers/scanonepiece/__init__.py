@@ -18,6 +18,7 @@ class Scanonepiece(Server):
     id = 'scanonepiece'
     name = SERVER_NAME
     lang = 'fr'
+    conditional_manga_data = True
 
     base_url = 'https://www.scan-vf.net'
     search_url = base_url + '/search'
@@ -20,6 +20,7 @@ class Scantrad(Server):
     id = 'scantrad'
     name = SERVER_NAME
     lang = 'fr'
+    conditional_manga_data = True
 
     base_url = 'https://scantrad.net'
     search_url = base_url + '/mangas'
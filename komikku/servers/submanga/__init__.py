@@ -18,6 +18,7 @@ class Submanga(Server):
     id = 'submanga'
     name = SERVER_NAME
     lang = 'es'
+    conditional_manga_data = True
 
     base_url = 'https://submangas.net'
     search_url = base_url + '/search'
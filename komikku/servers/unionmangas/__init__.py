@@ -19,6 +19,7 @@ class Unionmangas(Server):
     name = SERVER_NAME
     lang = 'pt'
     long_strip_genres = ['Webtoon', ]
+    conditional_manga_data = True
 
     base_url = 'https://unionmangas.top'
     api_search_url = base_url + '/assets/busca.php?q={0}'
@@ -220,17 +220,16 @@ class Webtoon(Server):
 
     def get_manga_chapter_page_image(self, manga_slug, manga_name, chapter_slug, page):
         """ Returns chapter page scan (image) content """
-        r = self.session_get(page['image'], headers={'referer': self.base_url, 'user-agent': USER_AGENT})
-        if r is None or r.status_code != 200:
+        r = self.session_get(page['image'], headers={'referer': self.base_url, 'user-agent': USER_AGENT}, stream=True)
+        if r is None:
             return None
-
-        mime_type = get_buffer_mime_type(r.content)
-        if not mime_type.startswith('image'):
+        if r.status_code not in (200, 206):
+            # Streamed response is not read: it must be closed to release its connection
+            r.close()
             return None
 
         return dict(
-            buffer=r.content,
-            mime_type=mime_type,
+            response=r,
             name=page['image'].split('/')[-1].split('?')[0],
         )
 
@@ -20,6 +20,7 @@ class Xkcd(Server):
     id = 'xkcd'
     name = SERVER_NAME
     lang = 'en'
+    conditional_manga_data = True
 
     base_url = 'https://www.xkcd.com'
     manga_url = base_url + '/archive/'
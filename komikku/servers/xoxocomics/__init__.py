@@ -175,7 +175,7 @@ class Xoxocomics(Server):
         """
         results = []
 
-        r = self.session.get(self.most_populars_url)
+        r = self.session_get(self.most_populars_url)
         if r.status_code != 200:
             return None
 
@@ -198,7 +198,7 @@ class Xoxocomics(Server):
         results = []
         term = term.lower()
 
-        r = self.session.get(self.search_url, params=dict(q=term))
+        r = self.session_get(self.search_url, params=dict(q=term))
         if r.status_code != 200:
             return None
 
@@ -2,19 +2,154 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from concurrent.futures import ThreadPoolExecutor
+import datetime
 from gettext import gettext as _
 from gettext import ngettext as n_
+import logging
+import queue
 import threading
+import time
 
 from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Notify
 
 from komikku.utils import log_error_traceback
-from komikku.models import create_db_connection
+from komikku.models import db_writer
+from komikku.models import get_db_connection
+from komikku.models import invalidate_mangas_stats
 from komikku.models import Manga
 from komikku.models import Settings
 
+# Number of updated mangas saved in a single DB transaction
+UPDATER_BATCH_SIZE = 20
+# Max delay (in seconds) before a partial batch of updated mangas is saved
+UPDATER_BATCH_TIMEOUT = 2
+# Max number of servers updated simultaneously (the number of mangas updated simultaneously in a server is set by server)
+UPDATER_MAX_SERVERS = 8
+
+# Library updates scheduling (see `is_update_expected()`)
+# Release interval is the median interval between last releases (chapters dates) of a manga
+UPDATER_CHECK_DELAY_RATIO = 0.25
+UPDATER_MAX_CHECK_DELAY = datetime.timedelta(days=14)
+UPDATER_NB_RELEASES = 10
+
+logger = logging.getLogger('komikku')
+
+
+def is_update_expected(status, releases_dates, last_check, now):
+    """Returns True if a manga is likely to have new chapters since its last check, according to its release cadence
+
+    Next release is expected once release interval has elapsed since last release. Manga is checked when the expected
+    release approaches, then regularly until a new release is found (less and less often for overdue series).
+
+    :param status: manga status
+    :param releases_dates: dates of last releases, most recent first
+    :param last_check: date of last check
+    :param now: current date
+    """
+    if last_check is None:
+        return True
+
+    if status == 'complete' or len(releases_dates) < 2:
+        # Completed series are rarely updated, but they are anyway from time to time
+        # Release cadence is unknown: manga is always checked
+        return status != 'complete' or now - last_check >= UPDATER_MAX_CHECK_DELAY
+
+    intervals = sorted(date - next_date for date, next_date in zip(releases_dates, releases_dates[1:]))
+    interval = intervals[len(intervals) // 2]
+
+    last_release = datetime.datetime.combine(releases_dates[0], datetime.time())
+    window_start = last_release + interval * (1 - UPDATER_CHECK_DELAY_RATIO)
+    if now < window_start:
+        # Next release is not expected yet
+        return now - last_check >= UPDATER_MAX_CHECK_DELAY
+
+    if last_check < window_start:
+        return True
+
+    delay = max(interval, (now - last_release) / 2) * UPDATER_CHECK_DELAY_RATIO
+
+    return now - last_check >= min(delay, UPDATER_MAX_CHECK_DELAY)
+
+
+def get_library_mangas_ids_to_update(force=False):
+    """Returns IDs of library mangas which are likely to have new chapters
+
+    :param force: return all mangas
+    """
+    db_conn = get_db_connection()
+    rows = db_conn.execute('SELECT id, status, last_update, last_check FROM mangas ORDER BY last_read DESC').fetchall()
+    if force:
+        return [row['id'] for row in rows]
+
+    releases_dates = {}
+    for row in db_conn.execute('SELECT DISTINCT manga_id, date FROM chapters WHERE date IS NOT NULL ORDER BY manga_id, date DESC'):
+        dates = releases_dates.setdefault(row['manga_id'], [])
+        if len(dates) < UPDATER_NB_RELEASES:
+            dates.append(row['date'])
+
+    now = datetime.datetime.now()
+    ids = []
+    for row in rows:
+        dates = releases_dates.get(row['id'], [])
+        if row['last_update'] is not None and (not dates or row['last_update'].date() > dates[0]):
+            # Servers without chapters dates: last update is the best approximation of last release
+            dates.insert(0, row['last_update'].date())
+
+        if is_update_expected(row['status'], dates, row['last_check'], now):
+            ids.append(row['id'])
+
+    logger.info('[UPDATE] {0} mangas scheduled, {1} skipped (not expected to have new chapters)'.format(len(ids), len(rows) - len(ids)))
+
+    return ids
+
+
+def save_mangas_full_data(batch):
+    """Saves data fetched for a batch of mangas in a single transaction
+
+    A failure only reverts changes of the manga concerned, not the whole batch.
+    Filesystem changes (chapters folders removal, manga folder renaming) are applied once batch is committed.
+
+    :param batch: list of (manga, data) tuples, data being returned by `Manga.fetch_full_data()`
+    :return: a (result, error message, save time) tuple for each manga, result being a (recent chapters IDs, number of deleted
+             chapters) tuple or None on failure
+    :rtype: list
+    """
+    results = []
+    post_commit_operations = []
+
+    with db_writer() as db_conn:
+        # Savepoints don't open a transaction: without an explicit one, each manga would be committed on release
+        if not db_conn.in_transaction:
+            db_conn.execute('BEGIN')
+
+        for manga, data in batch:
+            start = time.perf_counter()
+
+            manga_operations = []
+            db_conn.execute('SAVEPOINT manga_update')
+            try:
+                _status, recent_chapters_ids, nb_deleted_chapters = manga.save_full_data(data, manga_operations)
+            except Exception as e:
+                db_conn.execute('ROLLBACK TO manga_update')
+                error_message = _('{0}\nOops, update has failed. Please try again.\n{1}').format(manga.name, log_error_traceback(e))
+                results.append((None, error_message, time.perf_counter() - start))
+            else:
+                post_commit_operations += manga_operations
+                results.append(((recent_chapters_ids, nb_deleted_chapters), None, time.perf_counter() - start))
+            finally:
+                db_conn.execute('RELEASE manga_update')
+
+    for operation in post_commit_operations:
+        try:
+            operation()
+        except OSError as e:
+            logger.warning('[UPDATE] Filesystem change failed: {0}'.format(e))
+
+    return results
+
 
 class Updater(GObject.GObject):
     """ Mangas updater """
@@ -24,6 +159,8 @@ class Updater(GObject.GObject):
 
     queue = []
     running = False
+    force_flag = False
+    stats = None
     stop_flag = False
     update_library_flag = False
 
@@ -52,31 +189,54 @@ class Updater(GObject.GObject):
                 notification.show()
 
         def run():
+            nonlocal total_errors, total_recent_chapters
+
             total_recent_chapters = 0
             total_errors = 0
-
-            while self.queue:
-                if self.stop_flag is True:
-                    break
-
-                manga = Manga.get(self.queue.pop(0))
-                if manga is None:
-                    continue
-
-                try:
-                    status, recent_chapters_ids, nb_deleted_chapters = manga.update_full()
-                    if status is True:
-                        total_recent_chapters += len(recent_chapters_ids)
-                        GLib.idle_add(complete, manga, recent_chapters_ids, nb_deleted_chapters)
-                    else:
-                        total_errors += 1
-                        GLib.idle_add(error, manga)
-                except Exception as e:
-                    user_error_message = _('{0}\nOops, update has failed. Please try again.\n{1}').format(manga.name, log_error_traceback(e))
-                    total_errors += 1
-                    GLib.idle_add(error, manga, user_error_message)
+            self.stats = []
+
+            while self.queue and not self.stop_flag:
+                # Group queued mangas by server
+                # Servers are updated in parallel, mangas of a same server according to server's concurrency limit
+                mangas = {}
+                while self.queue:
+                    manga = Manga.get(self.queue.pop(0))
+                    if manga is not None:
+                        mangas.setdefault(manga.server_id, []).append(manga)
+
+                results = queue.Queue()
+                with ThreadPoolExecutor(max_workers=UPDATER_MAX_SERVERS) as executor:
+                    for server_mangas in mangas.values():
+                        executor.submit(update_server, server_mangas, results)
+
+                    # Save fetched data in batches: one result is received per manga
+                    batch = []
+                    for _i in range(sum(len(server_mangas) for server_mangas in mangas.values())):
+                        while True:
+                            try:
+                                manga, data, error_message, fetch_time = results.get(timeout=UPDATER_BATCH_TIMEOUT)
+                                break
+                            except queue.Empty:
+                                save(batch)
+                                batch = []
+
+                        if data is not None:
+                            batch.append((manga, data, fetch_time))
+                            if len(batch) >= UPDATER_BATCH_SIZE:
+                                save(batch)
+                                batch = []
+                        elif fetch_time is not None:
+                            # Update has failed (a `None` fetch time means that update has been skipped, updater has been stopped)
+                            total_errors += 1
+                            GLib.idle_add(error, manga, error_message)
+                            add_stats(manga, fetch_time)
+
+                    save(batch)
 
             self.running = False
+            self.force_flag = False
+
+            log_stats()
 
             # End notification
             if self.update_library_flag:
@@ -104,6 +264,83 @@ class Updater(GObject.GObject):
 
             show_notification(summary, message)
 
+        def update_server(mangas, results):
+            try:
+                max_workers = mangas[0].server.update_concurrency
+            except Exception:
+                # Server can't be loaded, error will be reported for each manga
+                max_workers = 1
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for manga in mangas:
+                    executor.submit(fetch, manga, results)
+
+        def fetch(manga, results):
+            if self.stop_flag:
+                results.put((manga, None, None, None))
+                return
+
+            start = time.perf_counter()
+            data = None
+            error_message = None
+            try:
+                data = manga.fetch_full_data(force=self.force_flag)
+            except Exception as e:
+                error_message = _('{0}\nOops, update has failed. Please try again.\n{1}').format(manga.name, log_error_traceback(e))
+            finally:
+                # A result must always be sent, saving loop waits for one result per manga
+                results.put((manga, data, error_message, time.perf_counter() - start))
+
+        def save(batch):
+            nonlocal total_errors, total_recent_chapters
+
+            if not batch:
+                return
+
+            results = save_mangas_full_data([(manga, data) for manga, data, _fetch_time in batch])
+
+            # Counters must be computed again once batch is committed
+            invalidate_mangas_stats()
+
+            for (manga, _data, fetch_time), (result, error_message, save_time) in zip(batch, results):
+                add_stats(manga, fetch_time, save_time)
+
+                if result is None:
+                    total_errors += 1
+                    GLib.idle_add(error, manga, error_message)
+                else:
+                    recent_chapters_ids, nb_deleted_chapters = result
+                    total_recent_chapters += len(recent_chapters_ids)
+                    GLib.idle_add(complete, manga, recent_chapters_ids, nb_deleted_chapters)
+
+        def add_stats(manga, fetch_time, save_time=0):
+            self.stats.append(dict(
+                manga_id=manga.id,
+                name=manga.name,
+                server_id=manga.server_id,
+                fetch_time=fetch_time,
+                save_time=save_time,
+            ))
+
+        def log_stats():
+            servers_stats = {}
+            for stats in self.stats:
+                servers_stats.setdefault(stats['server_id'], []).append(stats)
+
+            # Servers which take the most time first
+            for server_id, stats in sorted(servers_stats.items(), key=lambda item: -sum(s['fetch_time'] + s['save_time'] for s in item[1])):
+                total_time = sum(s['fetch_time'] + s['save_time'] for s in stats)
+                slowest = max(stats, key=lambda s: s['fetch_time'] + s['save_time'])
+
+                logger.info('[UPDATE] {0}: {1} mangas in {2:.2f}s (mean {3:.2f}s, slowest {4} {5:.2f}s)'.format(
+                    server_id,
+                    len(stats),
+                    total_time,
+                    total_time / len(stats),
+                    slowest['name'],
+                    slowest['fetch_time'] + slowest['save_time'],
+                ))
+
         def complete(manga, recent_chapters_ids, nb_deleted_chapters):
             nb_recent_chapters = len(recent_chapters_ids)
 
@@ -132,6 +369,9 @@ class Updater(GObject.GObject):
         if self.running or len(self.queue) == 0:
             return
 
+        total_errors = 0
+        total_recent_chapters = 0
+
         if Settings.get_default().desktop_notifications:
             notification = Notify.Notification.new('')
             notification.set_timeout(Notify.EXPIRES_DEFAULT)
@@ -158,14 +398,26 @@ class Updater(GObject.GObject):
         if self.running:
             self.stop_flag = True
 
-    def update_library(self):
-        self.update_library_flag = True
+    def update_library(self, force=False):
+        """Updates library mangas
 
-        db_conn = create_db_connection()
-        rows = db_conn.execute('SELECT * FROM mangas ORDER BY last_read DESC').fetchall()
-        db_conn.close()
+        By default, only mangas which are likely to have new chapters (according to their release cadence) are updated.
+
+        :param force: update all mangas, ignoring release cadences and validators of previous updates
+        """
+        self.update_library_flag = True
+        if force:
+            self.force_flag = True
+
+        ids = get_library_mangas_ids_to_update(force)
+        if not ids and not self.running:
+            self.update_library_flag = False
+            self.force_flag = False
+            self.window.show_notification(_('Library is up to date'))
+            return
 
-        for row in rows:
-            self.add(Manga.get(row['id']))
+        for id in ids:
+            if id not in self.queue:
+                self.queue.append(id)
 
         self.start()
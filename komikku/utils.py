@@ -2,22 +2,27 @@
 # SPDX-License-Identifier: GPL-3.0-only or GPL-3.0-or-later
 # Author: Valéry Febvre <vfebvre@easter-eggs.com>
 
+from collections import OrderedDict
 from contextlib import closing
 import datetime
 from functools import lru_cache
 from gettext import gettext as _
 import gi
+import hashlib
 import html
+import io
 import json
 import keyring
 from keyring.credentials import SimpleCredential
 import logging
+import math
 import os
 from PIL import Image
-from PIL import ImageChops
 import requests
 import subprocess
+import threading
 import traceback
+import zipfile
 
 gi.require_version('GdkPixbuf', '2.0')
 
@@ -30,6 +35,24 @@ from gi.repository.GdkPixbuf import PixbufSimpleAnim
 
 logger = logging.getLogger('komikku')
 
+# Extension of chapters archives (uncompressed ZIP files, aka CBZ)
+ARCHIVE_EXTENSION = '.cbz'
+
+# Borders crop: pixels lighter than threshold are considered as white (background)
+# TODO: Add a slider in settings
+BORDERS_CROP_THRESHOLD = 225
+# Borders crop bbox is computed on a copy of image downscaled to this minimal size (smaller side)
+BORDERS_CROP_MIN_SIZE = 300
+# Thresholding lookup table: content pixels become non-zero, background pixels zero
+BORDERS_CROP_LUT = [0 if value > BORDERS_CROP_THRESHOLD else 255 for value in range(256)]
+
+# Memory budget (in bytes) of decoded pixbufs cache shared by reader pages
+PIXBUF_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# Height (in device pixels) of bands of tiled pixbufs
+TILED_PIXBUF_BAND_HEIGHT = 512
+
+
 def folder_size(path):
     if not os.path.exists(path):
         return 0
@@ -82,6 +105,62 @@ def get_data_dir():
     return data_dir_path
 
 
+def get_archive_member(path):
+    """Splits path of a file stored in an archive (ex: chapter.cbz/001.jpg) into archive path and member name
+
+    :return: A tuple (archive path, member name) or (None, None) if path is not inside an archive
+    """
+    archive_path, sep, name = path.rpartition(ARCHIVE_EXTENSION + os.sep)
+    if not sep or not name:
+        return None, None
+
+    return archive_path + ARCHIVE_EXTENSION, name
+
+
+def get_file_checksum(path, size):
+    """Returns checksum (SHA-1) of the first bytes of a file
+
+    :param size: Number of bytes to checksum
+    :return: An hexadecimal digest or None if file doesn't exist or is smaller than size
+    """
+    checksum = hashlib.sha1()
+    try:
+        with open(path, 'rb') as fp:
+            while size > 0:
+                data = fp.read(min(1024 * 1024, size))
+                if not data:
+                    return None
+                checksum.update(data)
+                size -= len(data)
+    except OSError:
+        return None
+
+    return checksum.hexdigest()
+
+
+def get_file_signature(path):
+    """Returns a signature of a file, which changes when file is modified
+
+    Works with files stored in archives too (see `get_archive_member`).
+
+    :return: A tuple (mtime in nanoseconds, size)
+    :raises OSError: if file doesn't exist
+    """
+    archive_path, name = get_archive_member(path)
+    if archive_path is None:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    stat = os.stat(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            info = archive.getinfo(name)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise FileNotFoundError(path) from e
+
+    return stat.st_mtime_ns, info.file_size
+
+
 def html_escape(s):
     return html.escape(html.unescape(s), quote=False)
 
@@ -101,6 +180,64 @@ def log_error_traceback(e):
     return None
 
 
+def open_file(path):
+    """Opens a file in binary mode for reading
+
+    Files stored in archives (see `get_archive_member`) are read without being extracted on disk.
+
+    :return: A file object
+    :raises OSError: if file doesn't exist
+    """
+    archive_path, name = get_archive_member(path)
+    if archive_path is None:
+        return open(path, 'rb')
+
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return io.BytesIO(archive.read(name))
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise FileNotFoundError(path) from e
+
+
+def compute_borders_crop_bbox(path):
+    """Computes bounding box of image content (white borders excluded)
+
+    Computation is done on a downscaled copy of image (decoded at reduced scale in case of JPEG).
+    The returned bbox is slightly expanded to not lose content because of downscaling.
+
+    :param path: Image path
+    :return: A (left, upper, right, lower) tuple in image coordinates or None if image is blank
+    """
+    with open_file(path) as fp, Image.open(fp) as im:
+        width, height = im.size
+
+        factor = max(1, min(width, height) // BORDERS_CROP_MIN_SIZE)
+        if factor > 1:
+            size = (width // factor, height // factor)
+            im.draft('L', size)
+            im = im.convert('L').resize(size, Image.BOX)
+        else:
+            im = im.convert('L')
+
+    # Single thresholding pass, no comparison against a white image
+    bbox = im.point(BORDERS_CROP_LUT).getbbox()
+    if bbox is None:
+        return None
+
+    if factor == 1:
+        return bbox
+
+    ratio_x = width / im.width
+    ratio_y = height / im.height
+
+    return (
+        max(0, math.floor((bbox[0] - 1) * ratio_x)),
+        max(0, math.floor((bbox[1] - 1) * ratio_y)),
+        min(width, math.ceil((bbox[2] + 1) * ratio_x)),
+        min(height, math.ceil((bbox[3] + 1) * ratio_y)),
+    )
+
+
 def crop_pixbuf(pixbuf, src_x, src_y, width, height):
     pixbuf_cropped = Pixbuf.new(Colorspace.RGB, pixbuf.get_has_alpha(), 8, width, height)
     pixbuf.copy_area(src_x, src_y, width, height, pixbuf_cropped, 0, 0)
@@ -146,6 +283,14 @@ class Imagebuf:
 
     @classmethod
     def new_from_file(cls, path):
+        if get_archive_member(path)[0] is not None:
+            # Image stored in an archive
+            try:
+                with open_file(path) as fp:
+                    return cls.new_from_bytes(path, fp.read())
+            except OSError:
+                return None
+
         try:
             pixbuf = Pixbuf.new_from_file(path)
         except GLib.GError:
@@ -162,6 +307,27 @@ class Imagebuf:
 
         return cls(path, buffer, width, height)
 
+    @classmethod
+    def new_from_bytes(cls, path, data):
+        try:
+            loader = PixbufLoader.new()
+            loader.write(data)
+            loader.close()
+        except GLib.GError:
+            return None
+
+        pixbuf = loader.get_pixbuf()
+        if pixbuf is None:
+            return None
+
+        if 'image/gif' in loader.get_format().get_mime_types():
+            # In case of GIF images (probably animated), buffer is image raw data
+            buffer = data
+        else:
+            buffer = pixbuf
+
+        return cls(path, buffer, pixbuf.get_width(), pixbuf.get_height())
+
     @classmethod
     def new_from_resource(cls, path):
         buffer = Pixbuf.new_from_resource(path)
@@ -170,18 +336,6 @@ class Imagebuf:
 
         return cls(None, buffer, width, height)
 
-    def _compute_borders_crop_bbox(self):
-        # TODO: Add a slider in settings
-        threshold = 225
-
-        def lookup(x):
-            return 255 if x > threshold else 0
-
-        im = Image.open(self.path).convert('L').point(lookup, mode='1')
-        bg = Image.new(im.mode, im.size, 255)
-
-        return ImageChops.difference(im, bg).getbbox()
-
     def _get_pixbuf_from_bytes(self, width, height):
         loader = PixbufLoader.new()
         loader.set_size(width, height)
@@ -195,15 +349,20 @@ class Imagebuf:
 
         return animation
 
-    def crop_borders(self):
+    def crop_borders(self, bbox=None):
         """"Crop white borders
 
+        :param bbox: Optional borders crop bbox previously computed with `compute_borders_crop_bbox`
         :return: New cropped Imagebuf or self if it can't be cropped
         """
         if self.animated or self.path is None:
             return self
 
-        bbox = self._compute_borders_crop_bbox()
+        if bbox is None:
+            bbox = compute_borders_crop_bbox(self.path)
+            if bbox is None:
+                # Blank image
+                return self
 
         # Crop is possible if computed bbox is included in pixbuf
         if bbox[2] - bbox[0] < self.width or bbox[3] - bbox[1] < self.height:
@@ -298,6 +457,69 @@ class KeyringHelper:
             keyring.set_password(service, username, password)
 
 
+class PixbufCache:
+    """LRU cache of decoded (and scaled) pixbufs
+
+    Shared by all reader pages: revisiting a recent page doesn't require to decode its image again.
+    Total size of cached pixbufs is bounded by a memory budget (in bytes), least recently used pixbufs are evicted beyond.
+    """
+
+    def __init__(self, max_size):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.pixbufs = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def get_key(path, *args):
+        """Returns a cache key for an image file and rendering parameters (target size, crop, hidpi scale,...)
+
+        Key changes when file is modified. None is returned if file doesn't exist.
+        """
+        try:
+            mtime, size = get_file_signature(path)
+        except (OSError, TypeError, AttributeError):
+            return None
+
+        return (path, mtime, size) + args
+
+    @staticmethod
+    def get_pixbuf_size(pixbuf):
+        return pixbuf.get_rowstride() * pixbuf.get_height()
+
+    def clear(self):
+        with self.lock:
+            self.pixbufs.clear()
+            self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            pixbuf = self.pixbufs.get(key)
+            if pixbuf is not None:
+                self.pixbufs.move_to_end(key)
+
+        return pixbuf
+
+    def set(self, key, pixbuf):
+        size = self.get_pixbuf_size(pixbuf)
+        if size > self.max_size:
+            return
+
+        with self.lock:
+            if key in self.pixbufs:
+                self.size -= self.get_pixbuf_size(self.pixbufs.pop(key))
+
+            self.pixbufs[key] = pixbuf
+            self.size += size
+
+            while self.size > self.max_size:
+                _key, evicted_pixbuf = self.pixbufs.popitem(last=False)
+                self.size -= self.get_pixbuf_size(evicted_pixbuf)
+
+
+pixbuf_cache = PixbufCache(PIXBUF_CACHE_MAX_SIZE)
+
+
 class PlaintextKeyring(keyring.backend.KeyringBackend):
     """Simple File Keyring with no encryption
 
@@ -344,3 +566,65 @@ class PlaintextKeyring(keyring.backend.KeyringBackend):
             password=password,
         )
         self._save(data)
+
+
+class TiledPixbuf:
+    """Scaled image rendered band by band
+
+    Used to display very tall images (webtoon strips): instead of a full scaled pixbuf (and its cairo surface),
+    horizontal bands are produced on demand, only bands near viewport need to be kept in memory.
+
+    Must be created and used off the main thread (decoding workers): source pixbuf is scaled once at creation if it's
+    downscaled, bands are then simply cut from it. Otherwise (upscaling), source pixbuf is kept, smaller than the scaled image,
+    and bands are scaled from it.
+    """
+
+    def __init__(self, pixbuf, width, height, band_height=TILED_PIXBUF_BAND_HEIGHT):
+        """
+        :param pixbuf: Source pixbuf
+        :param width: Scaled width in device pixels
+        :param height: Scaled height in device pixels
+        :param band_height: Bands height in device pixels
+        """
+        if width < pixbuf.get_width():
+            pixbuf = pixbuf.scale_simple(width, height, InterpType.BILINEAR)
+
+        self.band_height = band_height
+        self.height = height
+        self.pixbuf = pixbuf
+        self.width = width
+
+    @property
+    def nb_bands(self):
+        return math.ceil(self.height / self.band_height)
+
+    @property
+    def scaled(self):
+        """Whether source pixbuf has already been scaled (bands don't require any scaling)"""
+        return self.pixbuf.get_width() == self.width and self.pixbuf.get_height() == self.height
+
+    def get_band(self, index):
+        """Returns scaled band pixbuf
+
+        Bands are scaled from source pixbuf with the same scale factors as the whole image, there is no seam between them.
+        """
+        y = index * self.band_height
+        height = min(self.band_height, self.height - y)
+
+        if self.scaled:
+            return self.pixbuf.new_subpixbuf(0, y, self.width, height)
+
+        band = Pixbuf.new(Colorspace.RGB, self.pixbuf.get_has_alpha(), 8, self.width, height)
+        self.pixbuf.scale(
+            band, 0, 0, self.width, height,
+            0, -y, self.width / self.pixbuf.get_width(), self.height / self.pixbuf.get_height(),
+            InterpType.BILINEAR
+        )
+
+        return band
+
+    def get_height(self):
+        return self.height
+
+    def get_width(self):
+        return self.width
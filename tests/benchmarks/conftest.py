@@ -0,0 +1,45 @@
+import pytest
+
+from komikku.models import database
+from komikku.servers import Server
+
+
+class FakeServer(Server):
+    """Server without any network access, tests replace methods they need on instances"""
+
+    id = 'test'
+    name = 'Test'
+    lang = 'en'
+
+    rate_limit_burst = 100
+    rate_limit_rate = 100
+
+    def __init__(self):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Empty database, stored with mangas data in a temporary folder"""
+    monkeypatch.setattr(database, 'get_db_path', lambda: str(tmp_path / 'komikku.db'))
+    monkeypatch.setattr(database, 'get_data_dir', lambda: str(tmp_path))
+    database.close_db_connections()
+    database.init_db()
+
+    yield
+
+    database.close_db_connections()
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def manga(db, server):
+    """A manga of fake server, without chapters"""
+    with database.db_writer() as db_conn:
+        id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id=server.id, name='Manga'))
+
+    return database.Manga.get(id, server=server)
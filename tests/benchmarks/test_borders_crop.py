@@ -0,0 +1,103 @@
+import os
+import time
+
+from PIL import Image
+from PIL import ImageChops
+from PIL import ImageDraw
+import pytest
+
+from komikku.models import database
+from komikku.utils import compute_borders_crop_bbox
+
+
+def compute_borders_crop_bbox_full_size(path):
+    # Previous implementation: thresholding of full size image then difference with a white image
+    im = Image.open(path).convert('L').point(lambda x: 255 if x > 225 else 0, mode='1')
+    bg = Image.new(im.mode, im.size, 255)
+
+    return ImageChops.difference(im, bg).getbbox()
+
+
+def create_page(path, size, content_box):
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(content_box, fill=(40, 40, 40))
+    image.save(path, quality=90)
+
+
+@pytest.fixture
+def chapter(manga):
+    with database.db_writer() as db_conn:
+        chapter_id = database.insert_row(db_conn, 'chapters', dict(
+            manga_id=manga.id, slug='1', title='Chapter 1', rank=1, downloaded=1, recent=0, read=0))
+        database.insert_pages(db_conn, chapter_id, [dict(slug='1', image='001.jpg')])
+
+    chapter = database.Chapter.get(chapter_id, manga)
+    os.makedirs(chapter.path)
+
+    return chapter
+
+
+@pytest.mark.parametrize('size', [(1200, 1800), (900, 15000)])
+def test_downscaled_bbox_includes_content(tmp_path, size):
+    path = str(tmp_path / 'page.jpg')
+    content_box = (97, 131, size[0] - 83, size[1] - 211)
+    create_page(path, size, content_box)
+
+    start = time.perf_counter()
+    expected = compute_borders_crop_bbox_full_size(path)
+    full_size_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bbox = compute_borders_crop_bbox(path)
+    duration = time.perf_counter() - start
+
+    print('{0}x{1}: full size {2:.1f}ms, downscaled {3:.1f}ms'.format(*size, full_size_duration * 1000, duration * 1000))
+
+    # Content is never cropped, borders are kept at most by a few pixels
+    assert bbox[0] <= expected[0] and bbox[1] <= expected[1]
+    assert bbox[2] >= expected[2] and bbox[3] >= expected[3]
+    assert all(abs(a - b) <= 12 for a, b in zip(bbox, expected))
+
+
+def test_blank_page(tmp_path):
+    path = str(tmp_path / 'blank.png')
+    Image.new('RGB', (800, 1200), 'white').save(path)
+
+    assert compute_borders_crop_bbox(path) is None
+
+
+def test_bbox_stored_in_chapter_pages(chapter):
+    path = os.path.join(chapter.path, '001.jpg')
+    create_page(path, (1200, 1800), (100, 100, 1100, 1700))
+
+    bbox = chapter.get_page_borders_crop_bbox(0)
+    assert bbox is not None
+
+    # Reused by a new session, without computation
+    chapter = database.Chapter.get(chapter.id, chapter.manga)
+    assert chapter.pages[0]['bbox'] == list(bbox)
+
+    start = time.perf_counter()
+    assert chapter.get_page_borders_crop_bbox(0) == bbox
+    print('Stored bbox: {0:.3f}ms'.format((time.perf_counter() - start) * 1000))
+
+    # Computed again when image file changes
+    time.sleep(0.01)
+    create_page(path, (1200, 1800), (300, 300, 900, 1500))
+    new_bbox = chapter.get_page_borders_crop_bbox(0)
+    assert new_bbox[0] > bbox[0] and new_bbox[2] < bbox[2]
+
+
+def test_bbox_computed_again_when_mtime_changes(chapter):
+    path = os.path.join(chapter.path, '001.jpg')
+    create_page(path, (1200, 1800), (100, 100, 1100, 1700))
+    bbox = chapter.get_page_borders_crop_bbox(0)
+
+    chapter.update_page(0, dict(bbox=[0, 0, 1, 1]))
+    assert chapter.get_page_borders_crop_bbox(0) == (0, 0, 1, 1)
+
+    # Image file is replaced by a file of same size
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert chapter.get_page_borders_crop_bbox(0) == bbox
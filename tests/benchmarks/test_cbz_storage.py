@@ -0,0 +1,116 @@
+import os
+import time
+import zipfile
+
+from PIL import Image
+import pytest
+
+from komikku.models import database
+from komikku.utils import compute_borders_crop_bbox
+from komikku.utils import get_archive_member
+from komikku.utils import open_file
+from komikku.utils import PixbufCache
+
+NB_CHAPTERS = 10
+NB_PAGES = 30
+
+
+@pytest.fixture
+def manga(manga, server):
+    def get_manga_chapter_page_image(manga_slug, manga_name, chapter_slug, page):
+        raise AssertionError('Page must not be downloaded')
+
+    server.get_manga_chapter_page_image = get_manga_chapter_page_image
+
+    with database.db_writer() as db_conn:
+        for rank in range(NB_CHAPTERS):
+            chapter_id = database.insert_row(db_conn, 'chapters', dict(
+                manga_id=manga.id, slug=str(rank), title=f'Chapter {rank}', rank=rank, downloaded=1, recent=0, read=0))
+            database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=f'{i:03d}.jpg') for i in range(NB_PAGES)])
+
+    manga = database.Manga.get(manga.id, server=server)
+
+    image = Image.new('RGB', (400, 600), 'white')
+    image.paste((40, 40, 40), (50, 75, 350, 525))
+    for chapter in manga.chapters:
+        os.makedirs(chapter.path)
+        for index in range(NB_PAGES):
+            image.save(os.path.join(chapter.path, f'{index:03d}.jpg'), quality=80)
+
+    return manga
+
+
+def count_files(path):
+    return sum(len(files) for _root, _dirs, files in os.walk(path))
+
+
+def test_pack(manga):
+    chapter = manga.chapters[0]
+    with open(chapter.get_page_path(5), 'rb') as fp:
+        data = fp.read()
+
+    assert chapter.pack()
+
+    assert not os.path.exists(chapter.path)
+    with zipfile.ZipFile(chapter.archive_path) as archive:
+        infos = archive.infolist()
+    assert [info.filename for info in infos] == [f'{i:03d}.jpg' for i in range(NB_PAGES)]
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in infos)
+
+    # Pages are served from archive by index, without extraction on disk nor download
+    chapter = database.Chapter.get(chapter.id, manga)
+    path = chapter.get_page(5)
+    assert get_archive_member(path) == (chapter.archive_path, '005.jpg')
+    with open_file(path) as fp:
+        assert fp.read() == data
+
+    assert compute_borders_crop_bbox(path) is not None
+    assert chapter.get_page_borders_crop_bbox(5) is not None
+    assert PixbufCache.get_key(path, 1280, 720) is not None
+    assert PixbufCache.get_key(os.path.join(chapter.archive_path, 'missing.jpg'), 1280, 720) is None
+
+    # Packing again is a no-op
+    assert chapter.pack()
+
+
+def test_pack_incomplete_chapter(manga):
+    chapter = manga.chapters[0]
+    os.unlink(chapter.get_page_path(3))
+
+    assert not chapter.pack()
+    assert os.path.exists(chapter.path)
+    assert not os.path.exists(chapter.archive_path)
+
+
+def test_reset_deletes_archive(manga):
+    chapter = manga.chapters[0]
+    assert chapter.pack()
+
+    chapter.reset()
+
+    assert not os.path.exists(chapter.archive_path)
+    assert chapter.get_page_path(0) is None
+
+
+def test_pack_downloaded_chapters(manga):
+    manga.chapters[0].update(dict(downloaded=0))
+
+    nb_files = count_files(manga.path)
+
+    start = time.perf_counter()
+    nb_packed = database.pack_downloaded_chapters()
+    duration = time.perf_counter() - start
+
+    assert nb_packed == NB_CHAPTERS - 1
+
+    start = time.perf_counter()
+    nb_files_packed = count_files(manga.path)
+    scan_duration = time.perf_counter() - start
+
+    print('{0} chapters packed in {1:.3f}s: {2} files -> {3} files (scanned in {4:.1f}ms)'.format(
+        nb_packed, duration, nb_files, nb_files_packed, scan_duration * 1000))
+
+    assert nb_files_packed == NB_PAGES + NB_CHAPTERS - 1
+
+    # Already packed chapters are skipped
+    assert database.pack_downloaded_chapters() == 0
@@ -0,0 +1,85 @@
+import hashlib
+import json
+
+import pytest
+
+from komikku.models import database
+from komikku.servers import Server
+
+BODY = json.dumps(dict(chapters=[dict(slug=str(i), title=f'Chapter {i}') for i in range(100)])).encode()
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self):
+        self.requests_headers = []
+        self.responses = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests_headers.append(headers or {})
+        return self.responses.pop(0)
+
+
+class FakeServer(Server):
+    id = 'fakeconditional'
+    name = 'Fake'
+    lang = 'en'
+
+    conditional_manga_data = True
+    rate_limit_burst = 100
+
+    def __init__(self):
+        self.nb_parsings = 0
+        if self.session is None:
+            self.session = FakeSession()
+
+    def get_manga_data(self, initial_data):
+        r = self.session_get('https://example.com/manga')
+        if r.status_code != 200:
+            return None
+
+        self.nb_parsings += 1
+        data = initial_data.copy()
+        data.update(json.loads(r.content))
+        data['cover'] = None
+
+        return data
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+def test_not_modified(manga):
+    server = manga.server
+
+    # First update: no validators yet
+    server.session.responses.append(FakeResponse(200, BODY, {'ETag': '"v1"', 'Last-Modified': 'Mon, 02 Nov 2020 10:00:00 GMT'}))
+    status, recent_chapters_ids, _nb_deleted_chapters = manga.update_full()
+    assert status is True
+    assert len(recent_chapters_ids) == 100
+    assert manga.validators == dict(etag='"v1"', last_modified='Mon, 02 Nov 2020 10:00:00 GMT', hash=hashlib.sha1(BODY).hexdigest())
+
+    # HTTP 304: data is neither parsed nor saved
+    server.session.responses.append(FakeResponse(304))
+    assert database.Manga.get(manga.id, server=server).update_full() == (True, [], 0)
+    assert server.session.requests_headers[-1]['If-None-Match'] == '"v1"'
+    assert server.session.requests_headers[-1]['If-Modified-Since'] == 'Mon, 02 Nov 2020 10:00:00 GMT'
+
+    # Validators are ignored by server but content is unchanged
+    server.session.responses.append(FakeResponse(200, BODY))
+    assert database.Manga.get(manga.id, server=server).update_full() == (True, [], 0)
+    assert server.nb_parsings == 1
+
+    # Content has changed
+    server.session.responses.append(FakeResponse(200, BODY.replace(b'Chapter 99', b'Chapter 99 (final)')))
+    assert database.Manga.get(manga.id, server=server).update_full() == (True, [], 0)
+    assert server.nb_parsings == 2
+    assert database.Manga.get(manga.id, server=server).validators['etag'] is None
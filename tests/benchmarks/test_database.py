@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from komikku.models import database
+
+NB_QUERIES = 2000
+
+
+def test_connections_per_second(db):
+    sql = 'SELECT count() AS unread FROM chapters WHERE manga_id = ? AND read = 0'
+
+    # Before: one connection per query
+    start = time.perf_counter()
+    for _i in range(NB_QUERIES):
+        db_conn = database.create_db_connection()
+        db_conn.execute(sql, (1, )).fetchone()
+        db_conn.close()
+    before = NB_QUERIES / (time.perf_counter() - start)
+
+    # After: long-lived connection of current thread
+    start = time.perf_counter()
+    for _i in range(NB_QUERIES):
+        database.get_db_connection().execute(sql, (1, )).fetchone()
+    after = NB_QUERIES / (time.perf_counter() - start)
+
+    print('Queries per second: {0:.0f} (connect/close) vs {1:.0f} (pooled)'.format(before, after))
+
+    assert after > before
+
+
+def test_concurrent_writes(db):
+    assert database.get_db_connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def run():
+        for i in range(50):
+            with database.db_writer() as db_conn:
+                database.insert_row(db_conn, 'mangas', dict(slug=f'{threading.get_ident()}-{i}', server_id='test', name='test'))
+
+    threads = [threading.Thread(target=run) for _i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert database.get_db_connection().execute('SELECT count() FROM mangas').fetchone()[0] == 200
+
+
+def test_mangas_stats_single_query(db):
+    nb_mangas = 1000
+
+    with database.db_writer() as db_conn:
+        for i in range(nb_mangas):
+            manga_id = database.insert_row(db_conn, 'mangas', dict(slug=str(i), server_id='test', name=str(i)))
+            database.insert_rows(db_conn, 'chapters', [
+                dict(manga_id=manga_id, slug=str(j), title=str(j), rank=j, downloaded=j % 2, recent=0, read=int(j < 3))
+                for j in range(10)
+            ])
+    database.invalidate_mangas_stats()
+
+    statements = []
+    database.get_db_connection().set_trace_callback(statements.append)
+
+    # Simulate badges drawing and menu filters of all library thumbnails
+    mangas = [database.Manga() for _i in range(nb_mangas)]
+    for index, manga in enumerate(mangas):
+        manga.id = index + 1
+        assert manga.nb_unread_chapters == 7
+        assert manga.nb_recent_chapters == 0
+        assert manga.nb_downloaded_chapters == 5
+        assert manga.nb_to_read_chapters == 4
+
+    database.get_db_connection().set_trace_callback(None)
+
+    assert len(statements) == 1
+
+
+def test_connections_of_finished_threads_are_closed(db):
+    connections = []
+
+    def run():
+        connections.append(database.get_db_connection())
+        connections[-1].execute('SELECT count() FROM mangas').fetchone()
+
+    threads = [threading.Thread(target=run) for _i in range(4)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    # Connection of a finished thread is closed when a new connection is created (or on close)
+    main_connection = database.get_db_connection()
+    for con in connections[:-1]:
+        with pytest.raises(sqlite3.ProgrammingError):
+            con.execute('SELECT 1')
+
+    database.close_db_connections()
+
+    for con in connections + [main_connection]:
+        with pytest.raises(sqlite3.ProgrammingError):
+            con.execute('SELECT 1')
+    assert not database._db_readers
+
+
+def test_new_chapter_is_read_with_reader_connection(db):
+    with database.db_writer() as db_conn:
+        manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id='test', name='Manga'))
+        statements = []
+        db_conn.set_trace_callback(statements.append)
+
+    chapter = database.Chapter.new(dict(slug='1', title='Chapter 1'), 0, manga_id)
+
+    with database.db_writer() as db_conn:
+        db_conn.set_trace_callback(None)
+
+    assert chapter.slug == '1'
+    assert not [sql for sql in statements if sql.startswith('SELECT')]
@@ -0,0 +1,131 @@
+import os
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from komikku.models import database
+
+try:
+    from komikku import downloader
+except Exception as e:
+    pytest.skip('Downloader is not available: {0}'.format(e), allow_module_level=True)
+
+# 50 chapters across 5 servers
+NB_CHAPTERS = 10
+NB_PAGES = 4
+NB_SERVERS = 5
+# Latency (in seconds) of a page request
+LATENCY = 0.01
+
+JPEG_DATA = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' + b'\x00' * 1000
+
+
+class LatencyServer:
+    """Fake server which counts pages requests in progress, globally and per server"""
+
+    counters_lock = threading.Lock()
+    in_progress = 0
+    max_in_progress = 0
+
+    def __init__(self, server, id, download_concurrency):
+        self.in_progress = 0
+        self.max_in_progress = 0
+
+        server.id = id
+        server.download_concurrency = download_concurrency
+        server.get_manga_chapter_page_image = self.get_manga_chapter_page_image
+        self.server = server
+
+    def get_manga_chapter_page_image(self, manga_slug, manga_name, chapter_slug, page):
+        cls = LatencyServer
+        with cls.counters_lock:
+            self.in_progress += 1
+            self.max_in_progress = max(self.max_in_progress, self.in_progress)
+            cls.in_progress += 1
+            cls.max_in_progress = max(cls.max_in_progress, cls.in_progress)
+
+        time.sleep(LATENCY)
+
+        with cls.counters_lock:
+            self.in_progress -= 1
+            cls.in_progress -= 1
+
+        return dict(buffer=JPEG_DATA, mime_type='image/jpeg', name='{0}.jpg'.format(page['slug']))
+
+
+@pytest.fixture
+def servers(db, monkeypatch):
+    from conftest import FakeServer
+
+    servers = {}
+    with database.db_writer() as db_conn:
+        for index in range(NB_SERVERS):
+            id = 'test{0}'.format(index)
+            # Concurrency policies differ from one server to another
+            servers[id] = LatencyServer(FakeServer(), id, download_concurrency=1 + index % 2)
+
+            manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id=id, name='Manga'))
+            for rank in range(NB_CHAPTERS):
+                chapter_id = database.insert_row(db_conn, 'chapters', dict(
+                    manga_id=manga_id, slug=str(rank), title=f'Chapter {rank}', rank=rank, downloaded=0, recent=0, read=0))
+                database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=None) for i in range(NB_PAGES)])
+
+    monkeypatch.setattr(database.Manga, 'server', property(lambda manga: servers[manga.server_id].server))
+    settings = SimpleNamespace(chapters_cbz_storage=False, desktop_notifications=False, downloader_state=False)
+    monkeypatch.setattr(downloader, 'Settings', SimpleNamespace(get_default=lambda: settings))
+
+    LatencyServer.in_progress = 0
+    LatencyServer.max_in_progress = 0
+
+    return servers
+
+
+def get_chapters():
+    rows = database.get_db_connection().execute('SELECT id FROM chapters ORDER BY manga_id, rank').fetchall()
+    return [database.Chapter.get(row['id']) for row in rows]
+
+
+def reset_chapters(chapters):
+    for chapter in chapters:
+        shutil.rmtree(chapter.path)
+    with database.db_writer() as db_conn:
+        db_conn.execute("UPDATE pages SET image = NULL, download_status = 'pending'")
+        db_conn.execute('UPDATE chapters SET downloaded = 0')
+
+
+def test_concurrent_downloads(servers):
+    chapters = get_chapters()
+
+    # Before: chapters are downloaded one by one, page by page
+    start = time.perf_counter()
+    for chapter in chapters:
+        for index in range(NB_PAGES):
+            assert chapter.get_page(index) is not None
+    before = time.perf_counter() - start
+
+    reset_chapters(chapters)
+
+    # After: servers are processed in parallel, each one according to its own policy
+    manager = downloader.Downloader(None)
+    manager.add(get_chapters())
+
+    start = time.perf_counter()
+    manager.start()
+    while manager.running:
+        time.sleep(0.01)
+    after = time.perf_counter() - start
+
+    print('{0} chapters of {1} servers downloaded: {2:.2f}s (sequential) vs {3:.2f}s (concurrent)'.format(
+        len(chapters), NB_SERVERS, before, after))
+
+    assert database.get_db_connection().execute('SELECT count() FROM downloads').fetchone()[0] == 0
+    assert all(database.Chapter.get(chapter.id).downloaded for chapter in chapters)
+    assert all(len(os.listdir(chapter.path)) == NB_PAGES for chapter in chapters)
+
+    # Servers were downloaded simultaneously, in respect of their own limits
+    assert LatencyServer.max_in_progress > max(server.server.download_concurrency for server in servers.values())
+    for server in servers.values():
+        assert server.max_in_progress <= server.server.download_concurrency
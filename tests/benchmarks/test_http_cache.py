@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+import requests
+
+from komikku import servers
+from komikku.servers import HTTPCache
+from komikku.servers import Server
+
+
+class FakeSession:
+    def __init__(self):
+        self.nb_requests = 0
+        self.offline = False
+
+    def get(self, url, params=None, **kwargs):
+        if self.offline:
+            raise requests.exceptions.ConnectionError()
+
+        self.nb_requests += 1
+        time.sleep(0.05)  # network latency
+
+        r = requests.Response()
+        r.url = url
+        r.status_code = 200
+        r.headers['Content-Type'] = 'image/jpeg' if url.endswith('.jpg') else 'text/html'
+        r._content = '{0} {1}'.format(url, params).encode()
+
+        return r
+
+
+class FakeServer(Server):
+    id = 'fakecache'
+    name = 'Fake'
+    lang = 'en'
+
+    rate_limit_burst = 100
+
+    base_url = 'https://example.com'
+    search_url = base_url + '/search'
+    chapter_url = base_url + '/manga/{0}/{1}'
+    page_url = base_url + '/manga/{0}/{1}/{2}.jpg'
+
+    def __init__(self):
+        self.session = FakeSession()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(servers, 'get_cache_dir', lambda: str(tmp_path))
+    monkeypatch.setattr(servers.http_cache, 'size', None)
+
+
+def test_read_through(cache):
+    server = FakeServer()
+
+    start = time.perf_counter()
+    for _i in range(10):
+        r = server.session_get(server.search_url, params=dict(q='one piece'))
+        assert r.text == "https://example.com/search {'q': 'one piece'}"
+    elapsed = time.perf_counter() - start
+
+    print('10 identical searches: {0:.3f}s, {1} request(s)'.format(elapsed, server.session.nb_requests))
+    assert server.session.nb_requests == 1
+
+    # Other params, other response
+    server.session_get(server.search_url, params=dict(q='naruto'))
+    assert server.session.nb_requests == 2
+
+    # Chapter data is cached, pages images aren't
+    server.session_get(server.chapter_url.format('slug', '1'))
+    server.session_get(server.chapter_url.format('slug', '1'))
+    server.session_get(server.page_url.format('slug', '1', '1'))
+    server.session_get(server.page_url.format('slug', '1', '1'))
+    assert server.session.nb_requests == 5
+
+    # Offline: cached responses are returned
+    server.session.offline = True
+    assert server.session_get(server.chapter_url.format('slug', '1')).status_code == 200
+    with pytest.raises(requests.exceptions.ConnectionError):
+        server.session_get(server.page_url.format('slug', '1', '1'))
+
+
+def test_expiration_and_lru_eviction(cache):
+    http_cache = HTTPCache(max_size=10000)
+
+    response = requests.Response()
+    response.url = 'https://example.com'
+    response.status_code = 200
+    response._content = b'x' * 1000
+
+    for i in range(20):
+        http_cache.set(str(i), response)
+        os.utime(os.path.join(http_cache.dir, str(i)), (i, i))
+        # Keep first response alive
+        assert http_cache.get('0') is not None
+
+    assert http_cache.size <= 10000
+    assert http_cache.get('19') is not None
+    assert http_cache.get('1') is None
+    assert http_cache.get('0', ttl=0) is None
@@ -0,0 +1,119 @@
+import io
+import os
+import time
+
+from PIL import Image
+import pytest
+
+from komikku.models import database
+from komikku.servers import convert_image
+from komikku.servers import ImagePipeline
+from komikku.servers import unscramble_image
+
+NB_ROUNDS = 3
+SIZE = (1200, 1800)
+
+
+@pytest.fixture
+def chapter(manga, server):
+    def get_manga_chapter_page_image(manga_slug, manga_name, chapter_slug, page):
+        return dict(buffer=create_image_data('WEBP'), mime_type='image/webp', name=f'{page["slug"]}.jpg')
+
+    server.get_manga_chapter_page_image = get_manga_chapter_page_image
+
+    with database.db_writer() as db_conn:
+        chapter_id = database.insert_row(db_conn, 'chapters', dict(
+            manga_id=manga.id, slug='1', title='Chapter 1', rank=0, downloaded=0, recent=0, read=0, scrambled=1))
+        database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=None) for i in range(3)])
+
+    return database.Chapter.get(chapter_id, manga)
+
+
+def create_image_data(format, size=(400, 600), **params):
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    with io.BytesIO() as fp:
+        image.save(fp, format, **params)
+        return fp.getvalue()
+
+
+def process_reference(data, path):
+    """Previous chain: WebP is decoded, encoded in JPEG and decoded again, then unscrambled and encoded"""
+    image = convert_image(data)
+    image = unscramble_image(image)
+    image.save(path)
+
+
+def process_pipeline(data, path):
+    pipeline = ImagePipeline()
+    pipeline.add_stage(lambda image: image.convert('RGB'), format='jpeg')
+    pipeline.add_stage(unscramble_image)
+    pipeline.submit(data, path).result()
+
+
+def measure(func, data, path):
+    start = time.perf_counter()
+    for _i in range(NB_ROUNDS):
+        func(data, path)
+
+    return (time.perf_counter() - start) / NB_ROUNDS
+
+
+def test_pipeline_speed(tmp_path):
+    data = create_image_data('WEBP', SIZE, quality=90)
+    path = str(tmp_path / 'page.jpg')
+
+    before = measure(process_reference, data, path)
+    after = measure(process_pipeline, data, path)
+
+    print('{0}x{1} scrambled WebP: {2:.1f}ms (chained conversions) vs {3:.1f}ms (pipeline)'.format(*SIZE, before * 1000, after * 1000))
+
+    with Image.open(path) as image:
+        assert image.format == 'JPEG'
+        assert image.size == SIZE
+
+
+def test_pipeline_is_lossless_without_conversion(tmp_path):
+    data = create_image_data('PNG')
+    path = str(tmp_path / 'page.png')
+
+    pipeline = ImagePipeline()
+    pipeline.add_stage(unscramble_image)
+    pipeline.process(data, path)
+
+    # Source format is kept
+    with Image.open(path) as image:
+        assert image.format == 'PNG'
+        assert image.tobytes() == unscramble_image(data).tobytes()
+
+
+@pytest.mark.parametrize('name, format', [('page.jpg', 'JPEG'), ('page.png', 'PNG'), ('page', 'JPEG')])
+def test_pipeline_format_matches_file_extension(tmp_path, name, format):
+    path = str(tmp_path / name)
+
+    pipeline = ImagePipeline()
+    pipeline.add_stage(lambda image: image.convert('RGB'), format='jpeg')
+    pipeline.process(create_image_data('WEBP'), path)
+
+    # Stage format is only used when extension is unknown
+    with Image.open(path) as image:
+        assert image.format == format
+
+
+def test_get_page(chapter):
+    path = chapter.get_page(1)
+
+    assert path == os.path.join(chapter.path, '1.jpg')
+    with Image.open(path) as image:
+        assert image.format == 'JPEG'
+    assert database.Chapter.get(chapter.id).pages[1]['image'] == '1.jpg'
+
+
+def test_get_page_keeps_webp_extension(chapter):
+    chapter.manga.server.get_manga_chapter_page_image = lambda *args: dict(
+        buffer=create_image_data('WEBP'), mime_type='image/webp', name=f'{args[-1]["slug"]}.webp')
+
+    path = chapter.get_page(2)
+
+    assert path == os.path.join(chapter.path, '2.webp')
+    with Image.open(path) as image:
+        assert image.format == 'WEBP'
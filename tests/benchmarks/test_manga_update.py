@@ -0,0 +1,130 @@
+import datetime
+import os
+import time
+
+import pytest
+
+from komikku.models import database
+from komikku.updater import save_mangas_full_data
+
+NB_CHAPTERS = 10000
+
+
+def get_chapters_data(slugs):
+    return [
+        dict(slug=slug, title=f'Chapter {slug}', date=datetime.date(2020, 1, 1), scanlators=None)
+        for slug in slugs
+    ]
+
+
+@pytest.fixture
+def server(server):
+    # Chapters returned by server are set by test
+    server.chapters = []
+
+    def get_manga_data(initial_data):
+        return dict(
+            name='Manga',
+            cover=None,
+            chapters=[chapter.copy() for chapter in server.chapters],
+        )
+
+    server.get_manga_data = get_manga_data
+
+    return server
+
+
+def get_ranks(manga):
+    rows = database.get_db_connection().execute('SELECT slug, rank FROM chapters WHERE manga_id = ?', (manga.id, ))
+    return {row['slug']: row['rank'] for row in rows}
+
+
+def test_update_full_long_series(manga):
+    slugs = [str(i) for i in range(NB_CHAPTERS)]
+
+    # Initial update: all chapters are new
+    manga.server.chapters = get_chapters_data(slugs)
+    start = time.perf_counter()
+    status, recent_chapters_ids, nb_deleted_chapters = manga.update_full()
+    print('Update of a {0} chapters series (all new): {1:.3f}s'.format(NB_CHAPTERS, time.perf_counter() - start))
+
+    assert status is True
+    assert len(recent_chapters_ids) == NB_CHAPTERS
+    assert nb_deleted_chapters == 0
+    assert get_ranks(manga) == {slug: rank for rank, slug in enumerate(slugs)}
+
+    # Keep a downloaded chapter which is going to disappear from server: its rank must not be reused
+    with database.db_writer() as db_conn:
+        db_conn.execute('UPDATE chapters SET downloaded = 1 WHERE manga_id = ? AND slug = ?', (manga.id, '1'))
+
+    # Second update: 2 chapters are gone (1 downloaded), 1 chapter is added at the beginning
+    slugs = ['new'] + [slug for slug in slugs if slug not in ('0', '1')]
+    manga.server.chapters = get_chapters_data(slugs)
+    start = time.perf_counter()
+    status, recent_chapters_ids, nb_deleted_chapters = manga.update_full()
+    print('Update of a {0} chapters series (few changes): {1:.3f}s'.format(NB_CHAPTERS, time.perf_counter() - start))
+
+    assert status is True
+    assert len(recent_chapters_ids) == 1
+    assert nb_deleted_chapters == 1
+
+    ranks = get_ranks(manga)
+    assert '0' not in ranks
+    assert ranks['1'] == 1
+    assert ranks['new'] == 0
+    assert ranks['2'] == 2
+    assert ranks[str(NB_CHAPTERS - 1)] == NB_CHAPTERS - 1
+
+    # Third update: nothing has changed
+    start = time.perf_counter()
+    status, recent_chapters_ids, nb_deleted_chapters = manga.update_full()
+    print('Update of a {0} chapters series (no changes): {1:.3f}s'.format(NB_CHAPTERS, time.perf_counter() - start))
+
+    assert (status, recent_chapters_ids, nb_deleted_chapters) == (True, [], 0)
+    assert get_ranks(manga) == ranks
+
+
+def test_batch_is_committed_once(manga, server):
+    manga.server.chapters = get_chapters_data(['0', '1'])
+    manga.update_full()
+    chapter_path = os.path.join(manga.path, '0')
+    os.makedirs(chapter_path)
+
+    with database.db_writer() as db_conn:
+        id = database.insert_row(db_conn, 'mangas', dict(slug='failing', server_id=server.id, name='Failing'))
+    failing_manga = database.Manga.get(id, server=server)
+
+    def save_full_data(data, post_commit_operations=None):
+        with database.db_writer() as db_conn:
+            db_conn.execute('UPDATE mangas SET name = ? WHERE id = ?', ('Renamed', failing_manga.id))
+        raise ValueError('Invalid data')
+
+    failing_manga.save_full_data = save_full_data
+
+    # Chapter 0 is gone and manga is renamed
+    commits = []
+
+    def trace(sql):
+        if sql == 'COMMIT':
+            commits.append(os.path.exists(chapter_path))
+
+    with database.db_writer() as db_conn:
+        db_conn.set_trace_callback(trace)
+    try:
+        results = save_mangas_full_data([
+            (manga, dict(name='Renamed', chapters=get_chapters_data(['1']))),
+            (failing_manga, dict()),
+        ])
+    finally:
+        with database.db_writer() as db_conn:
+            db_conn.set_trace_callback(None)
+
+    # A single commit, before chapter folder is removed
+    assert commits == [True]
+    assert not os.path.exists(chapter_path)
+    assert os.path.exists(os.path.join(os.path.dirname(manga.path), 'Renamed'))
+
+    assert results[0][:2] == (([], 1), None)
+    assert results[1][0] is None and results[1][1] is not None
+    assert database.Manga.get(failing_manga.id, server=server).name == 'Failing'
+    assert get_ranks(manga) == {'1': 0}
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+from komikku.models import database
+
+NB_MANGAS = 50
+NB_CHAPTERS = 100
+NB_PAGES = 20
+
+
+@pytest.fixture
+def mangas_ids(db):
+    ids = []
+    with database.db_writer() as db_conn:
+        for index in range(NB_MANGAS + 1):
+            manga_id = database.insert_row(db_conn, 'mangas', dict(slug=f'manga{index}', server_id='test', name=f'Manga {index}'))
+            for rank in range(NB_CHAPTERS):
+                chapter_id = database.insert_row(db_conn, 'chapters', dict(
+                    manga_id=manga_id, slug=str(rank), title=f'Chapter {rank}', rank=rank, downloaded=0, recent=1, read=0,
+                    last_page_read_index=3))
+                database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=None, read=i <= 3) for i in range(NB_PAGES)])
+            ids.append(manga_id)
+
+    # Last manga is not selected
+    return ids[:-1]
+
+
+def count(sql, *params):
+    return database.get_db_connection().execute(sql, params).fetchone()[0]
+
+
+def test_mark_all_read(mangas_ids):
+    # Before: chapters are loaded and updated one by one
+    start = time.perf_counter()
+    chapters_ids = []
+    chapters_data = []
+    for manga_id in mangas_ids:
+        for chapter in database.Manga.get(manga_id).chapters:
+            chapters_ids.append(chapter.id)
+            chapters_data.append(dict(read=1, recent=False, last_page_read_index=None))
+    with database.db_writer() as db_conn:
+        database.update_rows(db_conn, 'chapters', chapters_ids, chapters_data)
+        db_conn.executemany('UPDATE pages SET read = ? WHERE chapter_id = ?', [(1, id) for id in chapters_ids])
+    before = time.perf_counter() - start
+
+    assert database.Manga.mark_all_unread(mangas_ids)
+
+    # After: set-based statements
+    start = time.perf_counter()
+    assert database.Manga.mark_all_read(mangas_ids)
+    after = time.perf_counter() - start
+
+    print('{0} mangas marked as read: {1:.1f}ms (chapter by chapter) vs {2:.1f}ms (bulk)'.format(NB_MANGAS, before * 1000, after * 1000))
+
+    nb_chapters = NB_MANGAS * NB_CHAPTERS
+    assert count('SELECT count() FROM chapters WHERE read = 1 AND recent = 0 AND last_page_read_index IS NULL') == nb_chapters
+    assert count('SELECT count() FROM pages WHERE read = 1') == nb_chapters * NB_PAGES + NB_CHAPTERS * 4
+
+    # Chapters of unselected manga are untouched
+    assert count('SELECT count() FROM chapters WHERE read = 0 AND recent = 1') == NB_CHAPTERS
+
+    # Counters are up to date
+    stats = database.get_mangas_stats()
+    assert all(stats[manga_id]['unread'] == 0 for manga_id in mangas_ids)
+
+
+def test_mark_chapters_unread(mangas_ids):
+    manga = database.Manga.get(mangas_ids[0])
+    assert database.Manga.mark_all_read([manga.id])
+
+    chapters_ids = [chapter.id for chapter in manga.chapters[:10]]
+    assert database.Chapter.mark_unread(chapters_ids)
+
+    assert count('SELECT count() FROM chapters WHERE manga_id = ? AND read = 0', manga.id) == 10
+    assert count('SELECT count() FROM pages WHERE read = 0 AND chapter_id IN (SELECT id FROM chapters WHERE manga_id = ?)', manga.id) == \
+        10 * NB_PAGES
+
+
+def test_mark_all_keeps_last_page_read_index_of_chapters_without_pages(db):
+    with database.db_writer() as db_conn:
+        manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id='test', name='Manga'))
+        # Read and unread chapters, with or without pages
+        for rank, (read, nb_pages) in enumerate([(1, 0), (0, 0), (1, NB_PAGES), (0, NB_PAGES)]):
+            chapter_id = database.insert_row(db_conn, 'chapters', dict(
+                manga_id=manga_id, slug=str(rank), title=f'Chapter {rank}', rank=rank, downloaded=0, recent=1, read=read,
+                last_page_read_index=3))
+            database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=None) for i in range(nb_pages)])
+
+    def get_last_pages_read_indexes():
+        indexes = database.Chapter.get_last_pages_read_indexes(manga_id)
+        return [indexes[chapter.id] for chapter in sorted(database.Manga.get(manga_id).chapters, key=lambda chapter: chapter.rank)]
+
+    assert database.Manga.mark_all_unread([manga_id])
+    assert get_last_pages_read_indexes() == [3, None, None, None]
+
+    assert database.Manga.mark_all_read([manga_id])
+    assert get_last_pages_read_indexes() == [3, None, None, None]
+
+    # Chapters selected in card: always reset
+    assert database.Chapter.mark_read(list(database.Chapter.get_last_pages_read_indexes(manga_id)))
+    assert get_last_pages_read_indexes() == [None] * 4
+
+
+def test_set_read_status_without_query(mangas_ids):
+    chapters = database.Manga.get(mangas_ids[0]).chapters
+    assert chapters[0].pages is not None  # pages of first chapter only are loaded
+    assert database.Manga.mark_all_read([mangas_ids[0]])
+
+    statements = []
+    database.get_db_connection().set_trace_callback(statements.append)
+    try:
+        for chapter in chapters:
+            chapter.set_read_status(True)
+    finally:
+        database.get_db_connection().set_trace_callback(None)
+
+    assert statements == []
+    # Loaded pages are up to date, others are loaded from DB on demand
+    assert all(page['read'] for page in chapters[0].pages)
+    assert all(page['read'] for page in chapters[1].pages)
+    assert all(chapter.read and not chapter.recent and chapter.last_page_read_index is None for chapter in chapters)
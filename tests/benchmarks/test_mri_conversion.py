@@ -0,0 +1,67 @@
+import io
+import os
+import struct
+import time
+
+from PIL import Image
+
+from komikku.servers import convert_mri_data_to_webp_buffer
+
+SIZE = 4 * 1024 * 1024
+
+
+def convert_mri_data_to_webp_buffer_reference(data):
+    """Previous implementation: bytes are XORed one by one in a Python loop"""
+    size_list = [0] * 4
+    size = len(data)
+    header_size = size + 7
+
+    for i, byte in enumerate(struct.pack('<I', header_size)):
+        size_list[i] = byte
+
+    buffer = [82, 73, 70, 70, size_list[0], size_list[1], size_list[2], size_list[3], 87, 69, 66, 80, 86, 80, 56]
+
+    for bit in data:
+        buffer.append(101 ^ bit)
+
+    return bytes(buffer)
+
+
+def create_mri_data():
+    # MRI data: WebP data without its 15 bytes header, XORed with 101
+    image = Image.frombytes('RGB', (200, 300), os.urandom(200 * 300 * 3))
+    with io.BytesIO() as fp:
+        image.save(fp, 'WEBP', lossless=True)
+        webp_data = fp.getvalue()
+
+    return webp_data, bytes(101 ^ byte for byte in webp_data[15:])
+
+
+def test_conversion_is_exact():
+    webp_data, mri_data = create_mri_data()
+
+    buffer = convert_mri_data_to_webp_buffer(mri_data)
+
+    assert isinstance(buffer, bytes)
+    assert buffer == webp_data
+    assert buffer == convert_mri_data_to_webp_buffer_reference(mri_data)
+    assert Image.open(io.BytesIO(buffer)).size == (200, 300)
+
+
+def test_conversion_throughput():
+    data = os.urandom(SIZE)
+
+    start = time.perf_counter()
+    expected = convert_mri_data_to_webp_buffer_reference(data)
+    before = SIZE / (time.perf_counter() - start) / 1024 / 1024
+
+    nb_rounds = 20
+    start = time.perf_counter()
+    for _i in range(nb_rounds):
+        buffer = convert_mri_data_to_webp_buffer(data)
+    after = SIZE * nb_rounds / (time.perf_counter() - start) / 1024 / 1024
+
+    print('MRI to WebP conversion: {0:.1f} MB/s (Python loop) vs {1:.0f} MB/s (translation table)'.format(before, after))
+
+    assert buffer == expected
+    assert after > before * 10
@@ -0,0 +1,90 @@
+import time
+
+from komikku.models import database
+
+NB_PAGES = 200
+
+
+def create_chapter(manga, nb_pages=NB_PAGES):
+    return database.Chapter.new(
+        dict(slug='1', title='Chapter 1', pages=[dict(slug=str(i), image=None, url=f'/{i}') for i in range(nb_pages)]), 0, manga.id)
+
+
+def test_migration_from_json_pages(db):
+    # Downgrade DB to version 8: pages stored in chapters.pages JSON column
+    with database.db_writer() as db_conn:
+        db_conn.execute('DROP TABLE pages')
+        db_conn.execute('ALTER TABLE chapters ADD COLUMN pages json')
+        manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id='test', name='Manga'))
+        chapter_id = database.insert_row(db_conn, 'chapters', dict(
+            manga_id=manga_id, slug='1', title='Chapter 1', rank=0, downloaded=0, recent=0, read=0,
+            pages=[
+                dict(slug='a', image='001.jpg', read=True, borders_crop=dict(bbox=[1, 2, 3, 4], mtime=0, size=1000)),
+                dict(slug='b', image=None, encryption_key='abcd'),
+            ]))
+        db_conn.execute('PRAGMA user_version = 8')
+
+    database.close_db_connections()
+    database.init_db()
+
+    db_conn = database.get_db_connection()
+    assert db_conn.execute('PRAGMA user_version').fetchone()[0] == database.VERSION
+    assert db_conn.execute('SELECT pages FROM chapters WHERE id = ?', (chapter_id, )).fetchone()[0] is None
+
+    chapter = database.Chapter.get(chapter_id)
+    assert chapter.pages == [
+        dict(slug='a', image='001.jpg', read=True, bbox=[1, 2, 3, 4], mtime=0, size=1000),
+        dict(slug='b', image=None, read=False, bbox=None, mtime=None, size=None, encryption_key='abcd'),
+    ]
+
+
+def test_chapter_without_pages(manga):
+    chapter = create_chapter(manga, nb_pages=0)
+
+    assert database.Chapter.get(chapter.id).pages is None
+
+    assert chapter.update(dict(pages=[dict(slug='a', image=None)]))
+    assert database.Chapter.get(chapter.id).pages[0]['slug'] == 'a'
+
+    assert chapter.update(dict(pages=None))
+    assert database.Chapter.get(chapter.id).pages is None
+
+
+def test_single_page_update(manga):
+    chapter = create_chapter(manga)
+    db_conn = database.get_db_connection()
+
+    # Before: whole JSON list of pages is rewritten
+    with database.db_writer() as db_conn_writer:
+        db_conn_writer.execute('CREATE TABLE chapters_json (id integer PRIMARY KEY, pages json)')
+        db_conn_writer.execute('INSERT INTO chapters_json VALUES (?, ?)', (chapter.id, chapter.pages))
+
+    pages = chapter.pages
+    start = time.perf_counter()
+    for index in range(NB_PAGES):
+        pages[index]['image'] = f'{index}.jpg'
+        with database.db_writer() as db_conn_writer:
+            db_conn_writer.execute('UPDATE chapters_json SET pages = ? WHERE id = ?', (pages, chapter.id))
+    before = time.perf_counter() - start
+
+    # After: a single row is updated
+    chapter = database.Chapter.get(chapter.id)
+    start = time.perf_counter()
+    for index in range(NB_PAGES):
+        assert chapter.update_page(index, dict(image=f'{index}.jpg'))
+    after = time.perf_counter() - start
+
+    print('{0} pages images saved: {1:.1f}ms (JSON list) vs {2:.1f}ms (pages rows)'.format(NB_PAGES, before * 1000, after * 1000))
+
+    assert [row['image'] for row in db_conn.execute('SELECT image FROM pages WHERE chapter_id = ? ORDER BY "index"', (chapter.id, ))] == \
+        [f'{index}.jpg' for index in range(NB_PAGES)]
+    # Server specific data are preserved
+    assert database.Chapter.get(chapter.id).pages[5]['url'] == '/5'
+
+
+def test_pages_are_deleted_with_chapter(manga):
+    chapter = create_chapter(manga)
+
+    chapter.delete()
+
+    assert database.get_db_connection().execute('SELECT count() FROM pages').fetchone()[0] == 0
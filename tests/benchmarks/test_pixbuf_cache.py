@@ -0,0 +1,56 @@
+import os
+import time
+
+from komikku.utils import PixbufCache
+
+
+class FakePixbuf:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def get_height(self):
+        return self.height
+
+    def get_rowstride(self):
+        return self.width * 4
+
+
+def test_lru_eviction_within_budget():
+    # Budget of 3 pages of 1000x1500 RGBA pixels
+    page_size = 1000 * 4 * 1500
+    cache = PixbufCache(3 * page_size)
+
+    for i in range(3):
+        cache.set(i, FakePixbuf(1000, 1500))
+    assert cache.size == 3 * page_size
+
+    # Page 0 is used again: page 1 is the least recently used one
+    assert cache.get(0) is not None
+    cache.set(3, FakePixbuf(1000, 1500))
+
+    assert cache.get(1) is None
+    assert all(cache.get(key) is not None for key in (0, 2, 3))
+    assert cache.size == 3 * page_size
+
+    # Pixbuf larger than budget is never cached
+    cache.set(4, FakePixbuf(10000, 1500))
+    assert cache.get(4) is None
+    assert cache.size == 3 * page_size
+
+
+def test_key_changes_with_file(tmp_path):
+    path = os.path.join(tmp_path, '001.jpg')
+    with open(path, 'wb') as fp:
+        fp.write(b'image')
+
+    key = PixbufCache.get_key(path, 1280, 720, 'screen', 0, 1)
+    assert key == PixbufCache.get_key(path, 1280, 720, 'screen', 0, 1)
+    assert key != PixbufCache.get_key(path, 1280, 720, 'screen', 1, 1)
+
+    time.sleep(0.01)
+    with open(path, 'wb') as fp:
+        fp.write(b'new image')
+    assert key != PixbufCache.get_key(path, 1280, 720, 'screen', 0, 1)
+
+    assert PixbufCache.get_key(os.path.join(tmp_path, 'missing.jpg'), 1280, 720) is None
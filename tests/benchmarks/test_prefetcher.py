@@ -0,0 +1,115 @@
+import time
+
+from komikku.reader.pager import prefetcher
+from komikku.reader.pager.prefetcher import Prefetcher
+
+
+class FakePixbuf:
+    def get_height(self):
+        return 1000
+
+    def get_rowstride(self):
+        return 1000
+
+
+class FakeChapter:
+    def __init__(self, manga, rank, nb_pages):
+        self.manga = manga
+        self.rank = rank
+        self.nb_pages = nb_pages
+        self.pages = None
+
+    def get_page(self, index):
+        time.sleep(self.manga.latency)
+        self.manga.downloaded.append((self.rank, index))
+        return f'{self.rank}/{index}.jpg'
+
+    def get_page_borders_crop_bbox(self, index):
+        return None
+
+    def update_full(self):
+        self.pages = [dict(index=i) for i in range(self.nb_pages)]
+        return True
+
+
+class FakeManga:
+    def __init__(self, nb_chapters, nb_pages, latency=0):
+        self.chapters = [FakeChapter(self, rank, nb_pages) for rank in range(nb_chapters)]
+        self.downloaded = []
+        self.latency = latency
+
+    def get_next_chapter(self, chapter, direction=1):
+        rank = chapter.rank + direction
+        return self.chapters[rank] if 0 <= rank < len(self.chapters) else None
+
+
+def run_prefetcher(monkeypatch, manga, nb_pages, chapter, index, direction, max_size=prefetcher.PREFETCH_MAX_SIZE):
+    decoded = []
+
+    def decode_page_image(path, *params, get_borders_crop_bbox=None):
+        decoded.append(path)
+        return None, FakePixbuf(), None, False
+
+    monkeypatch.setattr(prefetcher, 'decode_page_image', decode_page_image)
+
+    instance = Prefetcher(manga, nb_pages, max_size)
+    instance.start(chapter, index, direction, ())
+
+    return instance, decoded
+
+
+def wait_downloads(manga, count, timeout=5):
+    start = time.monotonic()
+    while len(manga.downloaded) < count and time.monotonic() - start < timeout:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def test_prefetch_across_chapters(monkeypatch):
+    manga = FakeManga(3, 4)
+    chapter = manga.chapters[0]
+    chapter.update_full()
+
+    # Page 3 of 1st chapter is current, next page is already handled by pager (skipped)
+    _instance, decoded = run_prefetcher(monkeypatch, manga, 5, chapter, 2, 1)
+    wait_downloads(manga, 5)
+
+    assert manga.downloaded == [(1, 0), (1, 1), (1, 2), (1, 3), (2, 0)]
+    assert decoded == ['1/0.jpg', '1/1.jpg', '1/2.jpg', '1/3.jpg', '2/0.jpg']
+
+
+def test_prefetch_backward_stops_at_first_chapter(monkeypatch):
+    manga = FakeManga(2, 4)
+    chapter = manga.chapters[1]
+    chapter.update_full()
+
+    run_prefetcher(monkeypatch, manga, 10, chapter, 1, -1)
+    wait_downloads(manga, 4)
+
+    assert manga.downloaded == [(0, 3), (0, 2), (0, 1), (0, 0)]
+
+
+def test_memory_budget(monkeypatch):
+    manga = FakeManga(1, 10)
+    chapter = manga.chapters[0]
+    chapter.update_full()
+
+    # Budget of 3 decoded pages: following pages are only downloaded
+    _instance, decoded = run_prefetcher(monkeypatch, manga, 6, chapter, 0, 1, max_size=3 * 1000 * 1000)
+    wait_downloads(manga, 6)
+
+    assert len(manga.downloaded) == 6
+    assert decoded == ['0/2.jpg', '0/3.jpg', '0/4.jpg']
+
+
+def test_cancel_on_jump(monkeypatch):
+    manga = FakeManga(1, 50, latency=0.05)
+    chapter = manga.chapters[0]
+    chapter.update_full()
+
+    instance, _decoded = run_prefetcher(monkeypatch, manga, 20, chapter, 0, 1)
+    time.sleep(0.12)
+    instance.cancel()
+    time.sleep(0.2)
+
+    assert 1 <= len(manga.downloaded) <= 4
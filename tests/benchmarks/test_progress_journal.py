@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from komikku.models import database
+
+NB_PAGES = 200
+
+
+@pytest.fixture
+def manga(manga, server):
+    with database.db_writer() as db_conn:
+        for rank in range(2):
+            chapter_id = database.insert_row(db_conn, 'chapters', dict(
+                manga_id=manga.id, slug=str(rank), title=f'Chapter {rank}', rank=rank, downloaded=0, recent=1, read=0))
+            database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image=None) for i in range(NB_PAGES)])
+
+    return database.Manga.get(manga.id, server=server)
+
+
+def get_chapter_row(chapter):
+    return database.get_db_connection().execute('SELECT * FROM chapters WHERE id = ?', (chapter.id, )).fetchone()
+
+
+def get_read_pages_indexes(chapter):
+    sql = 'SELECT "index" FROM pages WHERE chapter_id = ? AND read = 1 ORDER BY "index"'
+    return [row[0] for row in database.get_db_connection().execute(sql, (chapter.id, ))]
+
+
+def test_progress_is_written_on_flush(manga):
+    chapter = manga.chapters[0]
+    journal = database.ProgressJournal()
+
+    start = time.perf_counter()
+    for index in range(NB_PAGES):
+        journal.add(chapter, index)
+    journal.flush()
+    elapsed = time.perf_counter() - start
+
+    print('{0} pages read: {1:.1f}ms'.format(NB_PAGES, elapsed * 1000))
+
+    row = get_chapter_row(chapter)
+    assert row['read'] == 1
+    assert row['recent'] == 0
+    assert row['last_page_read_index'] == NB_PAGES - 1
+    assert get_read_pages_indexes(chapter) == list(range(NB_PAGES))
+    assert database.Manga.get(manga.id).last_read == manga.last_read
+
+
+def test_nothing_written_before_flush(manga):
+    chapter = manga.chapters[0]
+    journal = database.ProgressJournal()
+
+    journal.add(chapter, 3)
+
+    # In memory objects are up to date, database is not
+    assert chapter.last_page_read_index == 3
+    assert get_chapter_row(chapter)['last_page_read_index'] is None
+
+    journal.flush()
+    row = get_chapter_row(chapter)
+    assert row['last_page_read_index'] == 3
+    assert row['read'] == 0
+    assert get_read_pages_indexes(chapter) == [3]
+
+
+def test_flush_on_chapter_change(manga):
+    chapter1, chapter2 = manga.chapters[1], manga.chapters[0]
+    journal = database.ProgressJournal()
+
+    journal.add(chapter1, NB_PAGES - 1)
+    journal.add(chapter2, 0)
+
+    assert get_chapter_row(chapter1)['last_page_read_index'] == NB_PAGES - 1
+    assert get_chapter_row(chapter2)['last_page_read_index'] is None
+
+
+def test_read_pages_of_several_chapter_objects_are_merged(manga):
+    chapter = manga.chapters[0]
+    same_chapter = database.Chapter.get(chapter.id, manga)
+    journal = database.ProgressJournal()
+
+    journal.add(chapter, 0)
+    journal.add(same_chapter, 1)
+    journal.flush()
+
+    row = get_chapter_row(chapter)
+    assert get_read_pages_indexes(chapter) == [0, 1]
+    assert row['last_page_read_index'] == 1
@@ -0,0 +1,116 @@
+import pytest
+
+from komikku.servers import RateLimiter
+from komikku.servers import Server
+
+
+class FakeClock:
+    """Monotonic clock which only moves forward when told to
+
+    :param sleep_advances: whether a sleep moves clock forward (sequential requests) or not (concurrent requests)
+    """
+
+    def __init__(self, sleep_advances=True):
+        self.now = 0
+        self.sleep_advances = sleep_advances
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        if self.sleep_advances:
+            self.now += delay
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self, clock, responses):
+        self.calls = []
+        self.clock = clock
+        self.responses = responses
+
+    def get(self, url, **kwargs):
+        self.calls.append(self.clock())
+        return self.responses.pop(0) if self.responses else FakeResponse()
+
+
+class FakeServer(Server):
+    id = 'fakeratelimit'
+    name = 'Fake'
+    lang = 'en'
+
+    rate_limit_burst = 5
+    rate_limit_rate = 50
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def server(clock, monkeypatch):
+    limiter = RateLimiter(FakeServer.rate_limit_rate, FakeServer.rate_limit_burst, clock=clock, sleep=clock.sleep)
+    monkeypatch.setattr(FakeServer, 'rate_limiter', limiter)
+
+    return FakeServer()
+
+
+def test_burst_then_steady_rate():
+    # 25 requests sent at the same time by concurrent threads
+    clock = FakeClock(sleep_advances=False)
+    limiter = RateLimiter(rate=50, burst=5, clock=clock, sleep=clock.sleep)
+
+    delays = [limiter.acquire() for _i in range(25)]
+
+    # 5 requests are sent immediately, the 20 others at 50 requests per second
+    assert delays[:5] == [0] * 5
+    assert delays[5:] == pytest.approx([i / 50 for i in range(1, 21)])
+    print('25 requests (burst 5, 50 req/s): {0:.3f}s'.format(delays[-1]))
+
+
+def test_steady_rate_after_idle_time(clock):
+    limiter = RateLimiter(rate=50, burst=5, clock=clock, sleep=clock.sleep)
+
+    delays = [limiter.acquire() for _i in range(10)]
+    assert delays[5:] == pytest.approx([1 / 50] * 5)
+
+    # Bucket is refilled while idle, but never above burst size
+    clock.now += 60
+    delays = [limiter.acquire() for _i in range(6)]
+    assert delays[:5] == [0] * 5
+    assert delays[5] == pytest.approx(1 / 50)
+
+
+def test_backoff_on_429_with_retry_after(clock, server):
+    server.session = FakeSession(clock, [FakeResponse(429, {'Retry-After': '1'})])
+
+    r = server.session_get('https://example.com')
+
+    assert r.status_code == 200
+    assert len(server.session.calls) == 2
+    # Retry waits for Retry-After delay, at the halved rate
+    assert clock.sleeps == pytest.approx([1 + 1 / 25])
+    assert server.session.calls[1] - server.session.calls[0] >= 1
+    assert server.rate_limiter.current_rate < FakeServer.rate_limit_rate
+
+    # Rate is progressively restored on successful responses
+    for _i in range(10):
+        server.session_get('https://example.com')
+    assert server.rate_limiter.current_rate == FakeServer.rate_limit_rate
+
+
+def test_no_retry_on_503_without_retry_after(clock, server):
+    server.session = FakeSession(clock, [FakeResponse(503)])
+
+    r = server.session_get('https://example.com')
+
+    assert r.status_code == 503
+    assert len(server.session.calls) == 1
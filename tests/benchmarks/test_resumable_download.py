@@ -0,0 +1,181 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import os
+import threading
+
+import pytest
+import requests
+
+from komikku.models import database
+from komikku.servers.mangadex import Mangadex
+from komikku.servers.webtoon import Webtoon
+
+IMAGE_SIZE = 8 * 1024 * 1024
+NB_PAGES = 3
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves images with ETag validators and ranges support, can break a response in the middle"""
+
+    def do_GET(self):
+        httpd = self.server
+        content = httpd.content
+        httpd.requests.append(dict(self.headers))
+
+        start = 0
+        range_ = self.headers.get('Range')
+        if range_ and self.headers.get('If-Range') in (None, httpd.etag):
+            start = int(range_.split('=')[1].split('-')[0])
+            self.send_response(206)
+            httpd.statuses.append(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+            httpd.statuses.append(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(content) - start))
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('ETag', httpd.etag)
+        self.end_headers()
+
+        data = content[start:]
+        if httpd.break_after is not None:
+            # Connection is lost
+            data = data[:httpd.break_after]
+            httpd.break_after = None
+        httpd.nb_bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def create_content():
+    return b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' + os.urandom(IMAGE_SIZE)
+
+
+@pytest.fixture
+def httpd():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.break_after = None
+    httpd.content = create_content()
+    httpd.etag = '"1"'
+    httpd.nb_bytes_sent = 0
+    httpd.requests = []
+    httpd.statuses = []
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield httpd
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(params=[Mangadex, Webtoon])
+def plugin(request, monkeypatch):
+    """Real server plugin, pages images are served locally"""
+    # No session loading nor login
+    monkeypatch.setattr(request.param, 'init', lambda self, *args: None, raising=False)
+
+    plugin = request.param()
+    plugin.session = requests.Session()
+
+    return plugin
+
+
+@pytest.fixture
+def chapter(db, httpd, plugin):
+    base_url = 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+
+    with database.db_writer() as db_conn:
+        manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id=plugin.id, name='Manga'))
+        chapter_id = database.insert_row(db_conn, 'chapters', dict(
+            manga_id=manga_id, slug='1', title='Chapter 1', rank=0, downloaded=0, recent=0, read=0))
+        database.insert_pages(db_conn, chapter_id, [dict(slug=str(i), image='{0}/{1}.jpg'.format(base_url, i)) for i in range(NB_PAGES)])
+
+    return database.Chapter.get(chapter_id, database.Manga.get(manga_id, server=plugin))
+
+
+def interrupt_download(chapter, httpd, index=0, size=IMAGE_SIZE // 2):
+    httpd.break_after = size
+    with pytest.raises(requests.exceptions.RequestException):
+        chapter.get_page(index)
+
+
+def test_resume(chapter, httpd):
+    interrupt_download(chapter, httpd)
+
+    journal = chapter.get_page_journal(0)
+    assert journal['download_status'] == 'partial'
+    assert journal['download_offset'] >= database.PAGES_DOWNLOAD_RESUME_MIN_SIZE
+    assert journal['download_validator'] == httpd.etag
+    assert chapter.get_page_path(0) is None
+
+    nb_bytes_sent = httpd.nb_bytes_sent
+    path = chapter.get_page(0)
+    nb_bytes_resumed = httpd.nb_bytes_sent - nb_bytes_sent
+
+    print('Interrupted {0} MB page image: {1:.1f} MB fetched again (resumed) vs {2:.1f} MB (restarted)'.format(
+        IMAGE_SIZE // 1024 // 1024, nb_bytes_resumed / 1024 / 1024, len(httpd.content) / 1024 / 1024))
+
+    assert httpd.requests[-1]['Range'] == 'bytes={0}-'.format(journal['download_offset'])
+    assert httpd.requests[-1]['If-Range'] == httpd.etag
+    # Partial content is accepted by server plugin
+    assert httpd.statuses[-1] == 206
+    assert nb_bytes_resumed == len(httpd.content) - journal['download_offset']
+
+    with open(path, 'rb') as fp:
+        assert fp.read() == httpd.content
+    assert os.listdir(chapter.path) == ['0.jpg']
+
+    journal = chapter.get_page_journal(0)
+    assert journal['download_status'] == 'complete'
+    assert journal['download_offset'] == len(httpd.content)
+    assert journal['download_checksum'] == hashlib.sha1(httpd.content).hexdigest()
+
+
+def test_resume_changed_image(chapter, httpd):
+    interrupt_download(chapter, httpd)
+
+    # Image has changed on server: it's downloaded again from start
+    httpd.content = create_content()
+    httpd.etag = '"2"'
+
+    path = chapter.get_page(0)
+
+    assert 'Range' in httpd.requests[-1]
+    with open(path, 'rb') as fp:
+        assert fp.read() == httpd.content
+    assert chapter.get_page_journal(0)['download_checksum'] == hashlib.sha1(httpd.content).hexdigest()
+
+
+def test_resume_corrupt_partial_image(chapter, httpd):
+    interrupt_download(chapter, httpd)
+
+    with open(os.path.join(chapter.path, '.0.part'), 'r+b') as fp:
+        fp.seek(1000)
+        fp.write(b'corrupt')
+
+    path = chapter.get_page(0)
+
+    # Partial image is not trusted: no range is requested
+    assert 'Range' not in httpd.requests[-1]
+    with open(path, 'rb') as fp:
+        assert fp.read() == httpd.content
+
+
+def test_downloaded_status_from_journal(chapter, httpd):
+    interrupt_download(chapter, httpd, index=NB_PAGES - 1)
+
+    for index in range(NB_PAGES - 1):
+        assert chapter.get_page(index) is not None
+
+    # As many files as pages, but one is partial
+    assert len(os.listdir(chapter.path)) == NB_PAGES
+    assert not database.Chapter.get(chapter.id).downloaded
+
+    assert chapter.get_page(NB_PAGES - 1) is not None
+    assert database.Chapter.get(chapter.id).downloaded
@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+
+SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import komikku.servers
+komikku.servers.get_cache_dir = lambda: {cache_dir!r}
+servers = komikku.servers.get_servers_list()
+elapsed = time.perf_counter() - start
+
+print(json.dumps(dict(
+    elapsed=elapsed,
+    nb_servers=len(servers),
+    modules=[name for name in ('bs4', 'cloudscraper', 'dateparser', 'lxml', 'pure_protobuf', 'unidecode') if name in sys.modules],
+)))
+"""
+
+
+def list_servers(cache_dir):
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(cache_dir=str(cache_dir))], check=True, capture_output=True, text=True
+    ).stdout
+
+    return json.loads(output.strip().split('\n')[-1])
+
+
+def test_servers_list_startup_time(tmp_path):
+    # First run: manifest is generated (all servers modules are imported)
+    before = list_servers(tmp_path)
+    # Next runs: manifest is read
+    after = min((list_servers(tmp_path) for _i in range(3)), key=lambda result: result['elapsed'])
+
+    print('Servers list: {0:.3f}s (all modules imported: {1}) vs {2:.3f}s (manifest: {3})'.format(
+        before['elapsed'], ', '.join(before['modules']), after['elapsed'], ', '.join(after['modules']) or 'no heavy module imported'))
+
+    assert after['nb_servers'] == before['nb_servers'] > 0
+    assert after['modules'] == []
@@ -0,0 +1,200 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import io
+import os
+import threading
+import time
+import tracemalloc
+
+from PIL import Image
+import pytest
+import requests
+
+from komikku.models import database
+from komikku.servers import ImagePipeline
+from komikku.servers.mangadex import Mangadex
+from komikku.servers.webtoon import Webtoon
+
+IMAGE_SIZE = 20 * 1024 * 1024
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/broken.jpg':
+            # Connection is lost in the middle of the image
+            self.send_response(200)
+            self.send_header('Content-Length', str(IMAGE_SIZE))
+            self.send_header('Content-Type', 'image/jpeg')
+            self.end_headers()
+            self.wfile.write(b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' + os.urandom(IMAGE_SIZE // 2))
+            return
+
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(server, tmp_path):
+    root = tmp_path / 'www'
+    root.mkdir()
+
+    # Big image: a JPEG header followed by random data is enough for mime type sniffing
+    with open(root / 'strip.jpg', 'wb') as fp:
+        fp.write(b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+        fp.write(os.urandom(IMAGE_SIZE))
+
+    with open(root / 'page.html', 'w') as fp:
+        fp.write('<!DOCTYPE html><html><body>Not found</body></html>' * 10)
+
+    image = Image.frombytes('RGB', (400, 600), os.urandom(400 * 600 * 3))
+    image.save(root / 'page.webp', 'WEBP')
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    server.base_url = 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+    server.session = requests.Session()
+
+    yield server
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(params=[Mangadex, Webtoon])
+def plugin(request, server, monkeypatch):
+    """Real server plugin, pages images are served locally"""
+    # No session loading nor login
+    monkeypatch.setattr(request.param, 'init', lambda self, *args: None, raising=False)
+
+    plugin = request.param()
+    plugin.session = requests.Session()
+
+    return plugin
+
+
+@pytest.fixture
+def chapter(db, plugin, server):
+    with database.db_writer() as db_conn:
+        manga_id = database.insert_row(db_conn, 'mangas', dict(slug='manga', server_id=plugin.id, name='Manga'))
+        chapter_id = database.insert_row(db_conn, 'chapters', dict(
+            manga_id=manga_id, slug='1', title='Chapter 1', rank=0, downloaded=0, recent=0, read=0))
+        database.insert_pages(db_conn, chapter_id, [dict(slug='strip', image=server.base_url + '/strip.jpg')])
+
+    return database.Chapter.get(chapter_id, database.Manga.get(manga_id, server=plugin))
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    duration = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return duration, peak
+
+
+def test_streaming_memory(server, tmp_path):
+    url = server.base_url + '/strip.jpg'
+    path = str(tmp_path / 'strip.jpg')
+
+    def buffered():
+        r = server.session_get(url)
+        with open(path, 'wb') as fp:
+            fp.write(r.content)
+
+    def streamed():
+        assert server.save_image_response(server.session_get(url, stream=True), path) == 'image/jpeg'
+
+    before, before_peak = measure(buffered)
+    after, after_peak = measure(streamed)
+
+    print('{0} MB image: {1:.0f}ms, {2:.1f} MB peak (buffered) vs {3:.0f}ms, {4:.1f} MB peak (streamed)'.format(
+        IMAGE_SIZE // 1024 // 1024, before * 1000, before_peak / 1024 / 1024, after * 1000, after_peak / 1024 / 1024))
+
+    assert after_peak < before_peak / 10
+    assert os.path.getsize(path) == IMAGE_SIZE + 20
+    # No temporary file is left
+    assert sorted(os.listdir(tmp_path)) == ['strip.jpg', 'www']
+
+
+def test_streaming_not_an_image(server, tmp_path):
+    path = str(tmp_path / 'page.jpg')
+
+    assert server.save_image_response(server.session_get(server.base_url + '/page.html', stream=True), path) is None
+    assert not os.path.exists(path)
+    assert sorted(os.listdir(tmp_path)) == ['www']
+
+
+def test_streaming_webp(server, tmp_path):
+    path = str(tmp_path / 'page.jpg')
+
+    assert server.save_image_response(server.session_get(server.base_url + '/page.webp', stream=True), path) == 'image/webp'
+
+    # Streamed image is processed from file
+    pipeline = ImagePipeline()
+    pipeline.add_stage(lambda image: image.convert('RGB'), format='jpeg')
+    pipeline.process(path, path)
+
+    with open(path, 'rb') as fp:
+        image = Image.open(io.BytesIO(fp.read()))
+    assert image.format == 'JPEG'
+    assert image.size == (400, 600)
+    assert sorted(os.listdir(tmp_path)) == ['page.jpg', 'www']
+
+
+def test_plugin_streams_page_image(server, plugin):
+    data = plugin.get_manga_chapter_page_image('manga', 'Manga', '1', dict(image=server.base_url + '/page.webp'))
+
+    # Body is left to be streamed to disk
+    with data['response'] as r:
+        assert r.raw is not None and not r._content_consumed
+    assert data['name'] == 'page.webp'
+
+
+def test_plugin_closes_failed_page_image_response(server, plugin, monkeypatch):
+    responses = []
+    session_get = plugin.session.get
+
+    def get(*args, **kwargs):
+        r = session_get(*args, **kwargs)
+        responses.append(r)
+        return r
+
+    monkeypatch.setattr(plugin.session, 'get', get)
+
+    assert plugin.get_manga_chapter_page_image('manga', 'Manga', '1', dict(image=server.base_url + '/missing.jpg')) is None
+
+    # Connection is released to the pool
+    assert len(responses) == 1 and responses[0].status_code == 404
+    assert responses[0].raw.closed
+
+
+def test_plugin_get_page(chapter):
+    def download():
+        assert chapter.get_page(0) == os.path.join(chapter.path, 'strip.jpg')
+
+    duration, peak = measure(download)
+    print('{0} MB image downloaded by {1}: {2:.0f}ms, {3:.1f} MB peak'.format(
+        IMAGE_SIZE // 1024 // 1024, chapter.manga.server.name, duration * 1000, peak / 1024 / 1024))
+
+    assert peak < IMAGE_SIZE / 10
+    assert os.path.getsize(chapter.get_page_path(0)) == IMAGE_SIZE + 20
+    assert os.listdir(chapter.path) == ['strip.jpg']
+
+
+def test_plugin_get_page_interrupted(chapter, server):
+    chapter.update_page(0, dict(image=server.base_url + '/broken.jpg'))
+
+    with pytest.raises(requests.exceptions.RequestException):
+        chapter.get_page(0)
+
+    # Page image is only written in a temporary file, never truncated
+    assert chapter.get_page_path(0) is None
+    assert not os.path.exists(os.path.join(chapter.path, 'broken.jpg'))
+    assert os.listdir(chapter.path) == ['.0.part']
@@ -0,0 +1,95 @@
+import io
+import os
+import time
+
+from PIL import Image
+import pytest
+
+from komikku.servers import unscramble_image
+
+NB_ROUNDS = 3
+
+
+def unscramble_image_reference(image):
+    """Previous implementation: two passes of columns then rows crops/pastes, via an intermediate image"""
+    if not isinstance(image, Image.Image):
+        image = Image.open(io.BytesIO(image))
+
+    temp = Image.new('RGB', image.size)
+    output_image = Image.new('RGB', image.size)
+
+    for x in range(0, image.width, 200):
+        col1 = image.crop((x, 0, x + 100, image.height))
+
+        if x + 200 <= image.width:
+            col2 = image.crop((x + 100, 0, x + 200, image.height))
+            temp.paste(col1, (x + 100, 0))
+            temp.paste(col2, (x, 0))
+        else:
+            col2 = image.crop((x + 100, 0, image.width, image.height))
+            temp.paste(col1, (x, 0))
+            temp.paste(col2, (x + 100, 0))
+
+    for y in range(0, temp.height, 200):
+        row1 = temp.crop((0, y, temp.width, y + 100))
+
+        if y + 200 <= temp.height:
+            row2 = temp.crop((0, y + 100, temp.width, y + 200))
+            output_image.paste(row1, (0, y + 100))
+            output_image.paste(row2, (0, y))
+        else:
+            row2 = temp.crop((0, y + 100, temp.width, temp.height))
+            output_image.paste(row1, (0, y))
+            output_image.paste(row2, (0, y + 100))
+
+    return output_image
+
+
+def create_image(size, mode='RGB'):
+    return Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)).convert(mode)
+
+
+def measure(func, image):
+    start = time.perf_counter()
+    for _i in range(NB_ROUNDS):
+        func(image)
+
+    return (time.perf_counter() - start) / NB_ROUNDS
+
+
+@pytest.mark.parametrize('size', [(1200, 1800), (900, 15000)])
+def test_unscramble_speed(size):
+    image = create_image(size)
+
+    before = measure(unscramble_image_reference, image)
+    after = measure(unscramble_image, image)
+
+    print('{0}x{1}: {2:.1f}ms (columns then rows) vs {3:.1f}ms (blocks)'.format(*size, before * 1000, after * 1000))
+
+
+@pytest.mark.parametrize('size', [(1200, 1800), (900, 15000), (1000, 1000), (1100, 1300), (150, 120)])
+@pytest.mark.parametrize('mode', ['RGB', 'L', 'RGBA'])
+def test_unscramble_is_pixel_exact(size, mode):
+    image = create_image(size, mode)
+
+    output_image = unscramble_image(image)
+
+    assert output_image.mode == 'RGB'
+    assert output_image.size == image.size
+    assert output_image.tobytes() == unscramble_image_reference(image).tobytes()
+
+
+def test_unscramble_incomplete_blocks():
+    # Previous implementation failed when trailing block was smaller than a column or a row
+    image = create_image((80, 60))
+
+    assert unscramble_image(image).tobytes() == image.tobytes()
+
+
+def test_unscramble_bytes():
+    image = create_image((1200, 1800))
+    with io.BytesIO() as fp:
+        image.save(fp, 'PNG')
+        buffer = fp.getvalue()
+
+    assert unscramble_image(buffer).tobytes() == unscramble_image_reference(image).tobytes()
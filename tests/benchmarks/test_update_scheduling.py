@@ -0,0 +1,54 @@
+import datetime
+
+from komikku.models import database
+from komikku.updater import get_library_mangas_ids_to_update
+from komikku.updater import is_update_expected
+
+TODAY = datetime.date.today()
+
+
+def get_releases_dates(interval_days, nb=10, last_release_days=0):
+    return [TODAY - datetime.timedelta(days=last_release_days + i * interval_days) for i in range(nb)]
+
+
+def test_update_expected():
+    now = datetime.datetime.now()
+    yesterday = now - datetime.timedelta(days=1)
+
+    # Never checked or unknown cadence: always checked
+    assert is_update_expected('ongoing', get_releases_dates(7), None, now)
+    assert is_update_expected('ongoing', [], yesterday, now)
+    # Weekly series: not expected 2 days after last release, expected 6 days after (if not checked since 5 days)
+    assert not is_update_expected('ongoing', get_releases_dates(7, last_release_days=2), yesterday, now)
+    assert is_update_expected('ongoing', get_releases_dates(7, last_release_days=6), now - datetime.timedelta(days=3), now)
+    # then checked every 7 / 4 days until a new release is found
+    assert not is_update_expected('ongoing', get_releases_dates(7, last_release_days=8), yesterday, now)
+    assert is_update_expected('ongoing', get_releases_dates(7, last_release_days=8), now - datetime.timedelta(days=2), now)
+    # Monthly series in hiatus for a year, checked yesterday
+    assert not is_update_expected('ongoing', get_releases_dates(30, last_release_days=365), yesterday, now)
+    # Completed series: checked every 2 weeks
+    assert not is_update_expected('complete', get_releases_dates(1), yesterday, now)
+    assert is_update_expected('complete', get_releases_dates(1), now - datetime.timedelta(days=15), now)
+
+
+def test_library_scheduling(db):
+    now = datetime.datetime.now()
+
+    # A 600 series library checked yesterday: a few daily series, weekly and monthly series, completed series
+    kinds = [('ongoing', 1)] * 20 + [('ongoing', 7)] * 280 + [('ongoing', 30)] * 200 + [('complete', 7)] * 100
+    with database.db_writer() as db_conn:
+        for index, (status, interval) in enumerate(kinds):
+            id = database.insert_row(db_conn, 'mangas', dict(
+                slug=str(index), server_id='test', name=str(index), status=status, last_check=now - datetime.timedelta(days=1),
+            ))
+            database.insert_rows(db_conn, 'chapters', [
+                dict(manga_id=id, slug=str(i), title=str(i), date=date, rank=i, downloaded=0, recent=0, read=0)
+                for i, date in enumerate(get_releases_dates(interval, last_release_days=index % interval))
+            ])
+
+    assert len(get_library_mangas_ids_to_update(force=True)) == 600
+
+    ids = get_library_mangas_ids_to_update()
+    print('Scheduled mangas: {0}/600'.format(len(ids)))
+    # Daily series are always due, completed series never, weekly and monthly ones only when a release is expected
+    assert 20 < len(ids) < 300
@@ -0,0 +1,84 @@
+import random
+import time
+
+from komikku.reader.pager.webtoon import WebtoonPager
+
+NB_PAGES = 1000
+NB_SCROLL_EVENTS = 10000
+
+
+class FakeSize:
+    def __init__(self, height):
+        self.height = height
+
+
+class FakePage:
+    def __init__(self, height):
+        self.height = height
+        self.size_requests = 0
+
+    def get_preferred_size(self):
+        self.size_requests += 1
+        return FakeSize(0), FakeSize(self.height)
+
+
+class FakePager(WebtoonPager):
+    def __init__(self, pages):
+        self.children = pages
+
+    def get_children(self):
+        return list(self.children)
+
+
+def get_position_linear(pages, scroll_value):
+    offset = 0
+    position = None
+    for index, page in enumerate(pages):
+        if scroll_value >= offset:
+            position = index
+        offset += page.height
+
+    return position
+
+
+def test_positions_and_offsets():
+    random.seed(1)
+    pages = [FakePage(random.randint(500, 20000)) for _i in range(NB_PAGES)]
+    pager = FakePager(pages)
+    total_height = sum(page.height for page in pages)
+
+    for scroll_value in [-1, 0] + [random.randint(0, total_height) for _i in range(500)]:
+        assert pager.get_position(scroll_value) == get_position_linear(pages, scroll_value)
+
+    assert pager.get_page_offset(pages[3]) == sum(page.height for page in pages[:3])
+
+    # Height of a page changes (image rendered): following offsets are shifted without querying pages sizes again
+    requests = sum(page.size_requests for page in pages)
+    pages[10].height += 1234
+    pager.on_page_height_changed(pages[10], None)
+    assert sum(page.size_requests for page in pages) == requests + 1
+    assert pager.get_page_offset(pages[11]) == sum(page.height for page in pages[:11])
+    assert pager.get_page_offset(pages[10]) == sum(page.height for page in pages[:10])
+
+    # A page is added: index is rebuilt
+    pages.insert(0, FakePage(700))
+    pager.invalidate_pages_offsets()
+    assert pager.get_page_offset(pages[1]) == 700
+
+
+def test_scroll_events_cost():
+    pages = [FakePage(15000) for _i in range(NB_PAGES)]
+    pager = FakePager(pages)
+    total_height = sum(page.height for page in pages)
+
+    start = time.perf_counter()
+    for i in range(NB_SCROLL_EVENTS):
+        scroll_value = i * total_height // NB_SCROLL_EVENTS
+        position = pager.get_position(scroll_value)
+        pager.get_page_offset(pages[position])
+    elapsed = time.perf_counter() - start
+
+    print('{0} scroll events with {1} pages: {2:.1f}µs per event'.format(NB_SCROLL_EVENTS, NB_PAGES, elapsed / NB_SCROLL_EVENTS * 1e6))
+
+    # Pages sizes are queried once
+    assert all(page.size_requests == 1 for page in pages)